@@ -46,6 +46,8 @@
         'data/popcorn_pdb_pending_cron.xml',
         'data/popcorn_punctuality_badge_cron.xml',
         'data/popcorn_forum_moderation_cron.xml',
+        'data/popcorn_notification_outbox_cron.xml',
+        'data/popcorn_payment_processing_cron.xml',
         'data/popcorn_first_timer_coupon_reminder_data.xml',
         'views/popcorn_event_tag_category_views.xml',
         'views/popcorn_activity_sport_views.xml',
@@ -12,3 +12,4 @@ from . import popcorn_discount_controller
 from . import popcorn_profile_controller
 from . import popcorn_product_controller
 from . import popcorn_forum_controller
+from . import popcorn_tracing_controller
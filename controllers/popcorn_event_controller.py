@@ -2,18 +2,21 @@
 
 from odoo import http, fields, _
 from odoo.http import request
-from odoo.exceptions import ValidationError
+from odoo.exceptions import UserError, ValidationError
 from odoo.osv import expression
 import json
 import werkzeug
 import logging
 from datetime import timedelta
+from typing import NamedTuple
 from werkzeug.utils import redirect
 from werkzeug.urls import url_quote
-from odoo.addons.portal.controllers.portal import CustomerPortal
+from odoo.addons.portal.controllers.portal import CustomerPortal, pager as portal_pager
 
 _logger = logging.getLogger(__name__)
 
+PAST_CLUBS_PER_PAGE = 20
+
 
 class PopcornEventController(http.Controller):
     """Controller for Popcorn Club membership-gated event registration"""
@@ -219,13 +222,10 @@ class PopcornEventController(http.Controller):
             # First-timer grace period banner
             _partner = request.env.user.partner_id
             first_timer_pending_date = False
-            if _partner.is_first_timer and _partner.pdb_pending_date:
-                _today = fields.Date.today()
-                if _partner.pdb_pending_date >= _today:
-                    first_timer_pending_date = _partner.pdb_pending_date
-                else:
-                    # Grace period already expired; apply PDB now in case cron hasn't run
-                    _partner.sudo().write({'pdb': True, 'is_first_timer': False})
+            # An expired grace period is left to the pending PDB cron: this page only reads
+            if (_partner.is_first_timer and _partner.pdb_pending_date
+                    and _partner.pdb_pending_date >= fields.Date.today()):
+                first_timer_pending_date = _partner.pdb_pending_date
 
             # Find the highest-priority active public discount for the banner
             _today = fields.Date.today()
@@ -293,28 +293,70 @@ class PopcornEventController(http.Controller):
         partner = request.env.user.sudo().partner_id
         if not partner:
             return False, None, _('User profile not found')
-        
-        # Check if user has any active memberships or pending memberships with first_attendance policy
-        # Only include memberships that are still valid on the event date
+
+        verdict = self._resolve_membership_eligibility(event, partner)
+        return verdict['has_access'], verdict['redirect_url'], verdict['error_message']
+
+    def _resolve_membership_eligibility(self, event, partner):
+        """Work out everything a booking needs to know about the partner's memberships.
+
+        Loads the partner's candidate memberships once, computes their quota
+        state in one batch, and looks up overlapping bookings in one query.
+        Returns a dict shared by the access check, the membership picker and
+        the conflict check:
+            has_access, redirect_url, error_message: access verdict
+            best_membership: membership to book with (empty recordset if none)
+            no_membership_reason: why best_membership is empty
+            conflict_event: another booked event overlapping this one
+        The verdict is memoized for the rest of the transaction.
+        """
+        memo = request.env.cr.cache.setdefault('popcorn_eligibility', {})
+        key = (event.id, partner.id)
+        if key in memo:
+            return memo[key]
+
+        Membership = request.env['popcorn.membership'].sudo()
         event_date = event.date_begin.date() if event.date_begin else fields.Date.today()
-        active_memberships = request.env['popcorn.membership'].sudo().search([
-            ('partner_id', '=', partner.id),
-            ('state', 'in', ['active', 'frozen']),
-            '|',
-            ('effective_end_date', '=', False),
-            ('effective_end_date', '>=', event_date),
-        ])
-        
-        # Also include pending memberships with first_attendance activation policy
-        pending_first_attendance = request.env['popcorn.membership'].sudo().search([
+        event_club_type = self._get_event_club_type(event)
+        memberships = Membership.search([
             ('partner_id', '=', partner.id),
-            ('state', '=', 'pending'),
-            ('membership_plan_id.activation_policy', '=', 'first_attendance')
+            ('state', 'in', ['active', 'frozen', 'pending'])
         ])
-        
-        # Combine both sets
-        all_usable_memberships = active_memberships | pending_first_attendance
+        # Quota state for every candidate in one grouped query
+        memberships.mapped('remaining_offline')
+
+        # Only memberships that are still valid on the event date
+        live = memberships.filtered(lambda m: (
+            m.state in ('active', 'frozen')
+            and (not m.effective_end_date or m.effective_end_date >= event_date)
+        ))
+        pending = memberships.filtered(lambda m: m.state == 'pending')
+
+        verdict = {
+            'club_type': event_club_type,
+            'best_membership': Membership,
+            'no_membership_reason': None,
+            'conflict_event': request.env['event.event'],
+        }
+        verdict['has_access'], verdict['redirect_url'], verdict['error_message'] = self._get_access_verdict(
+            event, event_club_type, event_date,
+            live | pending.filtered(lambda m: m.membership_plan_id.activation_policy == 'first_attendance'),
+        )
+        verdict['best_membership'] = self._pick_best_membership(
+            event, event_club_type or 'regular_offline', live,
+            pending.filtered(lambda m: m.membership_plan_id.activation_policy in ('first_attendance', 'immediate')),
+        ) or Membership
+        if not verdict['best_membership']:
+            verdict['no_membership_reason'] = self._get_no_membership_reason(
+                event_club_type or 'regular_offline', memberships
+            )
+        verdict['conflict_event'] = self._get_conflicting_event(event, partner)
+
+        memo[key] = verdict
+        return verdict
 
+    def _get_access_verdict(self, event, event_club_type, event_date, all_usable_memberships):
+        """Access part of the eligibility verdict: (has_access, redirect_url, error_message)"""
         if not all_usable_memberships:
             return False, '/memberships', _('Check out the membership plans for big savings and awesome benefits!')
 
@@ -333,28 +375,105 @@ class PopcornEventController(http.Controller):
             msg = _('Your membership is frozen until %s. You cannot register for events during this period.') % freeze_end if freeze_end else _('Your membership is currently frozen.')
             return False, None, msg
 
-        all_usable_memberships = non_frozen_memberships
-        
         # Check if any membership allows this event type
-        event_club_type = self._get_event_club_type(event)
         if not event_club_type:
             return True, None, None  # No club type restriction, allow access
         
         # For Social Experience events, check if any membership plan is in second_price or third_price list
         # If yes, allow access (they'll pay instead of using quota)
         if event_club_type == 'social_experience':
-            for membership in all_usable_memberships:
+            for membership in non_frozen_memberships:
                 if membership.membership_plan_id in event.membership_plans_second_price_ids:
                     return True, None, None  # Allow access - will redirect to payment
                 if membership.membership_plan_id in event.membership_plans_third_price_ids:
                     return True, None, None  # Allow access - will redirect to payment
 
         # Check if any membership allows this club type
-        for membership in all_usable_memberships:
+        for membership in non_frozen_memberships:
             if self._can_membership_attend_event(membership, event_club_type):
                 return True, None, None
         
         return False, '/memberships', _('Your membership does not allow %s clubs') % event_club_type.replace("_", " ").title()
+
+    def _pick_best_membership(self, event, event_club_type, active_memberships, pending_auto):
+        """Picker part of the eligibility verdict.
+
+        Always prefer currently active/frozen memberships. Only if none are
+        compatible do we fall back to pending memberships that activate on use.
+        """
+        def is_compatible(membership):
+            # For Social Experience events, if membership plan is in second_price or third_price list,
+            # skip quota check - will redirect to payment
+            if event_club_type == 'social_experience' and (
+                membership.membership_plan_id in event.membership_plans_second_price_ids
+                or membership.membership_plan_id in event.membership_plans_third_price_ids
+            ):
+                return True
+            return self._can_membership_attend_event(membership, event_club_type)
+
+        compatible_memberships = [m for m in active_memberships if is_compatible(m)]
+        if not compatible_memberships:
+            compatible_memberships = [m for m in pending_auto if is_compatible(m)]
+        if not compatible_memberships:
+            return False
+
+        # Sort by priority: unlimited > points > bucket_counts
+        # For same type, prefer longer duration
+        priority_map = {'unlimited': 3, 'points': 2, 'bucket_counts': 1}
+        compatible_memberships.sort(key=lambda m: (
+            priority_map.get(m.plan_quota_mode, 0),
+            m.plan_duration_days or 0
+        ), reverse=True)
+        return compatible_memberships[0]
+
+    def _get_no_membership_reason(self, event_club_type, all_memberships):
+        """Explain why no membership can be used for this club"""
+        if not all_memberships:
+            return _('No suitable membership found for this club')
+
+        # First check quota (points/sessions) for all memberships
+        for membership in all_memberships:
+            if membership.plan_quota_mode == 'points':
+                points_needed = membership.membership_plan_id._get_points_cost(event_club_type)
+                if membership.points_remaining < points_needed:
+                    return _('Insufficient points. You need %s points but have %s remaining') % (points_needed, membership.points_remaining)
+            elif membership.plan_quota_mode == 'bucket_counts':
+                if event_club_type == 'regular_offline' and membership.remaining_offline < 1:
+                    return _('No offline sessions remaining. You have %s offline sessions left') % membership.remaining_offline
+                elif event_club_type == 'regular_online' and membership.remaining_online < 1:
+                    return _('No online sessions remaining. You have %s online sessions left') % membership.remaining_online
+                elif event_club_type == 'spclub' and membership.remaining_sp < 1:
+                    return _('No special club sessions remaining. You have %s special club sessions left') % membership.remaining_sp
+                elif event_club_type == 'social_experience':
+                    # Bucket-based memberships don't support social_experience events
+                    return _('Social Experience events are not supported with bucket-based memberships')
+
+        # If quota is sufficient, then check club type permissions
+        permission_field = {
+            'regular_offline': 'plan_allowed_regular_offline',
+            'regular_online': 'plan_allowed_regular_online',
+            'spclub': 'plan_allowed_spclub',
+        }.get(event_club_type)
+        if not permission_field or not any(all_memberships.mapped(permission_field)):
+            return _('Your membership does not allow %s clubs') % event_club_type.replace("_", " ").title()
+        # All checks passed but something else is wrong
+        return _('Insufficient quota for this club')
+
+    def _get_conflicting_event(self, event, partner):
+        """Another event the partner is booked or waitlisted on that overlaps this one, in one query"""
+        if not event.date_begin or not event.date_end:
+            return request.env['event.event']
+        conflicting = request.env['event.registration'].search([
+            ('partner_id', '=', partner.id),
+            ('event_id', '!=', event.id),  # Exclude current event
+            '|',
+            ('state', 'in', ['open', 'done']),  # Active registrations
+            ('is_on_waitlist', '=', True),  # Or waitlist registrations
+            ('event_id.website_published', '=', True),
+            ('event_id.date_begin', '<', event.date_end),  # Other event starts before this one ends
+            ('event_id.date_end', '>', event.date_begin),  # Other event ends after this one starts
+        ], limit=1)
+        return conflicting.event_id
     
     def _get_event_club_type(self, event):
         """Determine the club type for an event.
@@ -381,6 +500,8 @@ class PopcornEventController(http.Controller):
             membership.membership_plan_id.activation_policy in ['first_attendance', 'immediate']
         )
 
+        plan = membership.membership_plan_id
+
         # First check if membership has sufficient quota
         if membership.plan_quota_mode == 'unlimited':
             # For unlimited, only check club type permissions
@@ -393,126 +514,24 @@ class PopcornEventController(http.Controller):
             elif club_type == 'spclub' and membership.remaining_sp < 1:
                 return False
         elif membership.plan_quota_mode == 'points' and not is_pending_auto_eligible:
-            # Calculate points needed for this club type
-            plan = membership.membership_plan_id
-            if club_type == 'regular_offline':
-                points_needed = plan.points_per_offline
-            elif club_type == 'regular_online':
-                points_needed = plan.points_per_online
-            elif club_type == 'spclub':
-                points_needed = plan.points_per_sp
-            elif club_type == 'social_experience':
-                points_needed = plan.points_per_social_experience
-            else:
-                points_needed = 0
-
-            if membership.points_remaining < points_needed:
+            if membership.points_remaining < plan._get_points_cost(club_type):
                 return False
         
         # If quota check passes, then check club type permissions
-        if club_type == 'regular_offline' and not membership.plan_allowed_regular_offline:
-            return False
-        elif club_type == 'regular_online' and not membership.plan_allowed_regular_online:
-            return False
-        elif club_type == 'spclub' and not membership.plan_allowed_spclub:
-            return False
         # Note: social_experience doesn't have a permission check - all memberships can attend
-        
-        return True
+        return plan._is_club_type_allowed(club_type)
     
     def _get_best_membership_for_event(self, partner, event):
         """Find the best available membership for a specific event"""
         if not partner or not event:
             return False
-        
-        event_club_type = self._get_event_club_type(event)
-        if not event_club_type:
-            # If no specific club type is determined, default to regular_offline
-            event_club_type = 'regular_offline'
-        
-        # Strategy: always prefer currently active/frozen memberships. Only if none are
-        # compatible do we fall back to pending memberships with first_attendance policy.
-        # Only include memberships that are still valid on the event date.
-        event_date = event.date_begin.date() if event.date_begin else fields.Date.today()
-        active_memberships = request.env['popcorn.membership'].sudo().search([
-            ('partner_id', '=', partner.id),
-            ('state', 'in', ['active', 'frozen']),
-            '|',
-            ('effective_end_date', '=', False),
-            ('effective_end_date', '>=', event_date),
-        ])
-
-        # Filter active/frozen memberships first
-        compatible_memberships = []
-        for membership in active_memberships:
-            # For Social Experience events, if membership plan is in second_price or third_price list, skip quota check
-            if event_club_type == 'social_experience' and (
-                membership.membership_plan_id in event.membership_plans_second_price_ids
-                or membership.membership_plan_id in event.membership_plans_third_price_ids
-            ):
-                # Include membership without quota check - will redirect to payment
-                compatible_memberships.append(membership)
-            elif self._can_membership_attend_event(membership, event_club_type):
-                compatible_memberships.append(membership)
-
-        # If no compatible active/frozen membership exists, consider pending memberships
-        if not compatible_memberships:
-            pending_auto = request.env['popcorn.membership'].sudo().search([
-                ('partner_id', '=', partner.id),
-                ('state', '=', 'pending'),
-                ('membership_plan_id.activation_policy', 'in', ['first_attendance', 'immediate'])
-            ])
-
-            for membership in pending_auto:
-                # For Social Experience events, if membership plan is in second_price or third_price list, skip quota check
-                if event_club_type == 'social_experience' and (
-                    membership.membership_plan_id in event.membership_plans_second_price_ids
-                    or membership.membership_plan_id in event.membership_plans_third_price_ids
-                ):
-                    # Include membership without quota check - will redirect to payment
-                    compatible_memberships.append(membership)
-                elif self._can_membership_attend_event(membership, event_club_type):
-                    compatible_memberships.append(membership)
-        
-        if not compatible_memberships:
-            return False
-        
-        # Sort by priority: unlimited > points > bucket_counts
-        # For same type, prefer longer duration
-        def get_quota_mode_priority(quota_mode):
-            priority_map = {'unlimited': 3, 'points': 2, 'bucket_counts': 1}
-            return priority_map.get(quota_mode, 0)
-        
-        compatible_memberships.sort(key=lambda m: (
-            get_quota_mode_priority(m.plan_quota_mode),
-            m.plan_duration_days or 0
-        ), reverse=True)
-        
-        return compatible_memberships[0] if compatible_memberships else False
+        return self._resolve_membership_eligibility(event, partner)['best_membership'] or False
     
     def _is_event_in_freeze_period(self, event, partner):
         """Check if an event falls within any of the user's freeze periods"""
         if not partner or not event:
             return False, None
-        
-        # Get all frozen memberships for this partner
-        frozen_memberships = request.env['popcorn.membership'].sudo().search([
-            ('partner_id', '=', partner.id),
-            ('freeze_active', '=', True)
-        ])
-        
-        if not frozen_memberships:
-            return False, None
-        
-        event_date = event.date_begin.date()
-        
-        # Check if event date falls within any freeze period
-        for membership in frozen_memberships:
-            if membership.freeze_start and membership.freeze_end:
-                if membership.freeze_start <= event_date <= membership.freeze_end:
-                    return True, membership
-        
-        return False, None
+        return event.is_in_freeze_period(partner)
     
     def _log_contract_signature_status(self, membership, event):
         """Log contract signature status when registering for an event with membership
@@ -557,17 +576,7 @@ class PopcornEventController(http.Controller):
             elif club_type == 'social_experience':
                 return _("No membership quota consumed (bucket plans don't support Social Experience events)")
         elif membership.plan_quota_mode == 'points':
-            plan = membership.membership_plan_id
-            if club_type == 'regular_offline':
-                points_needed = plan.points_per_offline
-            elif club_type == 'regular_online':
-                points_needed = plan.points_per_online
-            elif club_type == 'spclub':
-                points_needed = plan.points_per_sp
-            elif club_type == 'social_experience':
-                points_needed = plan.points_per_social_experience
-            else:
-                points_needed = 0
+            points_needed = membership.membership_plan_id._get_points_cost(club_type)
             return _("%s points consumed (remaining: %s)") % (points_needed, membership.points_remaining)
         return _("Unknown consumption type")
     
@@ -719,14 +728,16 @@ class PopcornEventController(http.Controller):
         
         # Get the partner for the current user
         partner = request.env.user.sudo().partner_id
+
+        # Same verdict the access check above was answered from: memberships,
+        # quota state and overlapping bookings are only loaded once
+        verdict = self._resolve_membership_eligibility(event, partner)
         
         # Determine event club type
-        event_club_type = self._get_event_club_type(event)
-        if not event_club_type:
-            event_club_type = 'regular_offline'  # Default fallback
+        event_club_type = verdict['club_type'] or 'regular_offline'  # Default fallback
         
         # Find the best membership for this event
-        best_membership = self._get_best_membership_for_event(partner, event)
+        best_membership = verdict['best_membership']
         
         # Check if this is a Social Experience event and user's membership should pay second_price or third_price
         if event_club_type == 'social_experience' and best_membership:
@@ -736,131 +747,18 @@ class PopcornEventController(http.Controller):
                 return request.redirect(f'/popcorn/event/{event.id}/checkout?second_price={event.third_price}')
         
         if not best_membership:
-            # Check if user has memberships but they don't have sufficient quota
-            event_club_type = self._get_event_club_type(event)
-            if not event_club_type:
-                event_club_type = 'regular_offline'  # Default fallback
-            
-            # Get all user's memberships
-            all_memberships = request.env['popcorn.membership'].sudo().search([
-                ('partner_id', '=', partner.id),
-                ('state', 'in', ['active', 'frozen', 'pending'])
-            ])
-            
-            # Debug: Log what memberships we found
-            print(f"Found {len(all_memberships)} memberships for partner {partner.id}")
-            for membership in all_memberships:
-                print(f"Membership {membership.id}: {membership.membership_plan_id.name}, state={membership.state}")
-            
-            if all_memberships:
-                # First check quota (points/sessions) for all memberships
-                quota_issue_found = False
-                _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Checking quota for event_club_type: {event_club_type}")
-                for membership in all_memberships:
-                    _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Membership ID: {membership.id}, Plan: {membership.membership_plan_id.name}, Quota Mode: {membership.plan_quota_mode}, Points Remaining: {membership.points_remaining}")
-                    if membership.plan_quota_mode == 'points':
-                        plan = membership.membership_plan_id
-                        if event_club_type == 'regular_offline':
-                            points_needed = plan.points_per_offline
-                        elif event_club_type == 'regular_online':
-                            points_needed = plan.points_per_online
-                        elif event_club_type == 'spclub':
-                            points_needed = plan.points_per_sp
-                        elif event_club_type == 'social_experience':
-                            points_needed = plan.points_per_social_experience
-                            _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Social Experience detected! Plan points_per_social_experience: {plan.points_per_social_experience}, Points needed: {points_needed}")
-                        else:
-                            points_needed = 0
-                        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Points needed: {points_needed}, Points remaining: {membership.points_remaining}")
-                        if membership.points_remaining < points_needed:
-                            error_message = _('Insufficient points. You need %s points but have %s remaining') % (points_needed, membership.points_remaining)
-                            quota_issue_found = True
-                            break
-                    elif membership.plan_quota_mode == 'bucket_counts':
-                        if event_club_type == 'regular_offline' and membership.remaining_offline < 1:
-                            error_message = _('No offline sessions remaining. You have %s offline sessions left') % membership.remaining_offline
-                            quota_issue_found = True
-                            break
-                        elif event_club_type == 'regular_online' and membership.remaining_online < 1:
-                            error_message = _('No online sessions remaining. You have %s online sessions left') % membership.remaining_online
-                            quota_issue_found = True
-                            break
-                        elif event_club_type == 'spclub' and membership.remaining_sp < 1:
-                            error_message = _('No special club sessions remaining. You have %s special club sessions left') % membership.remaining_sp
-                            quota_issue_found = True
-                            break
-                        elif event_club_type == 'social_experience':
-                            # Bucket-based memberships don't support social_experience events
-                            error_message = _('Social Experience events are not supported with bucket-based memberships')
-                            quota_issue_found = True
-                            break
-                
-                if not quota_issue_found:
-                    # If quota is sufficient, then check club type permissions
-                    club_type_issue_found = False
-                    for membership in all_memberships:
-                        allows_club_type = False
-                        if event_club_type == 'regular_offline':
-                            allows_club_type = membership.plan_allowed_regular_offline
-                        elif event_club_type == 'regular_online':
-                            allows_club_type = membership.plan_allowed_regular_online
-                        elif event_club_type == 'spclub':
-                            allows_club_type = membership.plan_allowed_spclub
-                        
-                        if allows_club_type:
-                            # Found a membership that allows this club type and has sufficient quota
-                            club_type_issue_found = False
-                            break
-                        else:
-                            club_type_issue_found = True
-                    
-                    if club_type_issue_found:
-                        error_message = _('Your membership does not allow %s clubs') % event_club_type.replace("_", " ").title()
-                    else:
-                        # All checks passed but something else is wrong
-                        error_message = _('Insufficient quota for this club')
-            else:
-                error_message = _('No suitable membership found for this club')
-            
-            error_param = url_quote(error_message)
+            # Memberships exist but lack quota or permission, or there are none
+            error_param = url_quote(verdict['no_membership_reason'])
             return werkzeug.utils.redirect('/memberships?error=' + error_param)
         
         # Check for conflicting registrations
-        if event.date_begin and event.date_end:
-            # Find all events where the user has ACTIVE registrations OR WAITLIST registrations that overlap with this event's time
-            active_registrations = request.env['event.registration'].search([
-                ('partner_id', '=', partner.id),
-                ('event_id', '!=', event.id),  # Exclude current event
-                '|',
-                ('state', 'in', ['open', 'done']),  # Active registrations
-                ('is_on_waitlist', '=', True)  # Or waitlist registrations
-            ])
-            
-            # Get the event IDs from these active registrations
-            active_event_ids = active_registrations.mapped('event_id.id')
-            
-            # Find events that overlap in time with the current event
-            overlapping_events = request.env['event.event'].search([
-                ('id', 'in', active_event_ids),  # Only events where user has active registrations
-                ('website_published', '=', True),
-                ('date_begin', '<', event.date_end),  # Other event starts before this one ends
-                ('date_end', '>', event.date_begin),  # Other event ends after this one starts
-            ])
-            
-            if overlapping_events:
-                conflicting_event = overlapping_events[0]
-                error_message = _('You already have a booking for another club at the same time: %s') % conflicting_event.name
-                if conflicting_event.event_chinese_name:
-                    error_message += f' ({conflicting_event.event_chinese_name})'
-                error_param = url_quote(error_message)
-                return redirect(f'/popcorn/event/{event.id}/register?error=' + error_param)
-        
-        # Determine event club type for consumption
-        event_club_type = self._get_event_club_type(event)
-        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] event_registration_confirm - event_club_type detected: {event_club_type}")
-        if not event_club_type:
-            event_club_type = 'regular_offline'  # Default fallback
-            _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] No event_club_type found, using default: {event_club_type}")
+        conflicting_event = verdict['conflict_event']
+        if conflicting_event:
+            error_message = _('You already have a booking for another club at the same time: %s') % conflicting_event.name
+            if conflicting_event.event_chinese_name:
+                error_message += f' ({conflicting_event.event_chinese_name})'
+            error_param = url_quote(error_message)
+            return redirect(f'/popcorn/event/{event.id}/register?error=' + error_param)
         
         # Handle membership activation for pending policies
         if best_membership.state == 'pending':
@@ -901,13 +799,19 @@ class PopcornEventController(http.Controller):
             'state': 'open'  # Will be changed to 'draft' by model if needed
         }
         
-        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Creating registration with vals: event_id={event.id}, membership_id={best_membership.id}, event_club_type={event_club_type}")
-        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Best membership: ID={best_membership.id}, Plan={best_membership.membership_plan_id.name}, Quota Mode={best_membership.plan_quota_mode}, Points Remaining={best_membership.points_remaining}")
+        _logger.debug("Creating registration with vals: event_id=%s, membership_id=%s, event_club_type=%s",
+                      event.id, best_membership.id, event_club_type)
+        # points_remaining is computed, only pay for it when debugging
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("Best membership: ID=%s, Plan=%s, Quota Mode=%s, Points Remaining=%s",
+                          best_membership.id, best_membership.membership_plan_id.name,
+                          best_membership.plan_quota_mode, best_membership.points_remaining)
         
         # Create the registration (consumption is now handled automatically in create method)
         try:
             registration = request.env['event.registration'].sudo().create(registration_vals)
-            _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Registration created: ID={registration.id}, club_type={registration.club_type}, points_consumed={registration.points_consumed}, consumption_state={registration.consumption_state}")
+            _logger.debug("Registration created: ID=%s, club_type=%s, points_consumed=%s, consumption_state=%s",
+                          registration.id, registration.club_type, registration.points_consumed, registration.consumption_state)
             
             # Process referral if present
             referral_code = request.session.get('referral_code')
@@ -1341,9 +1245,9 @@ class PopcornEventController(http.Controller):
                 # Use payment.provider (Odoo 18)
                 payment_provider = None
                 try:
-                    payment_provider = request.env['payment.provider'].browse(provider_id)
+                    payment_provider = request.env['payment.provider']._popcorn_get_enabled_provider(provider_id, request.website)
                     
-                    if not payment_provider or not payment_provider.exists() or payment_provider.state != 'enabled':
+                    if not payment_provider:
                         _logger.error(f"Invalid payment provider: {provider_id}")
                         return request.redirect(f'/popcorn/event/{event.id}/checkout?error=invalid_payment_method')
                 except Exception as e:
@@ -1412,20 +1316,7 @@ class PopcornEventController(http.Controller):
                 # For WeChat payments, redirect to WeChat OAuth2 flow
                 _logger.info(f"Creating WeChat payment transaction for event purchase, provider: {payment_provider.name}")
                 
-                # Get or create a default payment method for the provider
-                payment_method = request.env['payment.method'].sudo().search([
-                    ('provider_ids', 'in', payment_provider.id),
-                    ('active', '=', True)
-                ], limit=1)
-                
-                if not payment_method:
-                    # Create a default payment method for this provider
-                    payment_method = request.env['payment.method'].sudo().create({
-                        'name': f'{payment_provider.name} Payment',
-                        'code': payment_provider.code.lower().replace(' ', '_'),
-                        'provider_ids': [(6, 0, [payment_provider.id])],
-                        'active': True,
-                    })
+                payment_method = payment_provider._popcorn_get_payment_method()
                 
                 # Create payment transaction with unique reference (NO registration created yet)
                 import time
@@ -1460,20 +1351,7 @@ class PopcornEventController(http.Controller):
                 # For Alipay payments, create transaction and redirect to Alipay WAP payment
                 _logger.info(f"Creating Alipay payment transaction for event purchase, provider: {payment_provider.name}")
                 
-                # Get or create a default payment method for the provider
-                payment_method = request.env['payment.method'].sudo().search([
-                    ('provider_ids', 'in', payment_provider.id),
-                    ('active', '=', True)
-                ], limit=1)
-                
-                if not payment_method:
-                    # Create a default payment method for this provider
-                    payment_method = request.env['payment.method'].sudo().create({
-                        'name': f'{payment_provider.name} Payment',
-                        'code': payment_provider.code.lower().replace(' ', '_'),
-                        'provider_ids': [(6, 0, [payment_provider.id])],
-                        'active': True,
-                    })
+                payment_method = payment_provider._popcorn_get_payment_method()
                 
                 # Create payment transaction with unique reference (NO registration created yet)
                 import time
@@ -1536,20 +1414,7 @@ class PopcornEventController(http.Controller):
                 # For all other online payments (Stripe/PayPal/etc), create payment transaction and redirect to gateway
                 _logger.info(f"Creating payment transaction for event purchase, provider: {payment_provider.name}")
                 
-                # Get or create a default payment method for the provider
-                payment_method = request.env['payment.method'].sudo().search([
-                    ('provider_ids', 'in', payment_provider.id),
-                    ('active', '=', True)
-                ], limit=1)
-                
-                if not payment_method:
-                    # Create a default payment method for this provider
-                    payment_method = request.env['payment.method'].sudo().create({
-                        'name': f'{payment_provider.name} Payment',
-                        'code': payment_provider.code.lower().replace(' ', '_'),
-                        'provider_ids': [(6, 0, [payment_provider.id])],
-                        'active': True,
-                    })
+                payment_method = payment_provider._popcorn_get_payment_method()
                 
                 # Create payment transaction with unique reference (NO registration created yet)
                 import time
@@ -1672,9 +1537,7 @@ class PopcornEventController(http.Controller):
             # The frontend should only check status and display confirmation screen
             
             # Check if registration already exists (backend polling may have created it)
-            existing_registration = request.env['event.registration'].sudo().search([
-                ('payment_transaction_id', '=', transaction.id)
-            ], limit=1)
+            existing_registration = transaction.popcorn_registration_id
             
             if existing_registration:
                 _logger.info(f"Event registration {existing_registration.id} already exists for transaction {transaction.reference}, "
@@ -1749,12 +1612,30 @@ class PopcornEventController(http.Controller):
         return True, None, None
 
 
+class HostedClub(NamedTuple):
+    """A hosted event as a /my/clubs card, with the registration fields the card reads."""
+    id: int
+    event_id: object
+    partner_id: object
+    can_cancel: bool = False  # Hosts can't cancel their own events
+    is_on_waitlist: bool = False
+    waitlist_position: int = 0
+
+    @classmethod
+    def from_event(cls, event, host):
+        return cls(id=event.id, event_id=event, partner_id=host)
+
+
 class PopcornPortalController(CustomerPortal):
     """Portal controller for Popcorn Club specific pages"""
     
-    @http.route(['/my/clubs'], type='http', auth="user", website=True)
-    def portal_my_clubs(self, **kwargs):
-        """Display user's registered clubs or hosted events if user is a host"""
+    @http.route(['/my/clubs', '/my/clubs/page/<int:page>'], type='http', auth="user", website=True)
+    def portal_my_clubs(self, page=1, **kwargs):
+        """Display user's registered clubs or hosted events if user is a host.
+
+        Upcoming clubs are listed in full; the past history is paged, sorted
+        and sliced in SQL, so the page costs the same however long it is.
+        """
         partner = request.env.user.partner_id
         
         # Get current datetime for comparison
@@ -1766,69 +1647,34 @@ class PopcornPortalController(CustomerPortal):
         if is_host:
             # For hosts, show their hosted events
             # Use sudo() to bypass record rules that might prevent reading ended events
-            try:
-                upcoming_events = request.env['event.event'].sudo().search([
-                    ('host_id', '=', partner.id),
-                    ('date_end', '>', now)  # Event hasn't ended yet
-                ])
-                
-                past_events = request.env['event.event'].sudo().search([
-                    ('host_id', '=', partner.id),
-                    ('date_end', '<=', now)  # Event has ended
-                ])
-            except Exception as e:
-                # If there are still access issues, try a different approach
-                _logger.warning(f"Access issue when fetching host events: {e}")
-                # Get all events for the host and filter in Python
-                all_events = request.env['event.event'].sudo().search([
-                    ('host_id', '=', partner.id)
-                ])
-                upcoming_events = all_events.filtered(lambda e: e.date_end > now)
-                past_events = all_events.filtered(lambda e: e.date_end <= now)
-            
-            # Sort the events manually
-            upcoming_events = upcoming_events.sorted(key=lambda e: e.date_begin)
-            past_events = past_events.sorted(key=lambda e: e.date_begin, reverse=True)
-            
-            # Convert events to registration-like objects for template compatibility
-            upcoming_registrations = []
-            for event in upcoming_events:
-                # Create a mock registration object with event data
-                mock_registration = type('MockRegistration', (), {
-                    'id': event.id,
-                    'event_id': event,
-                    'can_cancel': False,  # Hosts can't cancel their own events
-                    'partner_id': partner
-                })()
-                upcoming_registrations.append(mock_registration)
-            
-            past_registrations = []
-            for event in past_events:
-                # Create a mock registration object with event data
-                mock_registration = type('MockRegistration', (), {
-                    'id': event.id,
-                    'event_id': event,
-                    'can_cancel': False,  # Hosts can't cancel their own events
-                    'partner_id': partner
-                })()
-                past_registrations.append(mock_registration)
+            Event = request.env['event.event'].sudo()
+            past_domain = [('host_id', '=', partner.id), ('date_end', '<=', now)]
+            pager = portal_pager(url='/my/clubs', total=Event.search_count(past_domain), page=page,
+                                 step=PAST_CLUBS_PER_PAGE)
+            upcoming_events = Event.search([
+                ('host_id', '=', partner.id),
+                ('date_end', '>', now)  # Event hasn't ended yet
+            ], order='date_begin asc, id asc')
+            past_events = Event.search(past_domain, order='date_begin desc, id desc',
+                                       limit=PAST_CLUBS_PER_PAGE, offset=pager['offset'])
+            
+            # Hosted events are shown through the registration card template
+            upcoming_registrations = [HostedClub.from_event(event, partner) for event in upcoming_events]
+            past_registrations = [HostedClub.from_event(event, partner) for event in past_events]
         else:
             # For regular users, show their registrations (including waitlisted)
-            upcoming_registrations = request.env['event.registration'].sudo().search([
+            Registration = request.env['event.registration'].sudo()
+            base_domain = [
                 ('partner_id', '=', partner.id),
-                ('event_id.date_end', '>', now),
                 ('state', 'in', ['draft', 'open', 'confirmed', 'done']),
-            ])
-
-            past_registrations = request.env['event.registration'].sudo().search([
-                ('partner_id', '=', partner.id),
-                ('event_id.date_end', '<=', now),
-                ('state', 'in', ['draft', 'open', 'confirmed', 'done']),
-            ])
-
-            # Sort the registrations manually
-            upcoming_registrations = upcoming_registrations.sorted(key=lambda r: r.event_id.date_begin)
-            past_registrations = past_registrations.sorted(key=lambda r: r.event_id.date_begin, reverse=True)
+            ]
+            past_domain = base_domain + [('event_date_end', '<=', now)]
+            pager = portal_pager(url='/my/clubs', total=Registration.search_count(past_domain), page=page,
+                                 step=PAST_CLUBS_PER_PAGE)
+            upcoming_registrations = Registration.search(
+                base_domain + [('event_date_end', '>', now)], order='event_start_time asc, id asc')
+            past_registrations = Registration.search(past_domain, order='event_start_time desc, id desc',
+                                                     limit=PAST_CLUBS_PER_PAGE, offset=pager['offset'])
         
         # Handle success and error messages
         success_message = None
@@ -1842,6 +1688,7 @@ class PopcornPortalController(CustomerPortal):
         values = {
             'registrations': upcoming_registrations,
             'past_registrations': past_registrations,
+            'pager': pager,
             'page_name': 'my_clubs',
             'current_time': now,  # For debugging
             'success_message': success_message,
@@ -2260,9 +2107,36 @@ class PopcornPortalController(CustomerPortal):
         except Exception as e:
             return request.redirect('/my/cards?error=unfreeze_failed')
 
+    @http.route(['/popcorn/event/<int:event_id>/attendance/bulk'], type='json', auth="user", methods=['POST'])
+    def event_attendance_bulk(self, event_id, statuses=None, **kwargs):
+        """Registration desk: mark a whole event's attendance in one request
+
+        `statuses` maps registration ids to 'attended', 'late' or 'no_show'.
+        """
+        if not request.env.user.has_group('base.group_user'):
+            return {'success': False, 'message': _('Only staff can mark attendance')}
+        event = request.env['event.event'].browse(event_id).exists()
+        if not event:
+            return {'success': False, 'message': _('Event not found')}
+        if not statuses:
+            return {'success': False, 'message': _('No attendees to mark')}
+        try:
+            summary = event.action_mark_attendance_bulk(statuses)
+        except UserError as e:
+            return {'success': False, 'message': str(e)}
+        return {'success': True, 'summary': summary}
+
     @http.route(['/popcorn/event/freeze-info'], type='json', auth="user", website=True)
-    def get_event_freeze_info(self, event_ids=None, **kwargs):
-        """Get freeze information for events"""
+    def get_event_freeze_info(self, event_ids=None, freeze_version=None, **kwargs):
+        """Get freeze information for events
+
+        The partner's freeze intervals are loaded once and each event is
+        answered with a sorted-interval lookup. Returns
+        {'freeze_version': ..., 'events': {event_id: info}}; a client that
+        sends back the version it already has gets
+        {'freeze_version': ..., 'unchanged': True} while the partner's
+        freezes are unchanged, so it can keep its cached answers.
+        """
         if not event_ids:
             return {}
         
@@ -2270,19 +2144,28 @@ class PopcornPortalController(CustomerPortal):
         if not partner:
             return {}
         
-        events = request.env['event.event'].sudo().browse(event_ids)
+        Membership = request.env['popcorn.membership'].sudo()
+        freeze_index = Membership._get_freeze_intervals(partner)
+        if freeze_version and freeze_version == freeze_index['version']:
+            return {'freeze_version': freeze_index['version'], 'unchanged': True}
+
+        events = request.env['event.event'].sudo().browse(event_ids).exists()
+        memberships = Membership.browse([membership_id for _s, _e, membership_id in freeze_index['intervals']])
+        names = dict(zip(memberships.ids, memberships.mapped('display_name')))
         freeze_info = {}
         
         for event in events:
-            is_frozen, frozen_membership = self._is_event_in_freeze_period(event, partner)
+            interval = Membership._find_freeze_interval(
+                freeze_index, event.date_begin.date() if event.date_begin else None
+            )
             freeze_info[event.id] = {
-                'is_frozen': is_frozen,
-                'frozen_membership': frozen_membership.name if frozen_membership else None,
-                'freeze_start': frozen_membership.freeze_start.isoformat() if frozen_membership and frozen_membership.freeze_start else None,
-                'freeze_end': frozen_membership.freeze_end.isoformat() if frozen_membership and frozen_membership.freeze_end else None,
+                'is_frozen': bool(interval),
+                'frozen_membership': names.get(interval[2]) if interval else None,
+                'freeze_start': interval[0].isoformat() if interval else None,
+                'freeze_end': interval[1].isoformat() if interval else None,
             }
         
-        return freeze_info
+        return {'freeze_version': freeze_index['version'], 'events': freeze_info}
 
 
 
@@ -20,7 +20,7 @@ class PopcornForumController(http.Controller):
     """Member forum with AI moderation.
 
     Reading is public. Posting is limited to members with a live membership,
-    and every post goes through DeepSeek before it can appear.
+    and every post goes through DeepSeek, in the background, before it can appear.
     """
 
     def _get_active_membership(self, partner):
@@ -70,7 +70,7 @@ class PopcornForumController(http.Controller):
 
     @http.route(['/forum/submit'], type='http', auth="user", methods=['POST'], website=True, csrf=True)
     def forum_submit(self, **kwargs):
-        """Accept a post, moderate it, and thank the member either way."""
+        """Accept a post, queue it for moderation, and thank the member either way."""
         partner = request.env.user.partner_id
 
         if not self._get_active_membership(partner):
@@ -100,12 +100,10 @@ class PopcornForumController(http.Controller):
             'state': 'pending',
         })
 
-        # Runs inline so an approved post is live by the time the member
-        # lands back on the feed. Failures park the post rather than raise.
-        try:
-            post.run_moderation()
-        except Exception:
-            _logger.exception('Popcorn forum: unexpected error moderating post %s', post.id)
+        # Moderated on the background queue once this request commits, so a
+        # slow DeepSeek never holds a website worker. The post shows up on
+        # the feed as soon as it is approved.
+        post._enqueue_moderation()
 
         # Same message whichever way the verdict went.
         return request.redirect('/forum?thanks=1')
@@ -96,11 +96,10 @@ class PopcornMembershipController(http.Controller):
         if request.env.user.id == request.env.ref('base.public_user').id:
             return request.redirect('/web/login?redirect=' + request.httprequest.url)
         
-        # Get all active and published membership plans
-        membership_plans = request.env['popcorn.membership.plan'].search([
-            ('active', '=', True),
-            ('website_published', '=', True)
-        ], order='sequence, name')
+        # Active and published plans, with everything that does not depend on
+        # the visitor, come from the shared catalogue
+        catalogue = request.env['popcorn.membership.plan']._get_plan_catalogue()
+        membership_plans = request.env['popcorn.membership.plan'].browse(catalogue['plan_ids'])
         
         # Get error message from URL parameter if present
         error_message = request.params.get('error', '')
@@ -208,13 +207,9 @@ class PopcornMembershipController(http.Controller):
         # First-timer grace period banner
         partner = request.env.user.partner_id
         first_timer_pending_date = False
-        if partner.is_first_timer and partner.pdb_pending_date:
-            today = fields.Date.today()
-            if partner.pdb_pending_date >= today:
-                first_timer_pending_date = partner.pdb_pending_date
-            else:
-                # Grace period already expired; apply PDB now in case cron hasn't run
-                partner.sudo().write({'pdb': True, 'is_first_timer': False})
+        # An expired grace period is left to the pending PDB cron: this page only reads
+        if partner.is_first_timer and partner.pdb_pending_date and partner.pdb_pending_date >= fields.Date.today():
+            first_timer_pending_date = partner.pdb_pending_date
 
         # Find the highest-priority active public discount to show in the banner
         _today = fields.Date.today()
@@ -229,6 +224,7 @@ class PopcornMembershipController(http.Controller):
 
         values = {
             'membership_plans': membership_plans,
+            'plan_catalogue': catalogue['plans'],
             'error_message': error_message,
             'is_first_timer': is_first_timer,
             'plan_discounts': plan_discounts,
@@ -246,7 +242,7 @@ class PopcornMembershipController(http.Controller):
         if request.env.user.id == request.env.ref('base.public_user').id:
             return request.redirect('/web/login?redirect=' + request.httprequest.url)
         
-        return request.render('popcorn.membership_plans_website_page')
+        return self.memberships_list(**post)
     
     @http.route(['/memberships/<string:plan>'], type='http', auth="public", website=True)
     def membership_plan_detail(self, plan, **post):
@@ -257,9 +253,10 @@ class PopcornMembershipController(http.Controller):
 
         plan = self._get_membership_plan(plan)
 
+        entry = request.env['popcorn.membership.plan']._get_plan_catalogue()['plans'].get(plan.id)
         values = {
             'plan': plan,
-            'benefits': plan.get_membership_benefits(),
+            'benefits': list(entry['benefits']) if entry else plan.get_membership_benefits(),
         }
         
         return request.render('popcorn.membership_plan_detail_page', values)
@@ -320,7 +317,7 @@ class PopcornMembershipController(http.Controller):
         is_first_timer = request.env.user.partner_id.is_first_timer
         
         partner = request.env.user.partner_id
-        payment_providers = request.env['payment.provider'].sudo().search([('state', '=', 'enabled')])
+        payment_providers = request.env['payment.provider']._popcorn_get_enabled_providers(request.website)
         
         # First-timer and renewal pricing are exclusive — no additional discounts stack
         if is_renewal or is_first_timer:
@@ -759,9 +756,9 @@ class PopcornMembershipController(http.Controller):
                 # Use payment.provider (Odoo 18)
                 payment_provider = None
                 try:
-                    payment_provider = request.env['payment.provider'].browse(provider_id)
+                    payment_provider = request.env['payment.provider']._popcorn_get_enabled_provider(provider_id, request.website)
                     
-                    if not payment_provider or not payment_provider.exists() or payment_provider.state != 'enabled':
+                    if not payment_provider:
                         return request.redirect('/memberships/%s/checkout?error=invalid_payment_method' % plan.id)
                 except Exception as e:
                     _logger.error(f"Failed to access payment provider: {str(e)}")
@@ -793,20 +790,7 @@ class PopcornMembershipController(http.Controller):
                 # For WeChat payments, redirect to WeChat OAuth2 flow
                 _logger.info(f"Creating WeChat payment transaction for provider: {payment_provider.name}")
                 
-                # Get or create a default payment method for the provider
-                payment_method = request.env['payment.method'].sudo().search([
-                    ('provider_ids', 'in', payment_provider.id),
-                    ('active', '=', True)
-                ], limit=1)
-                
-                if not payment_method:
-                    # Create a default payment method for this provider
-                    payment_method = request.env['payment.method'].sudo().create({
-                        'name': f'{payment_provider.name} Payment',
-                        'code': payment_provider.code.lower().replace(' ', '_'),
-                        'provider_ids': [(6, 0, [payment_provider.id])],
-                        'active': True,
-                    })
+                payment_method = payment_provider._popcorn_get_payment_method()
                 
                 # Create payment transaction with unique reference (NO membership created yet)
                 import time
@@ -867,20 +851,7 @@ class PopcornMembershipController(http.Controller):
                 # For Alipay payments, create transaction and redirect to Alipay WAP payment
                 _logger.info(f"Creating Alipay payment transaction for provider: {payment_provider.name}")
                 
-                # Get or create a default payment method for the provider
-                payment_method = request.env['payment.method'].sudo().search([
-                    ('provider_ids', 'in', payment_provider.id),
-                    ('active', '=', True)
-                ], limit=1)
-                
-                if not payment_method:
-                    # Create a default payment method for this provider
-                    payment_method = request.env['payment.method'].sudo().create({
-                        'name': f'{payment_provider.name} Payment',
-                        'code': payment_provider.code.lower().replace(' ', '_'),
-                        'provider_ids': [(6, 0, [payment_provider.id])],
-                        'active': True,
-                    })
+                payment_method = payment_provider._popcorn_get_payment_method()
                 
                 # Create payment transaction with unique reference (NO membership created yet)
                 import time
@@ -980,20 +951,7 @@ class PopcornMembershipController(http.Controller):
                 # For all other online payments (Stripe/PayPal/etc), create payment transaction and redirect to gateway
                 _logger.info(f"Creating payment transaction for provider: {payment_provider.name}")
                 
-                # Get or create a default payment method for the provider
-                payment_method = request.env['payment.method'].sudo().search([
-                    ('provider_ids', 'in', payment_provider.id),
-                    ('active', '=', True)
-                ], limit=1)
-                
-                if not payment_method:
-                    # Create a default payment method for this provider
-                    payment_method = request.env['payment.method'].sudo().create({
-                        'name': f'{payment_provider.name} Payment',
-                        'code': payment_provider.code.lower().replace(' ', '_'),
-                        'provider_ids': [(6, 0, [payment_provider.id])],
-                        'active': True,
-                    })
+                payment_method = payment_provider._popcorn_get_payment_method()
                 
                 # Create payment transaction with unique reference (NO membership created yet)
                 import time
@@ -1088,20 +1046,7 @@ class PopcornMembershipController(http.Controller):
             # Create actual payment transaction
             _logger.info(f"Creating payment transaction for provider: {payment_provider.name}")
             
-            # Get or create a default payment method for the provider
-            payment_method = request.env['payment.method'].sudo().search([
-                ('provider_ids', 'in', payment_provider.id),
-                ('active', '=', True)
-            ], limit=1)
-            
-            if not payment_method:
-                # Create a default payment method for this provider
-                payment_method = request.env['payment.method'].sudo().create({
-                    'name': f'{payment_provider.name} Payment',
-                    'code': payment_provider.code.lower().replace(' ', '_'),
-                    'provider_ids': [(6, 0, [payment_provider.id])],
-                    'active': True,
-                })
+            payment_method = payment_provider._popcorn_get_payment_method()
             
             # Create payment transaction with unique reference
             import time
@@ -1301,9 +1246,7 @@ class PopcornMembershipController(http.Controller):
                     return request.redirect('/memberships/payment/failed?error=transaction_not_found')
                 
                 # Check if membership already exists for this transaction (backend polling may have created it)
-                existing_membership = request.env['popcorn.membership'].sudo().search([
-                    ('payment_transaction_id', '=', transaction.id)
-                ], limit=1)
+                existing_membership = transaction._get_popcorn_membership()
                 
                 if existing_membership:
                     _logger.info(f"Membership {existing_membership.id} already exists for transaction {transaction.reference}, "
@@ -1312,30 +1255,25 @@ class PopcornMembershipController(http.Controller):
                     return request.redirect(redirect_url)
                 
                 # Mark transaction as done if not already done (backend polling may have done this)
-                # This will trigger backend auto-creation of membership via write() override
+                # The write() override queues it for the processing cron, which
+                # creates the membership in the background
                 if transaction.state != 'done':
-                    # Write will trigger our override which creates membership synchronously
                     transaction.write({'state': 'done'})
                 
-                # Refresh transaction to see if membership was created by backend
-                transaction.invalidate_recordset(['popcorn_processed'])
-                
-                # Check if membership was created by backend (write() override creates it synchronously)
-                existing_membership = request.env['popcorn.membership'].sudo().search([
-                    ('payment_transaction_id', '=', transaction.id)
-                ], limit=1)
+                # The cron may already have processed it (e.g. webhook arrived first)
+                transaction.invalidate_recordset(['popcorn_processed', 'popcorn_membership_id'])
+                existing_membership = transaction._get_popcorn_membership()
                 
                 if existing_membership:
                     _logger.info(f"Membership {existing_membership.id} created by backend for transaction {transaction.reference}")
                     redirect_url = '/memberships/success?membership_id=%s' % existing_membership.id
                     return request.redirect(redirect_url)
                 
-                # If still no membership after backend processing, log warning and redirect
-                _logger.warning(f"No membership found after marking transaction {transaction.reference} as done. "
-                              f"Backend should have created it. Redirecting to membership page...")
-                
-                # Redirect to membership page - backend will create membership soon
-                return request.redirect('/memberships?warning=processing')
+                # Not processed yet: the success page polls until the cron has created the membership
+                _logger.info(f"Payment successful for transaction {transaction.reference}, but membership not yet created. "
+                           f"Redirecting to success page - the processing cron will create the membership.")
+                redirect_url = '/memberships/success?payment_success=true&transaction_id=%s&processing=true' % transaction.reference
+                return request.redirect(redirect_url)
             
             # Original callback logic for other payment gateways
             # Get transaction ID from params or session (fallback)
@@ -1354,15 +1292,15 @@ class PopcornMembershipController(http.Controller):
             
             # Check payment status
             if transaction.state == 'done':
-                # Transaction processing is handled by _process_membership_transaction() via write()/_set_done()
-                # Just find the created membership and redirect
-                membership = request.env['popcorn.membership'].search([
-                    ('payment_transaction_id', '=', transaction.id)
-                ], limit=1)
+                # write()/_set_done() queue the transaction; the processing cron
+                # creates the membership shortly after, so it may not exist yet
+                membership = transaction._get_popcorn_membership()
                 
                 if not membership:
-                    _logger.error(f"No membership found for transaction {transaction_id}")
-                    return request.redirect('/memberships/payment/failed?error=membership_not_created')
+                    _logger.info(f"Payment successful for transaction {transaction.reference}, but membership not yet created. "
+                               f"Redirecting to success page - the processing cron will create the membership.")
+                    redirect_url = '/memberships/success?payment_success=true&transaction_id=%s&processing=true' % transaction.reference
+                    return request.redirect(redirect_url)
                 
                 # Redirect based on transaction type
                 if transaction.is_upgrade:
@@ -1387,35 +1325,6 @@ class PopcornMembershipController(http.Controller):
             _logger.error(f"Failed to handle payment callback: {str(e)}")
             return request.redirect('/memberships/payment/failed?error=callback_failed')
 
-    def _find_membership_by_transaction_reference(self, transaction_reference):
-        """Find membership by transaction reference"""
-        try:
-            # Parse transaction reference: MEMBERSHIP-{plan_id}-{partner_id}-{timestamp}
-            if not transaction_reference.startswith('MEMBERSHIP-'):
-                return None
-            
-            parts = transaction_reference.split('-')
-            if len(parts) < 3:
-                return None
-            
-            partner_id = int(parts[2])
-            
-            # Find pending membership for this partner
-            membership = request.env['popcorn.membership'].sudo().search([
-                ('partner_id', '=', partner_id),
-                ('state', '=', 'pending_payment'),
-                ('purchase_channel', '=', 'online')
-            ], order='create_date desc', limit=1)
-            
-            return membership
-            
-        except (ValueError, IndexError) as e:
-            _logger.error("Failed to parse transaction reference %s: %s", transaction_reference, str(e))
-            return None
-        except Exception as e:
-            _logger.error("Failed to find membership for transaction %s: %s", transaction_reference, str(e))
-            return None
-
     @http.route(['/memberships/<string:plan>/purchase'], type='http', auth="public", website=True)
     def membership_purchase(self, plan, **post):
         """Handle membership purchase"""
@@ -1503,9 +1412,7 @@ class PopcornMembershipController(http.Controller):
             # The frontend should only check status and display confirmation screen
             
             # Check if membership already exists (backend polling may have created it)
-            existing_membership = request.env['popcorn.membership'].sudo().search([
-                ('payment_transaction_id', '=', transaction.id)
-            ], limit=1)
+            existing_membership = transaction._get_popcorn_membership()
             
             if existing_membership:
                 _logger.info(f"Membership {existing_membership.id} already exists for transaction {transaction.reference}, "
@@ -1519,12 +1426,10 @@ class PopcornMembershipController(http.Controller):
                     _logger.info(f"Transaction {transaction.reference} not yet 'done', marking as done to trigger backend processing")
                     transaction.write({'state': 'done'})
                     # Invalidate to read latest state
-                    transaction.invalidate_recordset(['popcorn_processed', 'state'])
+                    transaction.invalidate_recordset(['popcorn_processed', 'popcorn_membership_id', 'state'])
                 
                 # Re-check for membership after triggering backend processing
-                existing_membership = request.env['popcorn.membership'].sudo().search([
-                    ('payment_transaction_id', '=', transaction.id)
-                ], limit=1)
+                existing_membership = transaction._get_popcorn_membership()
                 
                 if existing_membership:
                     _logger.info(f"Membership {existing_membership.id} created by backend, showing success page")
@@ -1599,9 +1504,7 @@ class PopcornMembershipController(http.Controller):
             # The frontend should only check status and display confirmation screen
             
             # Check if membership already exists (backend polling may have created it)
-            existing_membership = request.env['popcorn.membership'].sudo().search([
-                ('payment_transaction_id', '=', transaction.id)
-            ], limit=1)
+            existing_membership = transaction._get_popcorn_membership()
             
             if existing_membership:
                 _logger.info(f"Membership {existing_membership.id} already exists for transaction {transaction.reference}, "
@@ -1617,12 +1520,10 @@ class PopcornMembershipController(http.Controller):
                 _logger.info(f"Transaction {transaction.reference} not yet 'done', marking as done to trigger backend processing")
                 transaction.write({'state': 'done'})
                 # Invalidate to read latest state
-                transaction.invalidate_recordset(['popcorn_processed', 'state'])
+                transaction.invalidate_recordset(['popcorn_processed', 'popcorn_membership_id', 'state'])
             
             # Re-check for membership after triggering backend processing
-            existing_membership = request.env['popcorn.membership'].sudo().search([
-                ('payment_transaction_id', '=', transaction.id)
-            ], limit=1)
+            existing_membership = transaction._get_popcorn_membership()
             
             if existing_membership:
                 _logger.info(f"Membership {existing_membership.id} created by backend, redirecting to success page")
@@ -1980,6 +1881,8 @@ class PopcornMembershipController(http.Controller):
             
             registration = request.env['event.registration'].sudo().create(registration_vals)
             _logger.info(f"Event registration created with ID: {registration.id}, State: {registration.state}, Payment Transaction: {transaction.id}")
+            if not transaction.popcorn_registration_id:
+                transaction.sudo().popcorn_registration_id = registration
             
             payment_message = _('Direct purchase registration for event: %s. Price: %s. Payment successful via %s. Transaction: %s. Event registration created and activated.') % (event.name, pending_event_purchase['event_price'], transaction.provider_id.name, transaction.reference)
             if pending_event_purchase.get('use_popcorn_money') and pending_event_purchase.get('popcorn_money_to_use', 0) > 0:
@@ -34,11 +34,18 @@ class PopcornNotificationController(http.Controller):
             
             # Filter and format notifications
             result_notifications = []
+            # Membership and upcoming registration for the placeholders, fetched
+            # once for all notifications and only if one of them is shown
+            render_context = None
             for notification in notifications:
                 if has_accepted_terms and terms_notification and notification.id == terms_notification.id:
                     continue
                 if notification._evaluate_notification_for_partner(partner):
-                    notification_data = notification.get_notification_data_for_partner(partner)
+                    if render_context is None:
+                        render_context = notifications._prefetch_render_context(partner)[partner.id]
+                    membership, registration = render_context
+                    notification_data = notification.get_notification_data_for_partner(
+                        partner, registration=registration, membership=membership)
                     if notification_data:
                         result_notifications.append(notification_data)
             
@@ -74,3 +81,15 @@ class PopcornNotificationController(http.Controller):
         except Exception as e:
             _logger.error(f"Error in accept_terms: {str(e)}", exc_info=True)
             return {'success': False, 'error': str(e)}
+
+    @http.route('/popcorn/notifications/outbox/metrics', type='json', auth='user')
+    def outbox_metrics(self, hours=24, **kwargs):
+        """Per notification throughput of the notification outbox"""
+        if not request.env.user.has_group('base.group_system'):
+            return {'success': False, 'message': 'Only administrators can read outbox metrics'}
+        hours = max(1, min(int(hours or 24), 24 * 30))
+        return {
+            'success': True,
+            'hours': hours,
+            'notifications': request.env['popcorn.notification.outbox'].sudo()._get_throughput_metrics(hours=hours),
+        }
@@ -36,11 +36,7 @@ class PopcornProductController(http.Controller):
             partner = request.env.user.partner_id if request.env.user != request.website.user_id else website.partner_id
             
             # Get WeChat payment provider
-            wechat_provider = request.env['payment.provider'].sudo().search([
-                ('code', '=', 'wechat'),
-                ('state', '=', 'enabled'),
-                ('is_published', '=', True),
-            ], limit=1)
+            wechat_provider = request.env['payment.provider']._popcorn_get_provider('wechat', request.website)
             
             if not wechat_provider:
                 _logger.error("WeChat payment provider not found or not enabled")
@@ -56,19 +52,7 @@ class PopcornProductController(http.Controller):
             
             # Create payment transaction
             timestamp = int(time.time())
-            payment_method = request.env['payment.method'].sudo().search([
-                ('provider_ids', 'in', wechat_provider.id),
-                ('active', '=', True)
-            ], limit=1)
-            
-            if not payment_method:
-                # Create default payment method if needed
-                payment_method = request.env['payment.method'].sudo().create({
-                    'name': 'WeChat Pay',
-                    'code': 'wechat',
-                    'provider_ids': [(6, 0, [wechat_provider.id])],
-                    'active': True,
-                })
+            payment_method = wechat_provider._popcorn_get_payment_method()
             
             # Generate access token for landing route
             from odoo.addons.payment import utils as payment_utils
@@ -140,11 +124,7 @@ class PopcornProductController(http.Controller):
             partner = request.env.user.partner_id if request.env.user != request.website.user_id else website.partner_id
             
             # Get WeChat payment provider
-            wechat_provider = request.env['payment.provider'].sudo().search([
-                ('code', '=', 'wechat'),
-                ('state', '=', 'enabled'),
-                ('is_published', '=', True),
-            ], limit=1)
+            wechat_provider = request.env['payment.provider']._popcorn_get_provider('wechat', request.website)
             
             if not wechat_provider:
                 _logger.error("WeChat payment provider not found or not enabled")
@@ -166,19 +146,7 @@ class PopcornProductController(http.Controller):
             
             # Create payment transaction
             timestamp = int(time.time())
-            payment_method = request.env['payment.method'].sudo().search([
-                ('provider_ids', 'in', wechat_provider.id),
-                ('active', '=', True)
-            ], limit=1)
-            
-            if not payment_method:
-                # Create default payment method if needed
-                payment_method = request.env['payment.method'].sudo().create({
-                    'name': 'WeChat Pay',
-                    'code': 'wechat',
-                    'provider_ids': [(6, 0, [wechat_provider.id])],
-                    'active': True,
-                })
+            payment_method = wechat_provider._popcorn_get_payment_method()
             
             # Calculate total amount
             amount = order.amount_total
@@ -309,11 +277,7 @@ class PopcornProductController(http.Controller):
             website = request.website
             partner = request.env.user.partner_id if request.env.user != request.website.user_id else website.partner_id
             
-            alipay_provider = request.env['payment.provider'].sudo().search([
-                ('code', '=', 'alipay'),
-                ('state', '=', 'enabled'),
-                ('is_published', '=', True),
-            ], limit=1)
+            alipay_provider = request.env['payment.provider']._popcorn_get_provider('alipay', request.website)
             
             if not alipay_provider:
                 _logger.error("Alipay payment provider not found or not enabled")
@@ -330,18 +294,7 @@ class PopcornProductController(http.Controller):
             })
             
             timestamp = int(time.time())
-            payment_method = request.env['payment.method'].sudo().search([
-                ('provider_ids', 'in', alipay_provider.id),
-                ('active', '=', True)
-            ], limit=1)
-            
-            if not payment_method:
-                payment_method = request.env['payment.method'].sudo().create({
-                    'name': 'Alipay',
-                    'code': 'alipay',
-                    'provider_ids': [(6, 0, [alipay_provider.id])],
-                    'active': True,
-                })
+            payment_method = alipay_provider._popcorn_get_payment_method()
             
             amount = order.amount_total
             
@@ -413,11 +366,7 @@ class PopcornProductController(http.Controller):
             website = request.website
             partner = request.env.user.partner_id if request.env.user != request.website.user_id else website.partner_id
             
-            alipay_provider = request.env['payment.provider'].sudo().search([
-                ('code', '=', 'alipay'),
-                ('state', '=', 'enabled'),
-                ('is_published', '=', True),
-            ], limit=1)
+            alipay_provider = request.env['payment.provider']._popcorn_get_provider('alipay', request.website)
             
             if not alipay_provider:
                 _logger.error("Alipay payment provider not found or not enabled")
@@ -429,18 +378,7 @@ class PopcornProductController(http.Controller):
                 return request.redirect('/shop/confirmation')
             
             timestamp = int(time.time())
-            payment_method = request.env['payment.method'].sudo().search([
-                ('provider_ids', 'in', alipay_provider.id),
-                ('active', '=', True)
-            ], limit=1)
-            
-            if not payment_method:
-                payment_method = request.env['payment.method'].sudo().create({
-                    'name': 'Alipay',
-                    'code': 'alipay',
-                    'provider_ids': [(6, 0, [alipay_provider.id])],
-                    'active': True,
-                })
+            payment_method = alipay_provider._popcorn_get_payment_method()
             
             from odoo.addons.payment import utils as payment_utils
             access_token = payment_utils.generate_access_token(
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http
+from odoo.http import request
+
+from ..models import popcorn_tracing
+
+
+class PopcornTracingController(http.Controller):
+    """Read access to the performance spans recorded by this server process"""
+
+    @http.route('/popcorn/tracing/spans', type='json', auth='user')
+    def get_spans(self, name=None, limit=100, **kwargs):
+        """Recent spans, most recent first, with per span name aggregates"""
+        if not request.env.user.has_group('base.group_system'):
+            return {'success': False, 'message': 'Only administrators can read tracing data'}
+        return {
+            'success': True,
+            'sample_rate': popcorn_tracing.get_sample_rate(request.env),
+            'summary': popcorn_tracing.buffer.summary(),
+            'spans': popcorn_tracing.buffer.snapshot(name=name, limit=limit),
+        }
+
+    @http.route('/popcorn/tracing/clear', type='json', auth='user', methods=['POST'])
+    def clear_spans(self, **kwargs):
+        """Empty the span buffer, e.g. before measuring a change"""
+        if not request.env.user.has_group('base.group_system'):
+            return {'success': False, 'message': 'Only administrators can clear tracing data'}
+        popcorn_tracing.buffer.clear()
+        return {'success': True}
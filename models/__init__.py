@@ -3,6 +3,8 @@ from . import popcorn_event_registration
 from . import popcorn_event_tag_category
 from . import popcorn_membership
 from . import popcorn_membership_plan
+from . import popcorn_membership_followup
+from . import popcorn_membership_violation_counter
 from . import popcorn_partner
 from . import popcorn_website_menu
 from . import popcorn_badge
@@ -14,7 +16,9 @@ from . import popcorn_discount_usage
 from . import popcorn_membership_discount_rel
 from . import popcorn_referral
 from . import popcorn_notification
+from . import popcorn_notification_outbox
 from . import popcorn_forum_post
+from . import popcorn_forum_moderation_cache
 from . import popcorn_activity_sport
 from . import popcorn_activity_sport_category
 from . import res_company
@@ -22,6 +26,8 @@ from . import res_config_settings
 from . import product_template
 from . import sale_order_line
 from . import website_sale_product_template
+from . import payment_provider
+from . import payment_method
 from . import payment_transaction
 
 
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, models
+
+
+class PaymentMethod(models.Model):
+    _inherit = 'payment.method'
+
+    # Payment methods are cached per provider for the checkout routes (see
+    # payment.provider._popcorn_payment_method_id).
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        methods = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return methods
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
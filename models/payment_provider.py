@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import api, models, tools
+
+_logger = logging.getLogger(__name__)
+
+
+class PaymentProvider(models.Model):
+    _inherit = 'payment.provider'
+
+    # Provider registry of the checkout routes. Which providers are enabled
+    # and which payment method each one uses changes once in a blue moon, so
+    # the ids are cached per website and company until a provider or payment
+    # method is written.
+
+    @api.model
+    def _popcorn_get_enabled_providers(self, website):
+        """Enabled providers offered at checkout on `website`"""
+        return self.sudo().browse(self._popcorn_enabled_provider_ids(website.id, website.company_id.id))
+
+    @api.model
+    def _popcorn_get_enabled_provider(self, provider_id, website):
+        """The provider picked at checkout if it is enabled on `website`, else an empty recordset"""
+        try:
+            provider_id = int(provider_id)
+        except (ValueError, TypeError):
+            return self.sudo().browse()
+        if provider_id not in self._popcorn_enabled_provider_ids(website.id, website.company_id.id):
+            return self.sudo().browse()
+        return self.sudo().browse(provider_id)
+
+    @api.model
+    def _popcorn_get_provider(self, code, website):
+        """Enabled and published provider of `code` for `website` (e.g. 'wechat', 'alipay')"""
+        return self.sudo().browse(self._popcorn_published_provider_id(code, website.id, website.company_id.id))
+
+    @tools.ormcache('website_id', 'company_id')
+    def _popcorn_enabled_provider_ids(self, website_id, company_id):
+        return tuple(self.sudo().search(self._popcorn_provider_domain(website_id, company_id)).ids)
+
+    @tools.ormcache('code', 'website_id', 'company_id')
+    def _popcorn_published_provider_id(self, code, website_id, company_id):
+        domain = self._popcorn_provider_domain(website_id, company_id)
+        return self.sudo().search(domain + [('code', '=', code), ('is_published', '=', True)], limit=1).id
+
+    def _popcorn_provider_domain(self, website_id, company_id):
+        return [
+            ('state', '=', 'enabled'),
+            ('company_id', 'in', [company_id, False]),
+            ('website_id', 'in', [website_id, False]),
+        ]
+
+    def _popcorn_get_payment_method(self):
+        """Payment method used for transactions of this provider, created the first time it is missing"""
+        self.ensure_one()
+        method_id = self._popcorn_payment_method_id(self.id)
+        if not method_id:
+            method_id = self.sudo()._popcorn_create_payment_method()
+        return self.env['payment.method'].sudo().browse(method_id)
+
+    @tools.ormcache('provider_id')
+    def _popcorn_payment_method_id(self, provider_id):
+        return self.env['payment.method'].sudo().search([
+            ('provider_ids', 'in', provider_id),
+            ('active', '=', True),
+        ], limit=1).id
+
+    def _popcorn_create_payment_method(self):
+        # Update the provider row so concurrent checkouts create a single
+        # method: at REPEATABLE READ the second one fails to serialize once
+        # the first commits, and the request is retried on a fresh snapshot
+        # that finds the first one's. A plain FOR UPDATE would let it go on
+        # with its old snapshot and create a duplicate.
+        self.env.cr.execute("UPDATE payment_provider SET write_date = write_date WHERE id = %s", (self.id,))
+        PaymentMethod = self.env['payment.method'].sudo()
+        method = PaymentMethod.search([('provider_ids', 'in', self.id), ('active', '=', True)], limit=1)
+        if method:
+            # Created by an earlier checkout after this process cached the miss
+            self.env.registry.clear_cache()
+        else:
+            _logger.info("Creating default payment method for provider %s", self.name)
+            method = PaymentMethod.create({
+                'name': f'{self.name} Payment',
+                'code': self.code.lower().replace(' ', '_'),
+                'provider_ids': [(6, 0, [self.id])],
+                'active': True,
+            })
+        return method.id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        providers = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return providers
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
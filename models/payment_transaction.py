@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import json
 import logging
+from datetime import timedelta
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
+# Queued transactions processed per cron run; the cron re-triggers itself
+# while more are due.
+POPCORN_PROCESSING_BATCH_SIZE = 50
+
+# Minutes to wait before each retry of a failed processing attempt. Once
+# they are used up the transaction waits for an administrator.
+POPCORN_PROCESSING_RETRY_MINUTES = (1, 5, 15, 60, 240)
+
 
 class PaymentTransaction(models.Model):
     _inherit = 'payment.transaction'
@@ -86,81 +98,214 @@ class PaymentTransaction(models.Model):
         help='Whether this transaction has been processed for popcorn (membership/event creation)'
     )
     
+    # Fulfilment queue: done transactions wait here for the processing cron
+    popcorn_next_attempt_at = fields.Datetime(
+        string='Popcorn Processing Due',
+        index=True,
+        copy=False,
+        help='When the processing cron picks this transaction up; empty when nothing is queued'
+    )
+    popcorn_processing_attempts = fields.Integer(
+        string='Popcorn Processing Attempts',
+        default=0,
+        copy=False,
+        help='Failed attempts to create the membership/event registration of this transaction'
+    )
+    popcorn_processing_error = fields.Text(
+        string='Popcorn Processing Error',
+        copy=False,
+        help='Error of the last failed processing attempt'
+    )
+    
+    # What this transaction fulfils. Upgrades link the existing membership at
+    # checkout; new memberships and registrations are linked when created.
+    popcorn_membership_id = fields.Many2one(
+        'popcorn.membership',
+        string='Popcorn Membership',
+        index='btree_not_null',
+        copy=False,
+        readonly=True,
+        ondelete='set null',
+        help='Membership created or upgraded by this transaction'
+    )
+    popcorn_registration_id = fields.Many2one(
+        'event.registration',
+        string='Popcorn Registration',
+        index='btree_not_null',
+        copy=False,
+        readonly=True,
+        ondelete='set null',
+        help='Event registration created by this transaction'
+    )
+    
+    _sql_constraints = [
+        ('popcorn_registration_uniq', 'unique(popcorn_registration_id)',
+         'An event registration is paid by one transaction only'),
+    ]
+    
+    def init(self):
+        # Link transactions fulfilled before the links existed
+        self.env.cr.execute("""
+            UPDATE payment_transaction tx SET popcorn_membership_id = m.id
+              FROM popcorn_membership m
+             WHERE m.payment_transaction_id = tx.id AND tx.popcorn_membership_id IS NULL
+        """)
+        self.env.cr.execute("""
+            UPDATE payment_transaction tx SET popcorn_registration_id = r.id
+              FROM (SELECT DISTINCT ON (payment_transaction_id) id, payment_transaction_id
+                      FROM event_registration
+                     WHERE payment_transaction_id IS NOT NULL
+                  ORDER BY payment_transaction_id, id) r
+             WHERE r.payment_transaction_id = tx.id AND tx.popcorn_registration_id IS NULL
+        """)
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        transactions = super().create(vals_list)
+        for transaction in transactions.filtered('is_upgrade'):
+            transaction._link_upgraded_membership()
+        return transactions
+    
+    def _link_upgraded_membership(self):
+        """Link an upgrade to the membership it upgrades, as chosen at checkout"""
+        self.ensure_one()
+        details = self.upgrade_details
+        if isinstance(details, str):
+            try:
+                details = json.loads(details)
+            except (json.JSONDecodeError, TypeError):
+                details = None
+        try:
+            membership_id = int((details or {}).get('membership_id') or 0)
+        except (ValueError, TypeError):
+            membership_id = 0
+        membership = self.env['popcorn.membership'].browse(membership_id).exists()
+        # Ownership is checked again when the upgrade is processed; a foreign
+        # membership is simply not linked.
+        if membership and membership.partner_id == self.partner_id:
+            self.popcorn_membership_id = membership
+    
+    def _get_popcorn_membership(self):
+        """Membership this transaction created or upgraded, once it is processed"""
+        self.ensure_one()
+        if not self.popcorn_processed:
+            return self.env['popcorn.membership']
+        return self.popcorn_membership_id
+    
     def write(self, vals):
-        """Override write to detect state changes and process popcorn transactions
+        """Override write to detect state changes and queue popcorn transactions
         
         This handles cases where wechat_payment_gateway bypasses _set_done() 
         and writes state directly due to TypeError compatibility issues.
         """
-        # Check if state is being changed to 'done' (before write)
-        state_changing_to_done = (
-            vals.get('state') == 'done' and 
-            any(t.state != 'done' for t in self)
-        )
-        
-        # Store current popcorn_processed flags before write
-        pre_write_processed = {t.id: t.popcorn_processed for t in self}
-        
-        # Call parent write first
         res = super().write(vals)
-        
-        # Process popcorn transactions if state just changed to 'done'
-        # Only process if not already processed (prevents duplicates)
-        if state_changing_to_done:
-            for transaction in self:
-                # Only process if:
-                # 1. It's a popcorn transaction
-                # 2. It wasn't processed before the write
-                # 3. State is now 'done'
-                # 4. Still not processed (safety check)
-                if (transaction.popcorn_transaction_type and 
-                    not pre_write_processed.get(transaction.id, False) and
-                    not transaction.popcorn_processed and 
-                    transaction.state == 'done'):
-                    try:
-                        _logger.info(f"State changed to 'done' via write() for transaction {transaction.reference}, "
-                                   f"processing popcorn transaction")
-                        transaction._process_popcorn_transaction()
-                    except Exception as e:
-                        _logger.error(
-                            f"Error processing popcorn transaction {transaction.reference}: {str(e)}",
-                            exc_info=True
-                        )
-                        # Don't fail the transaction, just log the error
-        
+        if vals.get('state') == 'done':
+            self._enqueue_popcorn_processing()
         return res
     
     def _set_done(self, state_message=None, write_state=True):
-        """Override to automatically create membership/event when payment is confirmed"""
+        """Override to queue membership/event creation when payment is confirmed"""
         res = super()._set_done(state_message=state_message, write_state=write_state)
+        self._enqueue_popcorn_processing()
+        return res
+    
+    def _enqueue_popcorn_processing(self):
+        """Queue done popcorn transactions for the processing cron
         
-        # Only process popcorn transactions that haven't been processed yet
-        # This handles cases where _set_done() is called normally
-        for transaction in self:
-            if (transaction.popcorn_transaction_type and 
-                not transaction.popcorn_processed and 
-                transaction.state == 'done'):
-                try:
-                    _logger.info(f"_set_done() called for transaction {transaction.reference}, "
-                               f"processing popcorn transaction")
+        Memberships, contracts and registrations are no longer created inside
+        the payment provider's webhook request, which can then be acknowledged
+        right away. The success pages already poll until the membership exists.
+        """
+        to_queue = self.filtered(
+            lambda t: t.popcorn_transaction_type and t.state == 'done'
+                      and not t.popcorn_processed and not t.popcorn_next_attempt_at
+        )
+        if not to_queue:
+            return
+        to_queue.write({
+            'popcorn_next_attempt_at': fields.Datetime.now(),
+            'popcorn_processing_attempts': 0,
+            'popcorn_processing_error': False,
+        })
+        _logger.info(f"Queued popcorn processing for transaction(s) {', '.join(to_queue.mapped('reference'))}")
+        cron = self.env.ref('popcorn.ir_cron_popcorn_payment_processing', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+    
+    @api.model
+    @traced('cron.payment_processing')
+    def _cron_process_popcorn_transactions(self):
+        """Create the memberships/event registrations of queued transactions
+        
+        Each transaction is processed and committed on its own, so one failing
+        payment neither blocks nor rolls back the others. Failures are retried
+        after POPCORN_PROCESSING_RETRY_MINUTES, then left for an administrator
+        with their error.
+        """
+        transactions = self.search([
+            ('popcorn_next_attempt_at', '!=', False),
+            ('popcorn_next_attempt_at', '<=', fields.Datetime.now()),
+            ('popcorn_processed', '=', False),
+            ('state', '=', 'done'),
+        ], order='popcorn_next_attempt_at, id', limit=POPCORN_PROCESSING_BATCH_SIZE)
+        for transaction in transactions:
+            try:
+                with self.env.cr.savepoint():
                     transaction._process_popcorn_transaction()
-                except Exception as e:
-                    _logger.error(
-                        f"Error processing popcorn transaction {transaction.reference}: {str(e)}",
-                        exc_info=True
-                    )
-                    # Don't fail the transaction, just log the error
+            except Exception as e:
+                _logger.error(
+                    f"Error processing popcorn transaction {transaction.reference}: {str(e)}",
+                    exc_info=True
+                )
+                transaction._schedule_popcorn_retry(str(e))
+            self.env.cr.commit()
+        if len(transactions) == POPCORN_PROCESSING_BATCH_SIZE:
+            self.env.ref('popcorn.ir_cron_popcorn_payment_processing')._trigger()
+    
+    def _schedule_popcorn_retry(self, error):
+        """Record a failed processing attempt and plan the next one, if any is left"""
+        self.ensure_one()
+        self.invalidate_recordset()
+        attempts = self.popcorn_processing_attempts + 1
+        if attempts > len(POPCORN_PROCESSING_RETRY_MINUTES):
+            next_attempt = False
+            _logger.error(f"Giving up processing popcorn transaction {self.reference} after {attempts} attempts")
+        else:
+            next_attempt = fields.Datetime.now() + timedelta(minutes=POPCORN_PROCESSING_RETRY_MINUTES[attempts - 1])
+        self.write({
+            'popcorn_processing_attempts': attempts,
+            'popcorn_processing_error': error,
+            'popcorn_next_attempt_at': next_attempt,
+        })
+    
+    def action_retry_popcorn_processing(self):
+        """Queue transactions that ran out of processing attempts again"""
+        self.filtered(lambda t: not t.popcorn_processed).write({'popcorn_next_attempt_at': False})
+        self._enqueue_popcorn_processing()
+    
+    def _claim_popcorn_processing(self):
+        """Mark the transaction processed unless someone already did; True for the winner
         
-        return res
+        The row lock taken by the UPDATE makes a concurrent claim wait for this
+        database transaction to end: it then finds the flag set and backs off.
+        If this transaction rolls back, the claim goes with it and the
+        processing can be retried.
+        """
+        self.ensure_one()
+        self.env.cr.execute("""
+            UPDATE payment_transaction
+               SET popcorn_processed = true, popcorn_next_attempt_at = NULL
+             WHERE id = %s AND popcorn_processed IS NOT TRUE
+         RETURNING id
+        """, (self.id,))
+        claimed = bool(self.env.cr.fetchone())
+        self.invalidate_recordset(['popcorn_processed', 'popcorn_next_attempt_at'])
+        return claimed
     
     def _process_popcorn_transaction(self):
         """Process popcorn transaction and create membership/event registration"""
         self.ensure_one()
         
-        if self.popcorn_processed:
-            _logger.info(f"Transaction {self.reference} already processed, skipping")
-            return
-        
         if not self.popcorn_transaction_type:
             _logger.debug(f"Transaction {self.reference} is not a popcorn transaction, skipping")
             return
@@ -169,21 +314,24 @@ class PaymentTransaction(models.Model):
             _logger.debug(f"Transaction {self.reference} not in done state ({self.state}), skipping")
             return
         
+        # Claim first, in the same database transaction as the fulfilment,
+        # so concurrent webhook retries and cron workers never both process it
+        if not self._claim_popcorn_processing():
+            _logger.info(f"Transaction {self.reference} already processed, skipping")
+            return
+        
         _logger.info(f"Processing popcorn transaction {self.reference}, type: {self.popcorn_transaction_type}")
         
         if self.popcorn_transaction_type == 'membership':
-            self._process_membership_transaction()
+            self.popcorn_membership_id = self._process_membership_transaction()
         elif self.popcorn_transaction_type == 'event':
-            self._process_event_transaction()
+            self.popcorn_registration_id = self._process_event_transaction()
         elif self.popcorn_transaction_type == 'product':
             # Product transactions are handled by sale orders automatically
             _logger.debug(f"Product transaction {self.reference} handled by sale order system")
             pass
         else:
             _logger.warning(f"Unknown popcorn transaction type: {self.popcorn_transaction_type}")
-        
-        # Mark as processed to prevent duplicate processing
-        self.write({'popcorn_processed': True})
     
     def _process_membership_transaction(self):
         """Process membership purchase transaction"""
@@ -227,7 +375,6 @@ class PaymentTransaction(models.Model):
             upgrade_details_dict = {}
             if self.upgrade_details:
                 if isinstance(self.upgrade_details, str):
-                    import json
                     try:
                         upgrade_details_dict = json.loads(self.upgrade_details)
                     except (json.JSONDecodeError, TypeError):
@@ -2,6 +2,7 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from .popcorn_tracing import traced
 
 
 class Badge(models.Model):
@@ -56,6 +57,7 @@ class Badge(models.Model):
             else:
                 badge.earned = False
     
+    @traced('badge.evaluate')
     def _evaluate_badge_for_partner(self, partner):
         """Evaluate if a partner has earned this badge based on all rules.
         Once a badge is in permanently_earned_badge_ids it is always considered earned."""
@@ -2,6 +2,7 @@
 
 from odoo import models, fields, api
 import logging
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
@@ -19,6 +20,7 @@ class BadgePrize(models.Model):
     expired = fields.Boolean('Expired', default=False, index=True)
 
     @api.model
+    @traced('cron.expire_badge_prizes')
     def _cron_expire_badge_prizes(self):
         """Deduct expired badge prize money from partner balances"""
         today = fields.Date.today()
@@ -2,6 +2,7 @@
 
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
+from .popcorn_tracing import traced
 
 class PopcornContract(models.Model):
     """Membership contracts for storing contract text and terms"""
@@ -232,6 +233,7 @@ class PopcornContract(models.Model):
         }
     
     @api.model
+    @traced('cron.expire_contracts')
     def _cron_expire_contracts(self):
         """Cron job to expire contracts past their expiry date"""
         expired_contracts = self.search([
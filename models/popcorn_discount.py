@@ -2,6 +2,7 @@
 
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
+from .popcorn_tracing import traced
 
 
 class PopcornDiscount(models.Model):
@@ -152,6 +153,15 @@ class PopcornDiscount(models.Model):
             else:
                 discount.remaining_usage = max(0, discount.usage_limit - discount.usage_count)
 
+    def _get_customer_type_codes(self):
+        """Customer type codes this discount is restricted to; empty means everyone"""
+        self.ensure_one()
+        if self.customer_type == 'all':
+            return frozenset()
+        if self.customer_type == 'multiple':
+            return frozenset(self.customer_type_ids.mapped('code'))
+        return frozenset({self.customer_type})
+
     def _customer_matches_types(self, customer_partner, event_type=None):
         """Check if customer matches the discount's customer type restrictions.
 
@@ -160,34 +170,10 @@ class PopcornDiscount(models.Model):
         self.ensure_one()
         if not customer_partner:
             return True
-        if self.customer_type == 'all':
-            return True
-        if self.customer_type == 'multiple':
-            if not self.customer_type_ids:
-                return True  # No types selected = all
-            for ct in self.customer_type_ids:
-                if ct.code == 'first_timer' and customer_partner.is_first_timer:
-                    return True
-                if ct.code == 'existing' and not customer_partner.is_first_timer:
-                    return True
-                if ct.code == 'new' and customer_partner.is_first_timer:
-                    return True
-                if ct.code == 'old' and event_type != 'regular_online':
-                    if customer_partner.has_expired_membership or customer_partner.pdb:
-                        return True
-            return False
-        # Single selection (existing behavior)
-        if self.customer_type == 'first_timer':
-            return customer_partner.is_first_timer
-        if self.customer_type == 'existing':
-            return not customer_partner.is_first_timer
-        if self.customer_type == 'new':
-            return customer_partner.is_first_timer
-        if self.customer_type == 'old':
-            if event_type == 'regular_online':
-                return False
-            return customer_partner.has_expired_membership or customer_partner.pdb
-        return True
+        codes = self._get_customer_type_codes()
+        if not codes:
+            return True  # All customers, or Multiple with no types selected
+        return bool(codes & customer_partner._get_customer_segments(event_type))
 
     def _compute_days_until_expiry(self):
         """Compute days until the discount's valid-to date."""
@@ -242,6 +228,44 @@ class PopcornDiscount(models.Model):
             if discount.usage_limit_per_customer < 0:
                 raise ValidationError(_('Per customer limit cannot be negative'))
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        discounts = super().create(vals_list)
+        if discounts._get_catalogue_listed():
+            self.env['popcorn.membership.plan']._bump_catalogue_version()
+        return discounts
+
+    def write(self, vals):
+        """Keep the cached plan catalogue in step with the discounts it lists.
+
+        Customer coupons and code discounts are never listed, so writing
+        them leaves the catalogue alone. Using a discount only bumps
+        usage_count, which matters to the catalogue only when it exhausts
+        (or a reset revives) the discount.
+        """
+        usage_only = set(vals) == {'usage_count'}
+        listed = self._get_catalogue_listed()
+        valid_before = {discount.id: discount._is_currently_valid() for discount in listed} if usage_only else {}
+        res = super().write(vals)
+        if usage_only:
+            changed = any(discount._is_currently_valid() != valid_before[discount.id] for discount in listed)
+        else:
+            changed = bool(listed or self._get_catalogue_listed())
+        if changed:
+            self.env['popcorn.membership.plan']._bump_catalogue_version()
+        return res
+
+    def unlink(self):
+        listed = self._get_catalogue_listed()
+        res = super().unlink()
+        if listed:
+            self.env['popcorn.membership.plan']._bump_catalogue_version()
+        return res
+
+    def _get_catalogue_listed(self):
+        """Discounts of self the plan catalogue can list: no customer, no code"""
+        return self.filtered(lambda discount: not discount.partner_id and not discount.code)
+
     def action_increment_usage(self):
         """Increment usage count (called when discount is applied)"""
         self.ensure_one()
@@ -262,8 +286,7 @@ class PopcornDiscount(models.Model):
             partners = self.env['res.partner'].sudo().search([
                 ('first_timer_discount_code', '=', self.code)
             ])
-            for partner in partners:
-                partner._compute_first_timer_discount_status()
+            partners._compute_first_timer_discount_status()
         
         return True
 
@@ -277,8 +300,7 @@ class PopcornDiscount(models.Model):
             partners = self.env['res.partner'].sudo().search([
                 ('first_timer_discount_code', '=', self.code)
             ])
-            for partner in partners:
-                partner._compute_first_timer_discount_status()
+            partners._compute_first_timer_discount_status()
         
         # Log the reset
         self.message_post(
@@ -430,6 +452,7 @@ class PopcornDiscount(models.Model):
         }
 
     @api.model
+    @traced('cron.expire_discounts')
     def _cron_check_expired_discounts(self):
         """Cron job to deactivate expired discounts"""
         expired_discounts = self.search([
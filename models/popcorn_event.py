@@ -1,8 +1,9 @@
 from odoo import models, fields, api, _
-from odoo.exceptions import AccessError, ValidationError
+from odoo.exceptions import AccessError, UserError, ValidationError
 from odoo.http import request
 import logging
 from datetime import timedelta
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
@@ -268,30 +269,13 @@ class EventEvent(models.Model):
         if not partner or not self.date_begin:
             return False, None
         
-        # Get all frozen memberships for this partner
-        frozen_memberships = self.env['popcorn.membership'].sudo().search([
-            ('partner_id', '=', partner.id),
-            ('freeze_active', '=', True)
-        ])
-        
-        if not frozen_memberships:
+        # Partner's freeze intervals, loaded once per transaction
+        Membership = self.env['popcorn.membership'].sudo()
+        freeze_index = Membership._get_freeze_intervals(partner)
+        interval = Membership._find_freeze_interval(freeze_index, self.date_begin.date())
+        if not interval:
             return False, None
-        
-        # Convert event datetime to date for comparison
-        event_date = self.date_begin.date() if self.date_begin else None
-        
-        # Check if event date falls within any freeze period
-        for membership in frozen_memberships:
-            if membership.freeze_start and membership.freeze_end:
-                is_frozen = (membership.freeze_start <= event_date <= membership.freeze_end)
-                
-                # For debugging - let's log this
-                print(f"Event {self.name} on {event_date}, freeze period: {membership.freeze_start} to {membership.freeze_end}, is_frozen: {is_frozen}")
-                
-                if is_frozen:
-                    return True, membership
-        
-        return False, None
+        return True, Membership.browse(interval[2])
     
     @api.depends('host_id')
     def _compute_host_info(self):
@@ -544,6 +528,19 @@ class EventEvent(models.Model):
             if event.membership_plans_third_price_ids and (not event.third_price or event.third_price <= 0):
                 raise ValidationError(_('Third Price must be set when membership plans are selected for third pricing'))
     
+    def action_mark_attendance_bulk(self, statuses):
+        """Registration desk: set the attendance of many attendees of this event in one call.
+
+        `statuses` maps registration ids to 'attended', 'late' or 'no_show'.
+        Returns the summary counts from event.registration._mark_attendance_bulk.
+        """
+        self.ensure_one()
+        statuses = {int(registration_id): status for registration_id, status in (statuses or {}).items()}
+        registrations = self.env['event.registration'].browse(list(statuses)).exists()
+        if len(registrations) != len(statuses) or registrations.event_id != self:
+            raise UserError(_('Some of these attendees are not registered for this event.'))
+        return registrations._mark_attendance_bulk(statuses)
+
     def can_register_with_membership(self, membership):
         """Check if a specific membership can be used for this event"""
         self.ensure_one()
@@ -551,12 +548,10 @@ class EventEvent(models.Model):
         if not membership or not self.club_type:
             return False
         
+        plan = membership.membership_plan_id
+
         # Check club type permissions
-        if self.club_type == 'regular_offline' and not membership.plan_allowed_regular_offline:
-            return False
-        elif self.club_type == 'regular_online' and not membership.plan_allowed_regular_online:
-            return False
-        elif self.club_type == 'spclub' and not membership.plan_allowed_spclub:
+        if not plan._is_club_type_allowed(self.club_type):
             return False
         
         # Check if membership has sufficient quota
@@ -570,20 +565,7 @@ class EventEvent(models.Model):
             elif self.club_type == 'spclub' and membership.remaining_sp <= 0:
                 return False
         elif membership.plan_quota_mode == 'points':
-            # Get points from membership plan
-            plan = membership.membership_plan_id
-            if self.club_type == 'regular_offline':
-                points_needed = plan.points_per_offline
-            elif self.club_type == 'regular_online':
-                points_needed = plan.points_per_online
-            elif self.club_type == 'spclub':
-                points_needed = plan.points_per_sp
-            elif self.club_type == 'social_experience':
-                points_needed = plan.points_per_social_experience
-            else:
-                points_needed = 0
-            
-            if membership.points_remaining < points_needed:
+            if membership.points_remaining < plan._get_points_cost(self.club_type):
                 return False
         
         return True
@@ -651,15 +633,16 @@ class EventEvent(models.Model):
                 for i, reg in enumerate(remaining_waitlist, 1):
                     reg.write({'waitlist_position': i})
     
+    @traced('waitlist.promote')
     def _safe_promote_from_waitlist(self):
         """Safely promote waitlist registrations to handle concurrent cancellations"""
         self.ensure_one()
         
         # Simplified promotion logic that calculates available seats and promotes accordingly
-        _logger.info("Event %s: Starting safe waitlist promotion" % self.id)
+        _logger.debug("Event %s: Starting safe waitlist promotion", self.id)
         
         if not self.seats_limited:
-            _logger.info("Event %s: No promotion needed (seats not limited)" % self.id)
+            _logger.debug("Event %s: No promotion needed (seats not limited)", self.id)
             return
         
         # Calculate available seats
@@ -668,10 +651,10 @@ class EventEvent(models.Model):
         )
         available_seats = max(0, self.seats_max - len(confirmed_registrations))
         
-        _logger.info("Event %s: Available seats: %s (confirmed: %s, max: %s)" % (self.id, available_seats, len(confirmed_registrations), self.seats_max))
+        _logger.debug("Event %s: Available seats: %s (confirmed: %s, max: %s)", self.id, available_seats, len(confirmed_registrations), self.seats_max)
         
         if available_seats <= 0:
-            _logger.info("Event %s: No seats available for promotion" % self.id)
+            _logger.debug("Event %s: No seats available for promotion", self.id)
             return
         
         # Get waitlist registrations in order
@@ -682,7 +665,7 @@ class EventEvent(models.Model):
         # Promote up to the number of available seats
         promotions_needed = min(available_seats, len(waitlist_registrations))
         
-        _logger.info("Event %s: Found %s waitlist registrations, promoting %s" % (self.id, len(waitlist_registrations), promotions_needed))
+        _logger.debug("Event %s: Found %s waitlist registrations, promoting %s", self.id, len(waitlist_registrations), promotions_needed)
         
         if promotions_needed <= 0:
             return
@@ -693,7 +676,7 @@ class EventEvent(models.Model):
             reg = waitlist_registrations[i]
             promoted_registrations.append(reg)
             
-            _logger.info("Event %s: Promoting registration %s - Partner: %s (position: %s)" % (self.id, reg.id, reg.partner_id.name, reg.waitlist_position))
+            _logger.debug("Event %s: Promoting registration %s - Partner: %s (position: %s)", self.id, reg.id, reg.partner_id.name, reg.waitlist_position)
             
             # Update registration
             reg.write({
@@ -714,25 +697,26 @@ class EventEvent(models.Model):
                         body=_('Automatically promoted from waitlist to confirmed registration')
                     )
             except Exception as e:
-                _logger.warning("Could not post message to registration %s: %s" % (reg.id, e))
+                _logger.warning("Could not post message to registration %s: %s", reg.id, e)
         
         # Update remaining waitlist positions
         remaining_waitlist = waitlist_registrations[promotions_needed:]
         for i, reg in enumerate(remaining_waitlist, 1):
             reg.write({'waitlist_position': i})
         
-        _logger.info("Event %s: Successfully promoted %s registrations from waitlist" % (self.id, len(promoted_registrations)))
+        _logger.info("Event %s: Successfully promoted %s registrations from waitlist", self.id, len(promoted_registrations))
     
+    @traced('waitlist.promote')
     def _promote_waitlist_safe(self):
         """Simple safe waitlist promotion method with database-level locking"""
         self.ensure_one()
         
-        _logger.info("=== WAITLIST PROMOTION DEBUG ===")
-        _logger.info("Event ID: %s, Seats Limited: %s, Seats Max: %s" % (self.id, self.seats_limited, self.seats_max))
+        _logger.debug("=== WAITLIST PROMOTION DEBUG === Event ID: %s, Seats Limited: %s, Seats Max: %s",
+                      self.id, self.seats_limited, self.seats_max)
         
         try:
             if not self.seats_limited:
-                _logger.info("Event %s: No promotion needed (seats not limited)" % self.id)
+                _logger.debug("Event %s: No promotion needed (seats not limited)", self.id)
                 return
             
             # Use database-level locking to prevent concurrent promotions (similar to Odoo stock module)
@@ -755,10 +739,10 @@ class EventEvent(models.Model):
             ))
             
             available_seats = max(0, event.seats_max - confirmed_count)
-            _logger.info("Event %s: Confirmed count: %s, Available seats: %s" % (event.id, confirmed_count, available_seats))
+            _logger.debug("Event %s: Confirmed count: %s, Available seats: %s", event.id, confirmed_count, available_seats)
             
             if available_seats <= 0:
-                _logger.info("Event %s: No seats available for promotion" % event.id)
+                _logger.debug("Event %s: No seats available for promotion", event.id)
                 return
             
             waitlist_regs = event.registration_ids.filtered(
@@ -766,16 +750,16 @@ class EventEvent(models.Model):
             ).sorted('waitlist_position')
             
             promotions_count = min(available_seats, len(waitlist_regs))
-            _logger.info("Event %s: Found %s waitlist registrations, promoting %s" % (event.id, len(waitlist_regs), promotions_count))
+            _logger.debug("Event %s: Found %s waitlist registrations, promoting %s", event.id, len(waitlist_regs), promotions_count)
 
             if promotions_count <= 0:
-                _logger.info("Event %s: No promotions to perform" % event.id)
+                _logger.debug("Event %s: No promotions to perform", event.id)
                 return
 
             # Perform all promotions while still holding the lock
             for i in range(promotions_count):
                 reg = waitlist_regs[i]
-                _logger.info("Event %s: Promoting registration %s - Partner: %s (position: %s)" % (event.id, reg.id, reg.partner_id.name, reg.waitlist_position))
+                _logger.debug("Event %s: Promoting registration %s - Partner: %s (position: %s)", event.id, reg.id, reg.partner_id.name, reg.waitlist_position)
 
                 reg.write({
                     'is_on_waitlist': False,
@@ -791,12 +775,12 @@ class EventEvent(models.Model):
             for i, reg in enumerate(remaining_regs, 1):
                 reg.write({'waitlist_position': i})
 
-            _logger.info("Event %s: Successfully promoted %s registrations from waitlist" % (event.id, promotions_count))
+            _logger.info("Event %s: Successfully promoted %s registrations from waitlist", event.id, promotions_count)
                 
         except Exception as e:
-            _logger.error("Error in waitlist promotion: %s" % str(e))
+            _logger.error("Error in waitlist promotion: %s", str(e))
             import traceback
-            _logger.error("Full traceback: %s" % traceback.format_exc())
+            _logger.error("Full traceback: %s", traceback.format_exc())
     
     def _auto_promote_waitlist(self):
         """Automatically promote waitlist registrations when seats become available"""
@@ -995,9 +979,10 @@ class EventEvent(models.Model):
     
     def _send_notifications_for_promoted_registrations(self):
         """
-        Send notifications (including WeChat) for registrations that were promoted 
+        Queue notifications (including WeChat) for registrations that were promoted 
         from waitlist and survived overbooking correction.
-        Uses the notification configured in system settings.
+        Uses the notification configured in system settings; delivery happens
+        in the notification outbox.
         """
         self.ensure_one()
         
@@ -1033,38 +1018,10 @@ class EventEvent(models.Model):
             )
             return
         
-        # Send notifications for each promoted registration
-        for reg in promoted_registrations:
-            partner = reg.partner_id
-            if not partner:
-                continue
-            
-            try:
-                # Evaluate rules first
-                if not promotion_notification._evaluate_notification_for_partner(partner):
-                    _logger.debug(
-                        f'Promotion notification rules did not match for partner {partner.id}'
-                    )
-                    continue
-                
-                # Rules passed! Get notification data and send
-                # This will automatically send WeChat if configured
-                # Pass the specific registration so event-specific placeholders work correctly
-                notification_data = promotion_notification.get_notification_data_for_partner(partner, registration=reg)
-                
-                if notification_data:
-                    # Notification was sent (WeChat sending happens automatically)
-                    reg.write({'pending_wechat_notification': False})
-                    _logger.info(
-                        f'Promotion notification "{promotion_notification.name}" sent to partner {partner.id} '
-                        f'for registration {reg.id} on event {self.id}'
-                    )
-            except Exception as e:
-                _logger.error(
-                    f'Error sending promotion notification for partner {partner.id}: {str(e)}',
-                    exc_info=True
-                )
-                # Keep flag set so it can be retried
+        # Queue them: the outbox cron sends after this transaction, so the
+        # event lock taken by the overbooking correction is not held while
+        # waiting on WeChat. The flag stays set until the outbox is done.
+        self.env['popcorn.notification.outbox'].sudo()._enqueue(promotion_notification, promoted_registrations)
     
     @api.model
     def _search_get_detail(self, website, order, options):
@@ -1205,6 +1162,7 @@ class EventEvent(models.Model):
         return True
     
     @api.model
+    @traced('cron.auto_mark_ended_events')
     def _auto_mark_ended_events(self):
         """Automatically mark events as ended 15 minutes after they finish"""
         now = fields.Datetime.now()
@@ -1283,6 +1241,7 @@ class EventEvent(models.Model):
         return len(events_to_end)
 
     @api.model
+    @traced('cron.correct_overbooking')
     def _cron_popcorn_correct_overbooking_new_events(self):
         """Cron job to correct overbooking on newly published events."""
 
@@ -1,12 +1,38 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import logging
+from collections import defaultdict
+
+import pytz
+from markupsafe import Markup
+
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
 from datetime import datetime, timedelta
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
+# Attendance flags set by each bulk desk status. Attended and late
+# attendees are also moved to done, no-shows keep their state.
+ATTENDANCE_STATUS_VALS = {
+    'attended': {'is_late_attendance': False, 'is_no_show_attendance': False},
+    'late': {'is_late_attendance': True, 'is_no_show_attendance': False},
+    'no_show': {'is_late_attendance': False, 'is_no_show_attendance': True},
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_timezone(name):
+    """pytz timezone for a tz name, resolved once per process; None for unknown names"""
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        _logger.error("Unknown timezone %r, event times will be left empty", name)
+        return None
+
+
 class PopcornEventRegistration(models.Model):
     """Extends event registration with Popcorn Club specific logic"""
     _inherit = 'event.registration'
@@ -67,12 +93,16 @@ class PopcornEventRegistration(models.Model):
         'payment.transaction',
         string='Payment Transaction',
         readonly=True,
+        index='btree_not_null',
         help='Payment transaction for this registration (for single club purchases)'
     )
     
     # Computed fields for registration desk
     event_host = fields.Char(string='Host', related='event_id.host_id.name', readonly=True, store=True)
-    event_start_time = fields.Datetime(string='Club Start Time', related='event_id.date_begin', readonly=True, store=True)
+    event_start_time = fields.Datetime(string='Club Start Time', related='event_id.date_begin', readonly=True, store=True,
+                                       index=True)
+    event_date_end = fields.Datetime(string='Club End Time', related='event_id.date_end', readonly=True, store=True,
+                                     index=True, help='Stored so portal lists split and sort registrations in SQL')
     is_late_attendance = fields.Boolean(
         string='Late Attendance',
         default=False,
@@ -134,10 +164,10 @@ class PopcornEventRegistration(models.Model):
     event_name = fields.Char(string='Event Name', related='event_id.name', readonly=True)
     event_chinese_name = fields.Char(string='Event Chinese Name', related='event_id.event_chinese_name', readonly=True)
     event_venue_name = fields.Char(string='Venue Name', related='event_id.address_id.name', readonly=True)
-    event_time_formatted = fields.Char(string='Event Time', compute='_compute_event_time_formatted', store=False)
-    event_time_wechat = fields.Char(string='Event Time (WeChat)', compute='_compute_event_time_wechat', store=False, 
+    event_time_formatted = fields.Char(string='Event Time', compute='_compute_event_time_texts', store=False)
+    event_time_wechat = fields.Char(string='Event Time (WeChat)', compute='_compute_event_time_texts', store=False, 
                                     help='Event time in 24-hour format (HH:mm) for WeChat template messages')
-    event_datetime_wechat = fields.Char(string='Event Date and Time (WeChat)', compute='_compute_event_datetime_wechat', store=False,
+    event_datetime_wechat = fields.Char(string='Event Date and Time (WeChat)', compute='_compute_event_time_texts', store=False,
                                         help='Event date and time formatted for WeChat (YYYY-MM-DD HH:mm format)')
     
     def _compute_hours_until_event(self):
@@ -150,118 +180,42 @@ class PopcornEventRegistration(models.Model):
             else:
                 registration.hours_until_event = 0
     
-    def _compute_event_time_formatted(self):
-        """Format event time for display in user's timezone"""
-        for registration in self:
-            if registration.event_id and registration.event_id.date_begin:
-                try:
-                    # Use Odoo's datetime context utilities for proper timezone handling
-                    # This ensures the time is displayed in the correct timezone for the notification context
-                    from odoo import fields
-                    import pytz
-                    from datetime import datetime
-                    
-                    # Get the datetime field value (always stored in UTC in Odoo)
-                    date_begin = registration.event_id.date_begin
-                    
-                    # Get timezone - prefer context, then user's tz, then partner's tz
-                    tz = (self._context.get('tz') or 
-                          (self.env.user.tz if self.env and self.env.user else None) or
-                          (registration.partner_id.tz if registration.partner_id else None) or
-                          'UTC')
-                    
-                    # If timezone-naive, localize to UTC (Odoo stores as naive UTC)
-                    if isinstance(date_begin, datetime):
-                        if date_begin.tzinfo is None:
-                            # Odoo stores datetimes as naive in UTC
-                            date_begin = pytz.UTC.localize(date_begin)
-                        
-                        # Convert to target timezone
-                        target_tz = pytz.timezone(tz)
-                        local_time = date_begin.astimezone(target_tz)
-                        
-                        # Format as "HH:MM AM/PM"
-                        registration.event_time_formatted = local_time.strftime('%I:%M %p')
-                    else:
-                        registration.event_time_formatted = ''
-                except Exception as e:
-                    _logger.error(f"Error formatting event_time_formatted for registration {registration.id}: {e}", exc_info=True)
-                    registration.event_time_formatted = ''
-            else:
-                registration.event_time_formatted = ''
-    
-    def _compute_event_time_wechat(self):
-        """Format event time in 24-hour format (HH:mm) for WeChat template messages"""
-        for registration in self:
-            if registration.event_id and registration.event_id.date_begin:
-                try:
-                    from odoo import fields
-                    import pytz
-                    from datetime import datetime
-                    
-                    # Get the datetime field value (always stored in UTC in Odoo)
-                    date_begin = registration.event_id.date_begin
-                    
-                    # Get timezone - prefer context, then user's tz, then partner's tz
-                    tz = (self._context.get('tz') or 
-                          (self.env.user.tz if self.env and self.env.user else None) or
-                          (registration.partner_id.tz if registration.partner_id else None) or
-                          'UTC')
-                    
-                    # If timezone-naive, localize to UTC (Odoo stores as naive UTC)
-                    if isinstance(date_begin, datetime):
-                        if date_begin.tzinfo is None:
-                            # Odoo stores datetimes as naive in UTC
-                            date_begin = pytz.UTC.localize(date_begin)
-                        
-                        # Convert to target timezone
-                        target_tz = pytz.timezone(tz)
-                        local_time = date_begin.astimezone(target_tz)
-                        
-                        # Format as "HH:MM" (24-hour format) for WeChat
-                        registration.event_time_wechat = local_time.strftime('%H:%M')
-                    else:
-                        registration.event_time_wechat = ''
-                except Exception as e:
-                    _logger.error(f"Error formatting event_time_wechat for registration {registration.id}: {e}", exc_info=True)
-                    registration.event_time_wechat = ''
-            else:
-                registration.event_time_wechat = ''
-    
-    def _compute_event_datetime_wechat(self):
-        """Format event date and time for WeChat template messages (YYYY-MM-DD HH:mm format)"""
+    def _compute_event_time_texts(self):
+        """Format the event start time in the reader's timezone for display and WeChat messages
+
+        One pass fills event_time_formatted ("HH:MM AM/PM"), event_time_wechat
+        ("HH:mm") and event_datetime_wechat ("YYYY-MM-DD HH:mm"). Registrations
+        are grouped by timezone, each timezone is resolved once, and each
+        start time is localized once per timezone however many registrations
+        share the event.
+        """
+        # Timezone - prefer context, then user's tz, then partner's tz
+        default_tz = self._context.get('tz') or (self.env.user.tz if self.env.user else None)
+        registrations_by_tz = defaultdict(list)
         for registration in self:
-            if registration.event_id and registration.event_id.date_begin:
-                try:
-                    import pytz
-                    from datetime import datetime
-                    
-                    date_begin = registration.event_id.date_begin
-                    
-                    # Get timezone - prefer context, then user's tz, then partner's tz
-                    tz = (self._context.get('tz') or 
-                          (self.env.user.tz if self.env and self.env.user else None) or
-                          (registration.partner_id.tz if registration.partner_id else None) or
-                          'UTC')
-                    
-                    # If timezone-naive, localize to UTC (Odoo stores as naive UTC)
-                    if isinstance(date_begin, datetime):
-                        if date_begin.tzinfo is None:
-                            date_begin = pytz.UTC.localize(date_begin)
-                        
-                        # Convert to target timezone
-                        target_tz = pytz.timezone(tz)
-                        local_time = date_begin.astimezone(target_tz)
-                        
-                        # Format as "YYYY-MM-DD HH:mm" (WeChat compatible format)
-                        registration.event_datetime_wechat = local_time.strftime('%Y-%m-%d %H:%M')
-                    else:
-                        registration.event_datetime_wechat = ''
-                except Exception as e:
-                    _logger.error(f"Error formatting event_datetime_wechat for registration {registration.id}: {e}", exc_info=True)
-                    registration.event_datetime_wechat = ''
-            else:
-                registration.event_datetime_wechat = ''
+            tz = default_tz or (registration.partner_id.tz if registration.partner_id else None) or 'UTC'
+            registrations_by_tz[tz].append(registration)
+
+        for tz, registrations in registrations_by_tz.items():
+            target_tz = _get_timezone(tz)
+            texts_by_start = {}
+            for registration in registrations:
+                date_begin = registration.event_id.date_begin
+                if not isinstance(date_begin, datetime) or target_tz is None:
+                    texts = ('', '', '')
+                elif date_begin in texts_by_start:
+                    texts = texts_by_start[date_begin]
+                else:
+                    # Odoo stores datetimes as naive in UTC
+                    local_time = pytz.UTC.localize(date_begin).astimezone(target_tz)
+                    texts = texts_by_start[date_begin] = (
+                        local_time.strftime('%I:%M %p'),
+                        local_time.strftime('%H:%M'),
+                        local_time.strftime('%Y-%m-%d %H:%M'),
+                    )
+                (registration.event_time_formatted,
+                 registration.event_time_wechat,
+                 registration.event_datetime_wechat) = texts
 
     @api.depends('is_late_attendance')
     def _compute_late_attendance_badge(self):
@@ -277,7 +231,7 @@ class PopcornEventRegistration(models.Model):
     def _compute_club_type(self):
         """Compute club type from the event's Type tag"""
         for registration in self:
-            _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] _compute_club_type called for registration {registration.id}")
+            _logger.debug("_compute_club_type called for registration %s", registration.id)
             if registration.event_id and registration.event_id.tag_ids:
                 # Look at all tags with category "Type" to determine club type
                 type_tags = registration.event_id.tag_ids.filtered(
@@ -285,13 +239,13 @@ class PopcornEventRegistration(models.Model):
                 )
                 if type_tags:
                     tag_names = [tag.name.lower() for tag in type_tags]
-                    _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Found type tags: {tag_names}")
+                    _logger.debug("Found type tags: %s", tag_names)
                     # Free for Members wins when mixed with other Type tags
                     if any('free' in name for name in tag_names):
                         registration.club_type = 'free_for_members'
                     elif any('social' in name and 'experience' in name for name in tag_names):
                         registration.club_type = 'social_experience'
-                        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Setting club_type to 'social_experience'")
+                        _logger.debug("Setting club_type to 'social_experience'")
                     elif any('sp' in name or 'special' in name for name in tag_names):
                         registration.club_type = 'spclub'
                     elif any('offline' in name for name in tag_names):
@@ -301,7 +255,7 @@ class PopcornEventRegistration(models.Model):
                     else:
                         registration.club_type = False
                 else:
-                    _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] No type tag found, using fallback")
+                    _logger.debug("No type tag found, using fallback")
                     # Fallback: determine from event properties
                     if hasattr(registration.event_id, 'is_online_event') and registration.event_id.is_online_event:
                         registration.club_type = 'regular_online'
@@ -310,8 +264,8 @@ class PopcornEventRegistration(models.Model):
             else:
                 # Default to offline if no tags
                 registration.club_type = 'regular_offline'
-                _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] No event_id or tag_ids, defaulting to 'regular_offline'")
-            _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Final club_type: {registration.club_type}")
+                _logger.debug("No event_id or tag_ids, defaulting to 'regular_offline'")
+            _logger.debug("Final club_type: %s", registration.club_type)
     
     @api.depends(
         'club_type',
@@ -341,17 +295,7 @@ class PopcornEventRegistration(models.Model):
                 registration.points_consumed = 0
                 continue
 
-            club_type = registration.club_type
-            if club_type == 'regular_offline':
-                registration.points_consumed = plan.points_per_offline
-            elif club_type == 'regular_online':
-                registration.points_consumed = plan.points_per_online
-            elif club_type == 'spclub':
-                registration.points_consumed = plan.points_per_sp
-            elif club_type == 'social_experience':
-                registration.points_consumed = plan.points_per_social_experience
-            else:
-                registration.points_consumed = 0
+            registration.points_consumed = plan._get_points_cost(registration.club_type)
     
     @api.depends('event_id', 'event_id.date_begin', 'event_id.cancellation_deadline_hours')
     def _compute_can_cancel(self):
@@ -461,11 +405,7 @@ class PopcornEventRegistration(models.Model):
             return False
         
         # Check club type permissions
-        if self.club_type == 'regular_offline' and not membership.plan_allowed_regular_offline:
-            return False
-        elif self.club_type == 'regular_online' and not membership.plan_allowed_regular_online:
-            return False
-        elif self.club_type == 'spclub' and not membership.plan_allowed_spclub:
+        if not membership.membership_plan_id._is_club_type_allowed(self.club_type):
             return False
         
         # Check if membership has sufficient quota
@@ -783,19 +723,25 @@ class PopcornEventRegistration(models.Model):
         """Automatically consume membership quota when registration is created"""
         self.ensure_one()
         
-        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] _consume_membership_quota called for registration {self.id}")
-        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] membership_id: {self.membership_id.id if self.membership_id else None}, consumption_state: {self.consumption_state}, club_type: {self.club_type}, points_consumed: {self.points_consumed}")
+        _logger.debug("_consume_membership_quota called for registration %s", self.id)
+        _logger.debug("membership_id: %s, consumption_state: %s, club_type: %s, points_consumed: %s",
+                      self.membership_id.id, self.consumption_state, self.club_type, self.points_consumed)
         
         if not self.membership_id or self.consumption_state != 'pending':
-            _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Skipping consumption - membership_id: {self.membership_id.id if self.membership_id else None}, consumption_state: {self.consumption_state}")
+            _logger.debug("Skipping consumption - membership_id: %s, consumption_state: %s",
+                          self.membership_id.id, self.consumption_state)
             return
         
         membership = self.membership_id
-        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Membership quota_mode: {membership.plan_quota_mode}, points_remaining BEFORE: {membership.points_remaining}")
+        # points_remaining is computed, only pay for it when debugging
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("Membership quota_mode: %s, points_remaining BEFORE: %s",
+                          membership.plan_quota_mode, membership.points_remaining)
         
         # Check if membership has sufficient quota BEFORE consuming
         if not self._can_consume_membership():
-            _logger.error(f"[SOCIAL_EXPERIENCE_DEBUG] Cannot consume membership - insufficient quota!")
+            _logger.warning("Cannot consume membership %s for registration %s - insufficient quota",
+                            membership.id, self.id)
             raise ValidationError(_('Insufficient membership quota for this event'))
         
         # Mark as consumed first
@@ -803,7 +749,9 @@ class PopcornEventRegistration(models.Model):
             'consumption_state': 'consumed'
         })
         
-        _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Consumption state set to 'consumed', points_remaining AFTER: {membership.points_remaining}")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("Consumption state set to 'consumed', points_remaining AFTER: %s",
+                          membership.points_remaining)
         
         # Log the quota consumption
         membership.message_post(
@@ -879,6 +827,7 @@ class PopcornEventRegistration(models.Model):
         )
     
     @api.model
+    @traced('registration.create')
     def create(self, vals):
         """Override create to set default values and validate membership"""
         # Set default consumption state if not provided
@@ -951,9 +900,8 @@ class PopcornEventRegistration(models.Model):
         # Handle waitlist and quota consumption for limited-seat events
         if not is_import and registration.event_id and should_lock:
             event = registration.event_id
-            _logger.info(f"=== New Registration Created: ID {registration.id} for event {event.name} (ID: {event.id}) ===")
-            _logger.info(f"Partner: {registration.partner_id.name} (ID: {registration.partner_id.id})")
-            _logger.info(f"Has membership: {bool(registration.membership_id)}")
+            _logger.debug("New registration %s for event %s (ID: %s), partner %s, has membership: %s",
+                          registration.id, event.name, event.id, registration.partner_id.id, bool(registration.membership_id))
             
             # Re-check availability (we already checked, but verify while holding lock)
             confirmed_registrations = self.env['event.registration'].search([
@@ -963,33 +911,32 @@ class PopcornEventRegistration(models.Model):
             ])
             available_seats = max(0, event.seats_max - len(confirmed_registrations))
             
-            _logger.info(f"Event has limited seats: {len(confirmed_registrations)} / {event.seats_max} seats taken")
-            _logger.info(f"Available seats: {available_seats}")
+            _logger.debug("Event %s has limited seats: %s / %s seats taken, %s available",
+                          event.id, len(confirmed_registrations), event.seats_max, available_seats)
             
             if available_seats <= 0 and registration.state == 'draft':
                 # No seats available - add to waitlist and consume quota immediately.
                 # Consuming on join (rather than on promotion) means the quota is
                 # actually reserved, preventing a user from stacking unlimited
                 # waitlist entries against the same pool of points/sessions.
-                _logger.info(f"No seats available - adding to waitlist")
+                _logger.debug("No seats available - adding registration %s to waitlist", registration.id)
                 registration._add_to_waitlist()
                 if registration.membership_id and registration.consumption_state == 'pending':
-                    _logger.info(f"Consuming membership quota for waitlist registration")
+                    _logger.debug("Consuming membership quota for waitlist registration %s", registration.id)
                     registration._consume_membership_quota()
             elif registration.state == 'open':
                 # Seats available - consume quota if membership exists
                 if registration.membership_id and registration.consumption_state == 'pending':
-                    _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Registration state is 'open', consuming membership quota")
-                    _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Before consumption - club_type: {registration.club_type}, points_consumed: {registration.points_consumed}, membership points_remaining: {registration.membership_id.points_remaining}")
+                    _logger.debug("Registration state is 'open', consuming membership quota, "
+                                  "club_type: %s, points_consumed: %s", registration.club_type, registration.points_consumed)
                     registration._consume_membership_quota()
-                    _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] After consumption - membership points_remaining: {registration.membership_id.points_remaining}")
         elif not is_import and registration.event_id:
             # Unlimited seats - just consume quota if membership exists
-            _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Event has unlimited seats")
+            _logger.debug("Event has unlimited seats")
             if registration.membership_id and registration.consumption_state == 'pending':
-                _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] Before consumption - club_type: {registration.club_type}, points_consumed: {registration.points_consumed}, membership points_remaining: {registration.membership_id.points_remaining}")
+                _logger.debug("Consuming membership quota, club_type: %s, points_consumed: %s",
+                              registration.club_type, registration.points_consumed)
                 registration._consume_membership_quota()
-                _logger.info(f"[SOCIAL_EXPERIENCE_DEBUG] After consumption - membership points_remaining: {registration.membership_id.points_remaining}")
         
         # Note: Club registrations do NOT affect first-timer status
         # Only memberships affect is_first_timer (for membership pricing eligibility)
@@ -1005,10 +952,12 @@ class PopcornEventRegistration(models.Model):
                         ('state', '!=', 'cancel'),
                     ])
                     if non_cancelled_count == 1:
-                        registration.partner_id.pdb_pending_date = fields.Date.today()
+                        registration.partner_id._start_pdb_grace_period()
         
         # Clear UI caches to ensure fresh data
         registration.env['ir.ui.view'].clear_caches()
+        # A new booking changes quota and conflicts for memoized eligibility verdicts
+        self.env.cr.cache.pop('popcorn_eligibility', None)
         
         # After creating registration, schedule overbooking correction to run after commit
         # This ensures we can see all committed registrations from concurrent transactions
@@ -1317,6 +1266,137 @@ class PopcornEventRegistration(models.Model):
                 registration._apply_attendance_penalty_policy('no_show')
         return True
 
+    def _mark_attendance_bulk(self, statuses):
+        """
+        Set the attendance of many attendees at once, for the registration desk.
+
+        `statuses` maps registration ids to 'attended', 'late' or 'no_show'.
+        Unlike the desk toggles this sets the status, so attendees already in
+        it are left alone. Flags are written once per status, penalties go
+        through _apply_attendance_penalty_policy_bulk, and the event gets a
+        single summary message. Returns the summary counts.
+        """
+        unknown = set(statuses.values()) - set(ATTENDANCE_STATUS_VALS)
+        if unknown:
+            raise UserError(_('Unknown attendance status: %s') % ', '.join(sorted(unknown)))
+        not_attending = self.filtered(lambda r: r.state in ['cancel', 'draft'] or r.is_on_waitlist)
+        if not_attending:
+            raise UserError(_('Only confirmed/open attendees can be marked: %s') % ', '.join(not_attending.mapped('display_name')))
+
+        marked = {}
+        for status, vals in ATTENDANCE_STATUS_VALS.items():
+            to_mark = self.filtered(lambda r: statuses[r.id] == status and (
+                r.is_late_attendance != vals['is_late_attendance']
+                or r.is_no_show_attendance != vals['is_no_show_attendance']
+                or (status != 'no_show' and r.state != 'done')
+            ))
+            if not to_mark:
+                continue
+            if status == 'no_show':
+                to_mark.write(vals)
+            else:
+                to_mark.write(dict(vals, state='done'))
+            marked[status] = to_mark
+
+        incident_types = {
+            registration.id: status
+            for status in ('late', 'no_show')
+            for registration in marked.get(status, [])
+        }
+        penalties = self.browse(list(incident_types))._apply_attendance_penalty_policy_bulk(incident_types)
+
+        summary = {status: len(marked.get(status, [])) for status in ATTENDANCE_STATUS_VALS}
+        summary.update(penalties)
+        for event in self.event_id:
+            event.message_post(body=_(
+                'Attendance marked from registration desk: %(attended)s attended, %(late)s late, '
+                '%(no_show)s no-show. Policy violations: %(violations)s, refunds blocked: '
+                '%(penalties)s, memberships frozen: %(freezes)s.'
+            ) % summary)
+        return summary
+
+    def _apply_attendance_penalty_policy_bulk(self, incident_types):
+        """
+        _apply_attendance_penalty_policy for many registrations in one pass.
+
+        `incident_types` maps registration ids to their incident type. The
+        monthly counters are bumped once per policy for all memberships, the
+        registration flags are written per incident type, and memberships get
+        their notes in one batched log. Returns the violation, penalty and
+        freeze counts.
+        """
+        Counter = self.env['popcorn.membership.violation.counter']
+        now = fields.Datetime.now()
+        result = {'violations': 0, 'penalties': 0, 'freezes': 0}
+        with_membership = self.filtered('membership_id')
+
+        # Unlimited memberships: freeze policy incidents.
+        unlimited = with_membership.filtered(
+            lambda r: r.membership_id.plan_quota_mode == 'unlimited' and not r.late_no_show_incident
+        )
+        if unlimited:
+            unlimited.write({
+                'late_no_show_incident': True,
+                'late_no_show_incident_date': now,
+            })
+            deltas = defaultdict(int)
+            for registration in unlimited:
+                deltas[registration.membership_id.id] += 1
+            memberships = unlimited.membership_id
+            frozen_before = {m.id: m.attendance_policy_freeze_count for m in memberships}
+            memberships._evaluate_unlimited_late_no_show_policy(Counter._increment(deltas, 'incident'))
+            result['violations'] += len(unlimited)
+            result['freezes'] += sum(
+                1 for m in memberships if m.attendance_policy_freeze_count != frozen_before[m.id]
+            )
+
+        # Bucket/points memberships: calendar-month violation policy.
+        quota = with_membership.filtered(
+            lambda r: r.membership_id.plan_quota_mode in ['bucket_counts', 'points']
+            and not r.quota_penalty_violation
+            and r._is_quota_penalty_incident_type(incident_types[r.id])
+        )
+        if not quota:
+            return result
+        for incident_type in set(incident_types[r.id] for r in quota):
+            quota.filtered(lambda r: incident_types[r.id] == incident_type).write({
+                'quota_penalty_violation': True,
+                'quota_penalty_violation_date': now,
+                'quota_penalty_incident_type': incident_type,
+            })
+        by_membership = defaultdict(lambda: self.browse())
+        for registration in quota:
+            by_membership[registration.membership_id] |= registration
+        totals = Counter._increment({m.id: len(regs) for m, regs in by_membership.items()}, 'quota')
+
+        bodies = defaultdict(list)
+        penalized = self.browse()
+        for membership, registrations in by_membership.items():
+            count = totals[membership.id] - len(registrations)
+            for registration in registrations:
+                count += 1
+                bodies[membership.id].append(_(
+                    'Attendance policy violation recorded for event "%s" (%s). '
+                    'Current count this month: %s.'
+                ) % (registration.event_id.name, incident_types[registration.id], count))
+                # Same rule as the single path: the second violation of the month
+                # is the one whose refund is blocked.
+                penalty = registration._get_non_refund_penalty() if count == 2 else None
+                if penalty:
+                    adj_field, amount, body = penalty
+                    membership.write({adj_field: membership[adj_field] - amount})
+                    penalized |= registration
+                    bodies[membership.id].append(body)
+        if penalized:
+            penalized.write({'quota_penalty_applied': True})
+        if bodies:
+            self.env['popcorn.membership'].browse(list(bodies))._message_log_batch(bodies={
+                membership_id: Markup('<br/>').join(lines) for membership_id, lines in bodies.items()
+            })
+        result['violations'] += len(quota)
+        result['penalties'] += len(penalized)
+        return result
+
     def _mark_late_no_show_incident(self, incident_type):
         """Backward-compatible wrapper; delegates to unified attendance policy."""
         return self._apply_attendance_penalty_policy(incident_type)
@@ -1351,7 +1431,10 @@ class PopcornEventRegistration(models.Model):
                 'late_no_show_incident_date': fields.Datetime.now(),
             })
             self.message_post(body=body)
-            membership._evaluate_unlimited_late_no_show_policy()
+            incident_counts = self.env['popcorn.membership.violation.counter']._increment(
+                {membership.id: 1}, 'incident'
+            )
+            membership._evaluate_unlimited_late_no_show_policy(incident_counts)
             return True
 
         # Bucket/points memberships use calendar-month violation policy.
@@ -1363,7 +1446,9 @@ class PopcornEventRegistration(models.Model):
                 'quota_penalty_violation_date': fields.Datetime.now(),
                 'quota_penalty_incident_type': incident_type,
             })
-            violation_count_30d = self._get_recent_quota_policy_violation_count(include_current=True)
+            violation_count_30d = self.env['popcorn.membership.violation.counter']._increment(
+                {membership.id: 1}, 'quota'
+            )[membership.id]
             membership.message_post(
                 body=_(
                     'Attendance policy violation recorded for event "%s" (%s). '
@@ -1421,80 +1506,77 @@ class PopcornEventRegistration(models.Model):
         """Backward-compatible wrapper for unified attendance policy."""
         return self._apply_attendance_penalty_policy('cancel_window')
 
-    def _apply_cancel_window_non_refund_penalty(self):
+    def _get_non_refund_penalty(self):
         """
-        Apply persistent adjustment so computed remaining quota/points
-        does not return the last club/points on blocked refund.
+        Adjustment a blocked refund applies to the membership, as
+        (adjustment field, amount, chatter text), or None when nothing applies.
         """
         self.ensure_one()
         membership = self.membership_id
-        if not membership:
-            return False
-        if self.quota_penalty_applied:
-            return False
-        if self.consumption_state != 'consumed':
-            return False
+        if not membership or self.quota_penalty_applied or self.consumption_state != 'consumed':
+            return None
 
         if membership.plan_quota_mode == 'points':
             points_penalty = self.points_consumed or 0
-            if points_penalty:
-                membership.write({'adj_points': membership.adj_points - points_penalty})
-                self.write({'quota_penalty_applied': True})
-                membership.message_post(
-                    body=_(
-                        'Attendance policy penalty applied for event "%s": '
-                        '%s points were not refunded.'
-                    ) % (self.event_id.name, points_penalty)
-                )
-            return True
+            if not points_penalty:
+                return None
+            return 'adj_points', points_penalty, _(
+                'Attendance policy penalty applied for event "%s": '
+                '%s points were not refunded.'
+            ) % (self.event_id.name, points_penalty)
 
         if membership.plan_quota_mode == 'bucket_counts':
             if self.club_type == 'regular_offline':
-                membership.write({'adj_offline': membership.adj_offline - 1})
-                self.write({'quota_penalty_applied': True})
-                membership.message_post(
-                    body=_(
-                        'Attendance policy penalty applied for event "%s": '
-                        '1 offline session was not refunded.'
-                    ) % self.event_id.name
-                )
-            elif self.club_type == 'regular_online':
-                membership.write({'adj_online': membership.adj_online - 1})
-                self.write({'quota_penalty_applied': True})
-                membership.message_post(
-                    body=_(
-                        'Attendance policy penalty applied for event "%s": '
-                        '1 online session was not refunded.'
-                    ) % self.event_id.name
-                )
-            elif self.club_type == 'spclub':
-                membership.write({'adj_sp': membership.adj_sp - 1})
-                self.write({'quota_penalty_applied': True})
-                membership.message_post(
-                    body=_(
-                        'Attendance policy penalty applied for event "%s": '
-                        '1 special session was not refunded.'
-                    ) % self.event_id.name
-                )
-            return True
+                return 'adj_offline', 1, _(
+                    'Attendance policy penalty applied for event "%s": '
+                    '1 offline session was not refunded.'
+                ) % self.event_id.name
+            if self.club_type == 'regular_online':
+                return 'adj_online', 1, _(
+                    'Attendance policy penalty applied for event "%s": '
+                    '1 online session was not refunded.'
+                ) % self.event_id.name
+            if self.club_type == 'spclub':
+                return 'adj_sp', 1, _(
+                    'Attendance policy penalty applied for event "%s": '
+                    '1 special session was not refunded.'
+                ) % self.event_id.name
+        return None
 
-        return False
+    def _apply_cancel_window_non_refund_penalty(self):
+        """
+        Apply persistent adjustment so computed remaining quota/points
+        does not return the last club/points on blocked refund.
+        """
+        self.ensure_one()
+        membership = self.membership_id
+        if not membership or self.quota_penalty_applied or self.consumption_state != 'consumed':
+            return False
+        if membership.plan_quota_mode not in ['bucket_counts', 'points']:
+            return False
+        penalty = self._get_non_refund_penalty()
+        if penalty:
+            adj_field, amount, body = penalty
+            membership.write({adj_field: membership[adj_field] - amount})
+            self.write({'quota_penalty_applied': True})
+            membership.message_post(body=body)
+        return True
 
     def _get_recent_quota_policy_violation_count(self, include_current=False):
         """Count quota policy violations for this membership in the current calendar month."""
         self.ensure_one()
         if not self.membership_id:
             return 0
-        now = fields.Datetime.now()
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        domain = [
-            ('membership_id', '=', self.membership_id.id),
-            ('quota_penalty_violation', '=', True),
-            ('quota_penalty_violation_date', '>=', month_start),
-        ]
-        if not include_current:
-            domain.append(('id', '!=', self.id))
-        return self.search_count(domain)
+        Counter = self.env['popcorn.membership.violation.counter']
+        count = Counter._get_counts([self.membership_id.id], 'quota')[self.membership_id.id]
+        if (
+            not include_current
+            and self.quota_penalty_violation
+            and self.quota_penalty_violation_date
+            and self.quota_penalty_violation_date >= Counter._get_month_start()
+        ):
+            count -= 1
+        return count
 
     def _process_automatic_refund(self):
         """Process automatic refund for single club purchases"""
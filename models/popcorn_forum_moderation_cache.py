@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import timedelta
+
+from odoo import api, fields, models
+from .popcorn_tracing import traced
+
+_logger = logging.getLogger(__name__)
+
+# Eviction policy: entries not used for this long are dropped, and past the
+# size cap the least recently used ones go first.
+CACHE_MAX_AGE_DAYS = 90
+CACHE_MAX_ENTRIES = 20000
+
+
+class PopcornForumModerationCache(models.Model):
+    """DeepSeek verdicts keyed by post text and regulations.
+
+    A verdict only depends on the normalized title and content and on the
+    regulations it was judged against, so identical reposts, spam floods
+    and staff reruns are answered from here without calling the API.
+    Editing the regulations changes the rules hash, so old verdicts simply
+    stop matching; the regulations setting also purges them right away.
+    """
+    _name = 'popcorn.forum.moderation.cache'
+    _description = 'Popcorn Forum Moderation Verdict Cache'
+    _order = 'last_used desc'
+
+    content_hash = fields.Char(string='Content Fingerprint', required=True, index=True)
+    rules_hash = fields.Char(string='Rules Fingerprint', required=True, index=True)
+    allowed = fields.Boolean(string='Allowed')
+    rule_broken = fields.Char(string='Rule Broken')
+    reason = fields.Text(string='Reason')
+    response = fields.Text(string='Raw Response')
+    model = fields.Char(string='Model Used')
+    hit_count = fields.Integer(string='Hits', default=0)
+    last_used = fields.Datetime(string='Last Used', default=fields.Datetime.now, index=True)
+
+    _sql_constraints = [
+        ('unique_content_rules', 'unique(content_hash, rules_hash)',
+         'A verdict is cached only once per content and rules fingerprint')
+    ]
+
+    @api.model
+    def _lookup(self, content_hashes, rules_hash):
+        """Return {content_hash: verdict} for the cached fingerprints.
+
+        Hits are counted and their last_used bumped in a single statement,
+        which is what the eviction cron ranks on.
+        """
+        content_hashes = [h for h in set(content_hashes) if h]
+        if not content_hashes:
+            return {}
+        self.env.cr.execute("""
+            UPDATE popcorn_forum_moderation_cache
+               SET hit_count = hit_count + 1, last_used = now() at time zone 'UTC'
+             WHERE rules_hash = %s AND content_hash IN %s
+         RETURNING content_hash, allowed, rule_broken, reason, response
+        """, (rules_hash, tuple(content_hashes)))
+        return {
+            content_hash: {
+                'allowed': allowed,
+                'rule_broken': rule_broken or '',
+                'reason': reason or '',
+                'raw': response,
+            }
+            for content_hash, allowed, rule_broken, reason, response in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _store(self, verdicts, rules_hash, model):
+        """Cache the fresh verdicts from DeepSeek. Failures are never cached."""
+        rows = [
+            (content_hash, rules_hash, verdict['allowed'], verdict['rule_broken'] or None,
+             verdict['reason'], verdict['raw'], model)
+            for content_hash, verdict in verdicts.items()
+            if content_hash and isinstance(verdict, dict)
+        ]
+        if not rows:
+            return
+        # ON CONFLICT: two workers may judge the same new text at once.
+        self.env.cr.executemany("""
+            INSERT INTO popcorn_forum_moderation_cache
+                   (content_hash, rules_hash, allowed, rule_broken, reason, response, model,
+                    hit_count, last_used, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, 0, now() at time zone 'UTC',
+                    {uid}, now() at time zone 'UTC', {uid}, now() at time zone 'UTC')
+            ON CONFLICT (content_hash, rules_hash) DO NOTHING
+        """.format(uid=int(self.env.uid)), rows)
+
+    @api.model
+    def _invalidate_other_rules(self, rules_hash):
+        """Drop verdicts given under any regulations other than the current ones."""
+        self.env.cr.execute(
+            "DELETE FROM popcorn_forum_moderation_cache WHERE rules_hash != %s", (rules_hash,)
+        )
+        if self.env.cr.rowcount:
+            _logger.info('Popcorn forum: regulations changed, dropped %s cached verdict(s)', self.env.cr.rowcount)
+
+    @api.model
+    @traced('cron.forum_moderation_cache_evict')
+    def _cron_evict(self):
+        """Apply the eviction policy: age first, then least recently used past the size cap."""
+        cutoff = fields.Datetime.now() - timedelta(days=CACHE_MAX_AGE_DAYS)
+        self.env.cr.execute("DELETE FROM popcorn_forum_moderation_cache WHERE last_used < %s", (cutoff,))
+        expired = self.env.cr.rowcount
+        self.env.cr.execute("""
+            DELETE FROM popcorn_forum_moderation_cache
+             WHERE id IN (
+                SELECT id FROM popcorn_forum_moderation_cache
+              ORDER BY last_used DESC, id DESC
+                OFFSET %s
+             )
+        """, (CACHE_MAX_ENTRIES,))
+        if expired or self.env.cr.rowcount:
+            _logger.info('Popcorn forum: evicted %s expired and %s overflow cached verdict(s)',
+                         expired, self.env.cr.rowcount)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""DeepSeek transport for forum moderation.
+
+Deliberately free of any Odoo import: it only knows how to turn a post's
+title and content into a verdict over HTTP, with timeouts, retries and a
+circuit breaker around the call. Reading posts and writing verdicts stays
+in popcorn.forum.post, which keeps this part testable against a local stub
+server (see tests/test_forum_moderation_worker.py).
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+DEEPSEEK_ENDPOINT = 'https://api.deepseek.com/chat/completions'
+DEFAULT_MODEL = 'deepseek-v4-flash'
+
+# Per attempt, not per post. Connecting should be near instant, reading is
+# where the model spends its reasoning time.
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 8.0
+
+# Consecutive failures before the breaker opens, and how long it stays open
+# before letting a single trial call through.
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_AFTER = 60
+
+# Upper bound on concurrent DeepSeek calls from one Odoo process, shared by
+# the submit queue, staff reruns and the backlog cron.
+POOL_SIZE = 4
+
+# The rules text configured in Settings is injected as %s. The instruction to
+# answer with a json object must stay in the prompt: DeepSeek's json_object
+# response format requires the word "json" to appear in the conversation.
+MODERATION_PROMPT = """You are a content moderator for the Popcorn Club community forum.
+Decide whether a member's post may be published, based ONLY on the club rules below.
+If the post breaks no rule, allow it. Be lenient about tone, typos and short posts.
+
+CLUB RULES:
+%s
+
+Respond with a json object only, in exactly this shape:
+{"allowed": true or false, "rule_broken": "short rule reference or empty string", "reason": "one short sentence explaining the decision"}"""
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class ModerationError(Exception):
+    """The moderator could not produce a verdict for a post."""
+
+
+class CircuitOpenError(ModerationError):
+    """The breaker is open, DeepSeek was not called at all."""
+
+
+class _RetryableError(ModerationError):
+    """Transport failure or server-side status worth trying again."""
+
+
+def normalize_text(text):
+    """Collapse whitespace and case so trivial edits hash the same."""
+    return _WHITESPACE.sub(' ', (text or '').strip()).lower()
+
+
+def content_fingerprint(title, content):
+    """Stable hash of a post's text, used to reuse verdicts for reposts."""
+    normalized = '%s\n%s' % (normalize_text(title), normalize_text(content))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def rules_fingerprint(rules):
+    """Hash of the regulations text, so a rules edit never reuses old verdicts."""
+    return hashlib.sha256((rules or '').strip().encode('utf-8')).hexdigest()
+
+
+class CircuitBreaker:
+    """Stop calling DeepSeek for a while after repeated failures.
+
+    Closed: calls go through. After `threshold` consecutive failures it
+    opens and every call fails fast with CircuitOpenError. Once
+    `reset_after` seconds have passed one trial call is let through: a
+    success closes the breaker, a failure opens it again.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET_AFTER, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._clock() - self._opened_at >= self.reset_after and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError('Moderator unavailable after %s consecutive failures, retrying later'
+                                   % self._failures)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    _logger.warning('Popcorn forum: opening moderation circuit after %s failures', self._failures)
+                self._opened_at = self._clock()
+
+
+class DeepSeekModerator:
+    """Thread-safe DeepSeek client shared by every moderation path of a process."""
+
+    def __init__(self, endpoint=DEEPSEEK_ENDPOINT, pool_size=POOL_SIZE, max_attempts=MAX_ATTEMPTS,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, breaker=None, sleep=time.sleep):
+        self.endpoint = endpoint
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='popcorn_moderation')
+        # Queued jobs wait on the pool above, so they get their own thread
+        # rather than competing with the calls they are waiting for.
+        self._queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix='popcorn_moderation_queue')
+        self._local = threading.local()
+
+    def _session(self):
+        # One keep-alive connection per worker thread instead of a TLS
+        # handshake per post.
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post_once(self, config, title, content):
+        payload = {
+            'model': config['model'],
+            'messages': [
+                {'role': 'system', 'content': MODERATION_PROMPT % config['rules']},
+                {'role': 'user', 'content': 'Title: %s\n\nContent: %s' % (title or '', content or '')},
+            ],
+            'response_format': {'type': 'json_object'},
+            'temperature': 0,
+            # Both DeepSeek v4 models reason before answering, and reasoning
+            # tokens come out of this budget. Too small a value returns empty
+            # content with finish_reason "length".
+            'max_tokens': 800,
+        }
+        try:
+            response = self._session().post(
+                config.get('endpoint') or self.endpoint,
+                headers={
+                    'Authorization': 'Bearer %s' % config['api_key'],
+                    'Content-Type': 'application/json',
+                },
+                json=payload,
+                timeout=self.timeout,
+            )
+        except requests.RequestException as error:
+            raise _RetryableError(str(error)) from error
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise _RetryableError('DeepSeek answered HTTP %s' % response.status_code)
+        if response.status_code >= 400:
+            raise ModerationError('DeepSeek answered HTTP %s' % response.status_code)
+
+        try:
+            body = response.json()
+            choice = body['choices'][0]
+            content = (choice['message'].get('content') or '').strip()
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            raise _RetryableError('Unreadable moderator response: %s' % error) from error
+        if not content:
+            raise _RetryableError('Moderator returned an empty verdict (finish_reason: %s)'
+                                  % choice.get('finish_reason'))
+        try:
+            verdict = json.loads(content)
+        except ValueError as error:
+            raise _RetryableError('Moderator verdict is not json: %s' % error) from error
+        return {
+            'allowed': bool(verdict.get('allowed')),
+            'rule_broken': (verdict.get('rule_broken') or '')[:255],
+            'reason': verdict.get('reason') or '',
+            'raw': content,
+        }
+
+    def moderate(self, config, title, content):
+        """Return the verdict for one post, retrying transient failures.
+
+        Raises ModerationError (or CircuitOpenError) when no verdict could
+        be obtained. Client errors such as a bad API key are not retried.
+        """
+        last_error = None
+        for attempt in range(self.max_attempts):
+            self.breaker.before_call()
+            try:
+                verdict = self._post_once(config, title, content)
+            except _RetryableError as error:
+                self.breaker.record_failure()
+                last_error = error
+                if attempt + 1 < self.max_attempts:
+                    self._sleep(min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                continue
+            except ModerationError:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return verdict
+        raise ModerationError(str(last_error))
+
+    def moderate_many(self, config, items):
+        """Moderate several posts concurrently on the shared pool.
+
+        `items` maps a key to a (title, content) pair. Returns a dict with
+        the same keys, holding either a verdict dict or the exception that
+        prevented one.
+        """
+        futures = {
+            key: self._executor.submit(self.moderate, config, title, content)
+            for key, (title, content) in items.items()
+        }
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as error:
+                results[key] = error
+        return results
+
+    def enqueue(self, fn, *args):
+        """Run `fn` in the background, for moderation queued after a commit."""
+        return self._queue.submit(fn, *args)
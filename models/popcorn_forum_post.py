@@ -1,30 +1,27 @@
 # -*- coding: utf-8 -*-
 
-import json
 import logging
 
-import requests
+from odoo import models, fields, api, SUPERUSER_ID, _
+from odoo.modules.registry import Registry
 
-from odoo import models, fields, api, _
+from .popcorn_forum_moderator import (
+    DEFAULT_MODEL,
+    DeepSeekModerator,
+    content_fingerprint,
+    rules_fingerprint,
+)
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
-DEEPSEEK_ENDPOINT = 'https://api.deepseek.com/chat/completions'
-DEFAULT_MODEL = 'deepseek-v4-flash'
-DEFAULT_TIMEOUT = 30
+# One client per Odoo process, so the pool size, keep-alive connections and
+# circuit breaker apply across every request, cron and rerun in the process.
+_moderator = DeepSeekModerator()
 
-# The rules text configured in Settings is injected as %s. The instruction to
-# answer with a json object must stay in the prompt: DeepSeek's json_object
-# response format requires the word "json" to appear in the conversation.
-MODERATION_PROMPT = """You are a content moderator for the Popcorn Club community forum.
-Decide whether a member's post may be published, based ONLY on the club rules below.
-If the post breaks no rule, allow it. Be lenient about tone, typos and short posts.
-
-CLUB RULES:
-%s
-
-Respond with a json object only, in exactly this shape:
-{"allowed": true or false, "rule_broken": "short rule reference or empty string", "reason": "one short sentence explaining the decision"}"""
+# Posts re-moderated per cron run. Calls go through the pool, so this is
+# bounded by DeepSeek throughput rather than by a serial loop.
+BACKLOG_BATCH_SIZE = 200
 
 
 class PopcornForumPost(models.Model):
@@ -102,6 +99,20 @@ class PopcornForumPost(models.Model):
         help='Raw moderator response, kept for debugging'
     )
 
+    content_hash = fields.Char(
+        string='Content Fingerprint',
+        compute='_compute_content_hash',
+        store=True,
+        index=True,
+        help='Hash of the normalized title and content. Posts with the same fingerprint reuse an '
+             'existing verdict instead of calling DeepSeek again'
+    )
+
+    @api.depends('name', 'content')
+    def _compute_content_hash(self):
+        for post in self:
+            post.content_hash = content_fingerprint(post.name, post.content)
+
     # ------------------------------------------------------------------
     # Configuration
     # ------------------------------------------------------------------
@@ -115,6 +126,9 @@ class PopcornForumPost(models.Model):
             'api_key': (get_param('popcorn.forum_deepseek_api_key') or '').strip(),
             'model': (get_param('popcorn.forum_deepseek_model') or '').strip() or DEFAULT_MODEL,
             'rules': (get_param('popcorn.forum_content_regulations') or '').strip(),
+            # Not exposed in Settings: lets a test or staging database point
+            # moderation at a stub server instead of the real API.
+            'endpoint': (get_param('popcorn.forum_deepseek_endpoint') or '').strip(),
         }
 
     # ------------------------------------------------------------------
@@ -129,52 +143,79 @@ class PopcornForumPost(models.Model):
         as failed and leave it for a human.
         """
         self.ensure_one()
-        payload = {
-            'model': config['model'],
-            'messages': [
-                {'role': 'system', 'content': MODERATION_PROMPT % config['rules']},
-                {'role': 'user', 'content': 'Title: %s\n\nContent: %s' % (self.name or '', self.content or '')},
-            ],
-            'response_format': {'type': 'json_object'},
-            'temperature': 0,
-            # Both DeepSeek v4 models reason before answering, and reasoning
-            # tokens come out of this budget. Too small a value returns empty
-            # content with finish_reason "length".
-            'max_tokens': 800,
-        }
-        response = requests.post(
-            DEEPSEEK_ENDPOINT,
-            headers={
-                'Authorization': 'Bearer %s' % config['api_key'],
-                'Content-Type': 'application/json',
-            },
-            json=payload,
-            timeout=DEFAULT_TIMEOUT,
+        return _moderator.moderate(config, self.name, self.content)
+
+    def _get_reusable_verdicts(self, config):
+        """Verdicts already given by DeepSeek for the same text under the same rules.
+
+        Returns {content_hash: verdict} from popcorn.forum.moderation.cache,
+        read in one query for the whole batch so reposts, spam floods and
+        reruns of unchanged text skip the API.
+        """
+        return self.env['popcorn.forum.moderation.cache'].sudo()._lookup(
+            self.mapped('content_hash'), rules_fingerprint(config['rules'])
         )
-        response.raise_for_status()
-        body = response.json()
-        message = body['choices'][0]['message']
-        content = (message.get('content') or '').strip()
-        if not content:
-            raise ValueError('Moderator returned an empty verdict (finish_reason: %s)'
-                             % body['choices'][0].get('finish_reason'))
-        verdict = json.loads(content)
-        return {
-            'allowed': bool(verdict.get('allowed')),
-            'rule_broken': (verdict.get('rule_broken') or '')[:255],
-            'reason': verdict.get('reason') or '',
-            'raw': content,
-        }
 
-    def run_moderation(self):
-        """Moderate the posts in self and write the verdict on each.
+    def _cache_verdicts(self, config, verdicts):
+        """Remember fresh DeepSeek verdicts for the next identical post."""
+        self.env['popcorn.forum.moderation.cache'].sudo()._store(
+            verdicts, rules_fingerprint(config['rules']), config['model']
+        )
 
-        Never raises: a post that cannot be moderated is parked in the
-        "failed" state so staff can deal with it, rather than being
-        published unchecked or lost.
+    def _fetch_verdicts(self, config):
+        """Return {content_hash: verdict or exception} for the posts in self.
+
+        Known fingerprints are answered from the verdict cache; each
+        remaining distinct text costs one call, run concurrently on the
+        shared pool, and its verdict is cached.
         """
-        config = self._get_moderation_config()
+        verdicts = self._get_reusable_verdicts(config)
+        pending = {}
+        for post in self:
+            if post.content_hash not in verdicts:
+                pending.setdefault(post.content_hash, (post.name, post.content))
+        if pending:
+            fresh = _moderator.moderate_many(config, pending)
+            self._cache_verdicts(config, fresh)
+            verdicts.update(fresh)
+        return verdicts
+
+    def _apply_verdicts(self, config, verdicts):
+        """Write the outcome of _fetch_verdicts on each post."""
+        now = fields.Datetime.now()
+        for post in self:
+            verdict = verdicts.get(post.content_hash)
+            if not isinstance(verdict, dict):
+                _logger.warning('Popcorn forum: moderation failed for post %s: %s', post.id, verdict)
+                post.write({
+                    'state': 'failed',
+                    'is_published': False,
+                    'moderation_source': False,
+                    'moderation_reason': _('Could not reach the moderator: %s') % verdict,
+                    'moderation_date': now,
+                    'moderation_model': config['model'],
+                    'moderation_rules_used': config['rules'],
+                })
+                continue
+
+            post.write({
+                'state': 'approved' if verdict['allowed'] else 'rejected',
+                'is_published': verdict['allowed'],
+                'moderation_source': 'ai',
+                'moderation_reason': verdict['reason'],
+                'moderation_rule_broken': verdict['rule_broken'] or False,
+                'moderation_date': now,
+                'moderation_model': config['model'],
+                'moderation_rules_used': config['rules'],
+                'moderation_response': verdict['raw'],
+            })
+
+    def _apply_moderation_config(self, config):
+        """Handle the cases where no DeepSeek call is needed.
 
+        Returns True or False when the configuration settled the posts on
+        its own, None when they still need a verdict.
+        """
         if not config['enabled']:
             # Moderation switched off: the forum is unfiltered by choice.
             self.write({
@@ -200,36 +241,66 @@ class PopcornForumPost(models.Model):
                 'moderation_date': fields.Datetime.now(),
             })
             return False
+        return None
 
-        for post in self:
-            try:
-                verdict = post._call_deepseek(config)
-            except Exception as error:
-                _logger.exception('Popcorn forum: moderation failed for post %s', post.id)
-                post.write({
-                    'state': 'failed',
-                    'is_published': False,
-                    'moderation_source': False,
-                    'moderation_reason': _('Could not reach the moderator: %s') % error,
-                    'moderation_date': fields.Datetime.now(),
-                    'moderation_model': config['model'],
-                    'moderation_rules_used': config['rules'],
-                })
-                continue
+    def run_moderation(self):
+        """Moderate the posts in self and write the verdict on each.
 
-            post.write({
-                'state': 'approved' if verdict['allowed'] else 'rejected',
-                'is_published': verdict['allowed'],
-                'moderation_source': 'ai',
-                'moderation_reason': verdict['reason'],
-                'moderation_rule_broken': verdict['rule_broken'] or False,
-                'moderation_date': fields.Datetime.now(),
-                'moderation_model': config['model'],
-                'moderation_rules_used': config['rules'],
-                'moderation_response': verdict['raw'],
-            })
+        Never raises: a post that cannot be moderated is parked in the
+        "failed" state so staff can deal with it, rather than being
+        published unchecked or lost. Blocks until every verdict is in, so
+        request handlers should use _enqueue_moderation instead.
+        """
+        config = self._get_moderation_config()
+        settled = self._apply_moderation_config(config)
+        if settled is not None:
+            return settled
+        self._apply_verdicts(config, self._fetch_verdicts(config))
         return True
 
+    def _enqueue_moderation(self):
+        """Moderate the posts in the background once the current transaction commits.
+
+        The website worker returns immediately; the queue thread reads the
+        posts with its own cursor, calls DeepSeek without holding any
+        database connection, then writes the verdicts in a fresh
+        transaction. Posts lost to a process restart stay pending and are
+        picked up by _cron_moderate_backlog.
+        """
+        if not self:
+            return
+        dbname = self.env.cr.dbname
+        post_ids = tuple(self.ids)
+        self.env.cr.postcommit.add(lambda: _moderator.enqueue(self._moderate_in_background, dbname, post_ids))
+
+    @classmethod
+    def _moderate_in_background(cls, dbname, post_ids):
+        try:
+            registry = Registry(dbname)
+            with registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                posts = env[cls._name].browse(post_ids).exists().filtered(lambda p: p.state == 'pending')
+                config = posts._get_moderation_config()
+                if not posts or posts._apply_moderation_config(config) is not None:
+                    return
+                post_ids = posts.ids
+                verdicts = posts._get_reusable_verdicts(config)
+                pending = {post.content_hash: (post.name, post.content) for post in posts}
+
+            # No cursor held while waiting on DeepSeek.
+            missing = {key: value for key, value in pending.items() if key not in verdicts}
+            fresh = _moderator.moderate_many(config, missing) if missing else {}
+            verdicts.update(fresh)
+
+            with registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                posts = env[cls._name].browse(post_ids).exists()
+                posts._cache_verdicts(config, fresh)
+                # A staff decision made meanwhile wins over the queued verdict.
+                posts.filtered(lambda p: p.state == 'pending')._apply_verdicts(config, verdicts)
+        except Exception:
+            _logger.exception('Popcorn forum: background moderation failed for posts %s', post_ids)
+
     # ------------------------------------------------------------------
     # Staff actions
     # ------------------------------------------------------------------
@@ -253,7 +324,11 @@ class PopcornForumPost(models.Model):
         })
 
     def action_rerun_moderation(self):
-        """Re-submit the post to DeepSeek, e.g. after editing the regulations."""
+        """Re-submit the post to DeepSeek, e.g. after editing the regulations.
+
+        Unchanged text under unchanged regulations is answered from the
+        verdict cache without calling the API.
+        """
         self.run_moderation()
 
     # ------------------------------------------------------------------
@@ -261,14 +336,16 @@ class PopcornForumPost(models.Model):
     # ------------------------------------------------------------------
 
     @api.model
+    @traced('cron.forum_moderation_backlog')
     def _cron_moderate_backlog(self):
         """Retry posts that never got a verdict.
 
-        Moderation normally runs inline when the member submits. This only
-        picks up the leftovers from a DeepSeek outage or a half-finished
-        configuration, so nothing stays invisible forever.
+        Moderation normally runs from the background queue right after the
+        member submits. This only picks up the leftovers from a DeepSeek
+        outage, a process restart or a half-finished configuration, so
+        nothing stays invisible forever.
         """
-        backlog = self.search([('state', 'in', ['pending', 'failed'])], limit=50)
+        backlog = self.search([('state', 'in', ['pending', 'failed'])], order='id', limit=BACKLOG_BATCH_SIZE)
         if backlog:
             _logger.info('Popcorn forum: re-moderating %s post(s) from the backlog', len(backlog))
             backlog.run_moderation()
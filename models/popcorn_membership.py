@@ -1,13 +1,28 @@
 # -*- coding: utf-8 -*-
 
+import bisect
+import hashlib
 import logging
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
 from datetime import datetime, timedelta, time
+import time as time_module
 import pytz
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
+# "Does this partner hold a live membership" is asked on every shop price
+# computation. Answers are memoized per transaction (cr.cache) and, for a
+# few seconds, per process; membership writes in this process drop their
+# partners from both, other workers catch up within the TTL.
+LIVE_MEMBERSHIP_TTL = 30
+LIVE_MEMBERSHIP_MEMO_SIZE = 50000
+_live_membership_memo = {}
+
+# Writing any of these moves a partner's freeze intervals
+FREEZE_FIELDS = {'freeze_active', 'freeze_start', 'freeze_end'}
+
 class PopcornMembership(models.Model):
     """Membership instances for customers"""
     _name = 'popcorn.membership'
@@ -17,7 +32,7 @@ class PopcornMembership(models.Model):
     _rec_name = 'display_name'
 
     # Core fields
-    partner_id = fields.Many2one('res.partner', string='Member', required=True)
+    partner_id = fields.Many2one('res.partner', string='Member', required=True, index=True)
     partner_phone = fields.Char(string='Phone', related='partner_id.phone', readonly=True, store=True)
     membership_plan_id = fields.Many2one('popcorn.membership.plan', string='Membership Plan', required=True)
     state = fields.Selection([
@@ -79,7 +94,13 @@ class PopcornMembership(models.Model):
     remaining_online = fields.Integer(string='Remaining Online Sessions', compute='_compute_remaining_usage')
     remaining_sp = fields.Integer(string='Remaining Special Club Sessions', compute='_compute_remaining_usage')
     points_remaining = fields.Integer(string='Points Remaining', compute='_compute_remaining_usage')
-    effective_end_date = fields.Date(string='Effective End Date', compute='_compute_effective_end_date', store=True)
+    effective_end_date = fields.Date(string='Effective End Date', compute='_compute_effective_end_date', store=True,
+                                     index=True)
+    points_exhausted = fields.Boolean(string='Points Exhausted', compute='_compute_points_exhausted', store=True,
+                                      index=True,
+                                      help='Set while a points membership has no points left. Recomputed whenever '
+                                           'quota is consumed, restored or adjusted; the expiration cron reads it '
+                                           'instead of recomputing points_remaining for every membership.')
     
     # Display name
     display_name = fields.Char(string='Display Name', compute='_compute_display_name', store=True)
@@ -89,7 +110,8 @@ class PopcornMembership(models.Model):
                                  default=lambda self: self.env.company.currency_id)
     
     # Payment tracking
-    payment_transaction_id = fields.Many2one('payment.transaction', string='Payment Transaction', readonly=True)
+    payment_transaction_id = fields.Many2one('payment.transaction', string='Payment Transaction', readonly=True,
+                                             index='btree_not_null')
     payment_reference = fields.Char(string='Payment Reference', readonly=True)
     
     # Contract relationship
@@ -291,6 +313,22 @@ class PopcornMembership(models.Model):
             else:
                 membership.effective_end_date = False
     
+    @api.depends('adj_points', 'membership_plan_id.quota_mode', 'membership_plan_id.points_start',
+                 'membership_plan_id.points_per_offline', 'membership_plan_id.points_per_online',
+                 'membership_plan_id.points_per_sp', 'membership_plan_id.points_per_social_experience',
+                 'registration_ids.state', 'registration_ids.consumption_state', 'registration_ids.club_type',
+                 'registration_ids.is_on_waitlist', 'registration_ids.is_imported',
+                 'registration_ids.is_no_show_attendance', 'registration_ids.quota_penalty_applied')
+    def _compute_points_exhausted(self):
+        for membership in self:
+            if membership.membership_plan_id.quota_mode != 'points':
+                membership.points_exhausted = False
+                continue
+            # points_remaining does not depend on registrations, make sure it
+            # is recomputed from the consumption that triggered this update
+            membership.invalidate_recordset(['points_remaining'])
+            membership.points_exhausted = membership.points_remaining == 0
+
     @api.depends('partner_id.is_first_timer')
     def _compute_first_timer_customer(self):
         for membership in self:
@@ -299,6 +337,10 @@ class PopcornMembership(models.Model):
     
     @api.depends('adj_offline', 'adj_online', 'adj_sp', 'adj_points', 'membership_plan_id.quota_mode', 'membership_plan_id.quota_offline', 'membership_plan_id.quota_online', 'membership_plan_id.quota_sp', 'membership_plan_id.points_start')
     def _compute_remaining_usage(self):
+        # Consumed registrations for every metered membership in one grouped
+        # query, instead of one search per membership and club type
+        used_counts = self._get_used_counts_by_club_type()
+
         for membership in self:
             plan = membership.membership_plan_id
             
@@ -319,10 +361,10 @@ class PopcornMembership(models.Model):
                 membership.points_remaining = -1
                 
             elif plan.quota_mode == 'bucket_counts':
-                # Calculate used sessions from registrations
-                used_offline = membership._count_used_sessions('regular_offline')
-                used_online = membership._count_used_sessions('regular_online')
-                used_sp = membership._count_used_sessions('spclub')
+                used = used_counts.get(membership.id, {})
+                used_offline = used.get('regular_offline', 0)
+                used_online = used.get('regular_online', 0)
+                used_sp = used.get('spclub', 0)
                 
                 # Use safe access with defaults
                 quota_offline = getattr(plan, 'quota_offline', 0) or 0
@@ -335,7 +377,10 @@ class PopcornMembership(models.Model):
                 membership.points_remaining = 0
                 
             elif plan.quota_mode == 'points':
-                used_points = membership._count_used_points()
+                used_points = sum(
+                    plan._get_points_cost(club_type) * count
+                    for club_type, count in used_counts.get(membership.id, {}).items()
+                )
                 membership.remaining_offline = 0
                 membership.remaining_online = 0
                 membership.remaining_sp = 0
@@ -343,6 +388,44 @@ class PopcornMembership(models.Model):
                 membership.points_remaining = max(0, points_start - used_points + membership.adj_points)
                 
                 # Note: Auto-expiration will be handled by cron job for reliability
+
+    def _get_consumed_registration_domain(self):
+        """Registrations that count against quota, shared by the usage counters.
+
+        Confirmed registrations AND waitlisted registrations that have already
+        had their quota consumed (quota is consumed on waitlist join to prevent
+        stacking unlimited waitlists). No-shows do not count as consumed unless
+        a penalty was applied. Imported registrations never count.
+        """
+        return [
+            ('membership_id', 'in', self.ids),
+            ('consumption_state', '=', 'consumed'),
+            ('is_imported', '=', False),
+            '|',
+            ('state', 'in', ['open', 'confirmed', 'done']),
+            '&', ('state', '=', 'draft'), ('is_on_waitlist', '=', True),
+            '|',
+            ('is_no_show_attendance', '=', False),
+            ('quota_penalty_applied', '=', True),
+        ]
+
+    def _get_used_counts_by_club_type(self):
+        """Return {membership_id: {club_type: consumed registrations}} for metered plans"""
+        metered = self.filtered(
+            lambda m: isinstance(m.id, int) and m.membership_plan_id.quota_mode in ('bucket_counts', 'points')
+        )
+        if not metered:
+            return {}
+        groups = self.env['event.registration'].sudo()._read_group(
+            metered._get_consumed_registration_domain(),
+            ['membership_id', 'club_type'],
+            ['__count'],
+        )
+        used_counts = {}
+        for membership, club_type, count in groups:
+            if club_type:
+                used_counts.setdefault(membership.id, {})[club_type] = count
+        return used_counts
     
     @api.depends('partner_id', 'membership_plan_id')
     def _compute_display_name(self):
@@ -399,45 +482,10 @@ class PopcornMembership(models.Model):
             return 0
             
         try:
-            # Only count registrations that went through proper consumption flow
-            domain = [
-                ('membership_id', '=', self.id),
-                ('consumption_state', '=', 'consumed'),
-                ('is_imported', '=', False),
-                # Count confirmed registrations AND waitlisted registrations that
-                # have already had their quota consumed (quota is consumed on
-                # waitlist join to prevent stacking unlimited waitlists).
-                '|',
-                ('state', 'in', ['open', 'confirmed', 'done']),
-                '&', ('state', '=', 'draft'), ('is_on_waitlist', '=', True),
-            ]
-            # Points: no-show does not count as consumed unless penalty was applied
-            if self.plan_quota_mode == 'points':
-                domain.append('|')
-                domain.append(('is_no_show_attendance', '=', False))
-                domain.append(('quota_penalty_applied', '=', True))
-            registrations = self.env['event.registration'].sudo().search(domain)
-            
-            total_points = 0
-            for reg in registrations:
-                # Use the computed club_type field from the registration, not from the event
-                if reg.club_type:
-                    club_type = reg.club_type
-                    plan = self.membership_plan_id
-                    if club_type == 'regular_offline':
-                        points = plan.points_per_offline
-                        total_points += points
-                    elif club_type == 'regular_online':
-                        points = plan.points_per_online
-                        total_points += points
-                    elif club_type == 'spclub':
-                        points = plan.points_per_sp
-                        total_points += points
-                    elif club_type == 'social_experience':
-                        points = plan.points_per_social_experience
-                        total_points += points
-        
-            return total_points
+            used_counts = self._get_used_counts_by_club_type().get(self.id, {})
+            club_types = list(used_counts)
+            costs = self.membership_plan_id.cost_for(club_types)
+            return sum(cost * used_counts[club_type] for club_type, cost in zip(club_types, costs))
         except Exception:
             # If access denied, return 0
             return 0
@@ -472,8 +520,133 @@ class PopcornMembership(models.Model):
             if partner.pdb:
                 partner.pdb = False
 
+        self._invalidate_live_membership_cache([partner_id])
         return membership
-    
+
+    def write(self, vals):
+        if FREEZE_FIELDS.intersection(vals) or 'partner_id' in vals:
+            self.env.cr.cache.pop('popcorn_freeze_intervals', None)
+        if 'state' in vals or 'partner_id' in vals:
+            partner_ids = self.mapped('partner_id').ids
+            result = super().write(vals)
+            self._invalidate_live_membership_cache(partner_ids + self.mapped('partner_id').ids)
+            return result
+        return super().write(vals)
+
+    def unlink(self):
+        partner_ids = self.mapped('partner_id').ids
+        result = super().unlink()
+        self._invalidate_live_membership_cache(partner_ids)
+        self.env.cr.cache.pop('popcorn_freeze_intervals', None)
+        return result
+
+    @api.model
+    def _get_freeze_intervals(self, partner):
+        """Return the partner's active freeze periods as a sorted interval index.
+
+        The index is a dict with:
+            intervals: [(freeze_start, freeze_end, membership_id)] sorted by start
+            starts: the freeze_start of each interval, for bisect
+            max_ends: running maximum of freeze_end, to stop scanning early
+            version: short hash of the intervals; changes whenever a freeze
+                     starts, ends or moves, so clients can cache answers by it
+        Loaded with one query and memoized for the transaction.
+        """
+        memo = self.env.cr.cache.setdefault('popcorn_freeze_intervals', {})
+        partner_id = partner.id if partner else False
+        if partner_id in memo:
+            return memo[partner_id]
+
+        rows = self.sudo().search_read([
+            ('partner_id', '=', partner_id),
+            ('freeze_active', '=', True),
+            ('freeze_start', '!=', False),
+            ('freeze_end', '!=', False),
+        ], ['freeze_start', 'freeze_end'], order='freeze_start, id') if partner_id else []
+        intervals = [(row['freeze_start'], row['freeze_end'], row['id']) for row in rows]
+        max_ends = []
+        for _start, end, _membership_id in intervals:
+            max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+        index = {
+            'intervals': intervals,
+            'starts': [start for start, _end, _membership_id in intervals],
+            'max_ends': max_ends,
+            'version': hashlib.sha1(repr(intervals).encode('utf-8')).hexdigest()[:16],
+        }
+        memo[partner_id] = index
+        return index
+
+    @api.model
+    def _find_freeze_interval(self, freeze_index, date):
+        """Return the (start, end, membership_id) freeze covering date, or None"""
+        if not date:
+            return None
+        intervals = freeze_index['intervals']
+        position = bisect.bisect_right(freeze_index['starts'], date)
+        # Only intervals starting on or before the date can cover it; walk
+        # back until no earlier interval reaches that far.
+        for i in range(position - 1, -1, -1):
+            if freeze_index['max_ends'][i] < date:
+                break
+            if intervals[i][1] >= date:
+                return intervals[i]
+        return None
+
+    @api.model
+    def _get_partners_with_live_membership(self, partner_ids):
+        """Return the subset of partner_ids holding an active or frozen membership.
+
+        Looks in the transaction memo first, then the short-lived process
+        memo, and only searches for the partners neither of them knows.
+        """
+        partner_ids = {pid for pid in partner_ids if pid}
+        if not partner_ids:
+            return set()
+        request_memo = self.env.cr.cache.setdefault('popcorn_live_membership', {})
+        dbname = self.env.cr.dbname
+        now = time_module.monotonic()
+
+        unknown = set()
+        for partner_id in partner_ids:
+            if partner_id in request_memo:
+                continue
+            cached = _live_membership_memo.get((dbname, partner_id))
+            if cached and cached[0] > now:
+                request_memo[partner_id] = cached[1]
+            else:
+                unknown.add(partner_id)
+
+        if unknown:
+            groups = self.sudo()._read_group(
+                [('partner_id', 'in', list(unknown)), ('state', 'in', ['active', 'frozen'])],
+                ['partner_id'],
+            )
+            live = {partner.id for (partner,) in groups}
+            if len(_live_membership_memo) > LIVE_MEMBERSHIP_MEMO_SIZE:
+                _live_membership_memo.clear()
+            expires = now + LIVE_MEMBERSHIP_TTL
+            for partner_id in unknown:
+                request_memo[partner_id] = partner_id in live
+                _live_membership_memo[(dbname, partner_id)] = (expires, partner_id in live)
+
+        return {partner_id for partner_id in partner_ids if request_memo[partner_id]}
+
+    @api.model
+    def _partner_has_live_membership(self, partner):
+        """Shortcut of _get_partners_with_live_membership for a single partner."""
+        return bool(partner) and bool(self._get_partners_with_live_membership([partner.id]))
+
+    @api.model
+    def _invalidate_live_membership_cache(self, partner_ids):
+        # Booking eligibility verdicts memoized by the event controller are
+        # derived from membership state too
+        self.env.cr.cache.pop('popcorn_eligibility', None)
+        request_memo = self.env.cr.cache.get('popcorn_live_membership', {})
+        dbname = self.env.cr.dbname
+        for partner_id in partner_ids:
+            request_memo.pop(partner_id, None)
+            _live_membership_memo.pop((dbname, partner_id), None)
+
     # Note: Automatic expiration is now handled by cron job for reliability
     
     @api.model
@@ -570,26 +743,27 @@ class PopcornMembership(models.Model):
         self.write(vals)
         return True
 
-    def _evaluate_unlimited_late_no_show_policy(self):
+    def _evaluate_unlimited_late_no_show_policy(self, incident_counts=None):
         """
         Unlimited memberships:
         - if 3+ incidents in the current calendar month => freeze 3 days
         - apply at most once per calendar month
-        """
-        Registration = self.env['event.registration'].sudo()
-        for membership in self:
-            if membership.plan_quota_mode != 'unlimited':
-                continue
-            if membership.state not in ['active', 'frozen']:
-                continue
 
-            now = fields.Datetime.now()
-            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            incident_count = Registration.search_count([
-                ('membership_id', '=', membership.id),
-                ('late_no_show_incident', '=', True),
-                ('late_no_show_incident_date', '>=', month_start),
-            ])
+        `incident_counts` ({membership_id: incidents this month}) is what
+        the penalty policy got back when bumping the counters; missing
+        memberships are read from the monthly violation counters.
+        """
+        Counter = self.env['popcorn.membership.violation.counter']
+        unlimited = self.filtered(
+            lambda m: m.plan_quota_mode == 'unlimited' and m.state in ['active', 'frozen']
+        )
+        incident_counts = dict(incident_counts or {})
+        missing = [membership_id for membership_id in unlimited.ids if membership_id not in incident_counts]
+        incident_counts.update(Counter._get_counts(missing, 'incident'))
+        now = fields.Datetime.now()
+        month_start = Counter._get_month_start()
+        for membership in unlimited:
+            incident_count = incident_counts.get(membership.id, 0)
             if incident_count < 3:
                 continue
 
@@ -920,37 +1094,34 @@ class PopcornMembership(models.Model):
         return False
     
     @api.model
+    @traced('cron.expire_memberships')
     def _cron_expire_memberships(self):
-        """Cron job to expire memberships past their effective end date or with zero points"""
-        
+        """Cron job to expire memberships past their effective end date or with zero points
+
+        Both conditions are indexed stored fields, so this is two range scans
+        and one bulk state transition rather than a per-membership loop.
+        """
+        live = [('state', 'in', ['active', 'frozen'])]
+
         # 1. Expire memberships past their effective end date
-        expired_memberships = self.search([
-            ('state', 'in', ['active', 'frozen']),
-            ('effective_end_date', '<', fields.Date.today())
-        ])
-        
-        for membership in expired_memberships:
-            membership.action_expire()
-        
+        past_end = self.search(live + [('effective_end_date', '<', fields.Date.today())])
+
         # 2. Expire points-based memberships with zero points
-        points_memberships = self.search([
-            ('state', 'in', ['active', 'frozen']),
-            ('membership_plan_id.quota_mode', '=', 'points')
-        ])
-        
-        for membership in points_memberships:
-            # Force recomputation of points_remaining
-            membership.invalidate_recordset(['points_remaining'])
-            membership.flush_recordset(['points_remaining'])
-            
-            if membership.points_remaining == 0:
-                _logger.info(f"Cron: Auto-expiring membership {membership.id} due to zero points")
-                membership.action_expire()
-                membership.message_post(
-                    body=_('Membership automatically expired by cron: All points have been used')
-                )
-    
+        no_points = self.search(live + [('points_exhausted', '=', True)]) - past_end
+
+        to_expire = past_end | no_points
+        if not to_expire:
+            return
+
+        _logger.info('Cron: expiring %s membership(s) past their end date and %s with zero points',
+                     len(past_end), len(no_points))
+        to_expire.write({'state': 'expired'})
+        if no_points:
+            body = _('Membership automatically expired by cron: All points have been used')
+            no_points._message_log_batch(bodies={membership.id: body for membership in no_points})
+
     @api.model
+    @traced('cron.renewal_eligibility')
     def _cron_check_renewal_eligibility(self):
         """Cron job to check renewal eligibility and send notifications"""
         # Check Gold plans for early renewal
@@ -979,6 +1150,7 @@ class PopcornMembership(models.Model):
                 pass
     
     @api.model
+    @traced('cron.expiry_followup_activities')
     def _cron_create_expiry_followup_activities(self):
         """Cron job to create follow-up activities for memberships nearing expiration"""
         # Get the follow-up group users
@@ -993,68 +1165,82 @@ class PopcornMembership(models.Model):
             activity_type = self.env['mail.activity.type'].search([('name', '=', 'To Do')], limit=1)
         
         today = fields.Date.today()
-        
-        # Get all active/frozen memberships
-        active_memberships = self.search([
+
+        # (plan, target expiry date) -> interval, parsed once per plan.
+        # Archived plans still have live memberships to follow up.
+        plans = self.env['popcorn.membership.plan'].with_context(active_test=False).search([])
+        targets = {}
+        for plan in plans:
+            for days_before_expiry in plan._get_expiry_followup_intervals():
+                target_date = today + timedelta(days=days_before_expiry)
+                targets.setdefault((plan.id, target_date), days_before_expiry)
+        if not targets:
+            return
+
+        # One query for every membership expiring on any target date
+        candidates = self.search([
             ('state', 'in', ['active', 'frozen']),
-            ('effective_end_date', '!=', False)
+            ('membership_plan_id', 'in', plans.ids),
+            ('effective_end_date', 'in', list({date for _plan_id, date in targets})),
         ])
-        
-        # Process each membership based on its plan's follow-up days
-        for membership in active_memberships:
-            # Get follow-up days from the membership plan (default to '7' if not set)
-            followup_days_str = membership.membership_plan_id.expiry_followup_days or '7'
-            
-            # Parse comma-separated values
-            try:
-                followup_days_list = [int(day.strip()) for day in followup_days_str.split(',') if day.strip()]
-            except (ValueError, AttributeError):
-                # If parsing fails, use default of 7 days
-                followup_days_list = [7]
-            
-            # Check each follow-up interval
-            for days_before_expiry in followup_days_list:
-                # Calculate target date for this interval
-                target_date = today + timedelta(days=days_before_expiry)
-                
-                # Check if this membership expires on the target date
-                if membership.effective_end_date != target_date:
-                    continue
-                
-                # Check if activity already exists for this membership at this interval
-                existing_activity = self.env['mail.activity'].search([
-                    ('res_model', '=', 'popcorn.membership'),
-                    ('res_id', '=', membership.id),
-                    ('activity_type_id', '=', activity_type.id if activity_type else False),
-                    ('summary', 'ilike', f'Membership Expiring in {days_before_expiry} days')
-                ], limit=1)
-                
-                if existing_activity:
-                    # Skip if activity already exists for this interval
-                    continue
-                
-                # Create activity for each user in the follow-up group
-                for user in followup_group.users:
-                    activity_vals = {
-                        'activity_type_id': activity_type.id if activity_type else False,
-                        'summary': f'Membership Expiring in {days_before_expiry} days: {membership.display_name}',
-                        'note': f'''
-                            <p>The membership for <strong>{membership.partner_id.name}</strong> is expiring in <strong>{days_before_expiry} days</strong>.</p>
-                            <ul>
-                                <li><strong>Plan:</strong> {membership.membership_plan_id.name}</li>
-                                <li><strong>Expiry Date:</strong> {membership.effective_end_date}</li>
-                                <li><strong>Status:</strong> {dict(membership._fields['state'].selection)[membership.state]}</li>
-                            </ul>
-                            <p>Please contact the member to discuss renewal options.</p>
-                        ''',
-                        'date_deadline': today,
-                        'res_model_id': self.env['ir.model']._get('popcorn.membership').id,
-                        'res_id': membership.id,
-                        'user_id': user.id,
-                    }
-                    
-                    self.env['mail.activity'].create(activity_vals)
-    
+        due = []
+        for membership in candidates:
+            days_before_expiry = targets.get((membership.membership_plan_id.id, membership.effective_end_date))
+            if days_before_expiry is not None:
+                due.append((membership, days_before_expiry))
+        if not due:
+            return
+
+        # Skip the (membership, interval) pairs already followed up for this expiry date
+        existing = {
+            (marker.membership_id.id, marker.interval_days, marker.expiry_date)
+            for marker in self.env['popcorn.membership.followup'].search([
+                ('membership_id', 'in', [membership.id for membership, _days in due]),
+            ])
+        }
+        due = [
+            (membership, days_before_expiry) for membership, days_before_expiry in due
+            if (membership.id, days_before_expiry, membership.effective_end_date) not in existing
+        ]
+        if not due:
+            return
+
+        res_model_id = self.env['ir.model']._get('popcorn.membership').id
+        state_labels = dict(self._fields['state'].selection)
+        activity_vals_list = []
+        marker_vals_list = []
+        for membership, days_before_expiry in due:
+            note = f'''
+                <p>The membership for <strong>{membership.partner_id.name}</strong> is expiring in <strong>{days_before_expiry} days</strong>.</p>
+                <ul>
+                    <li><strong>Plan:</strong> {membership.membership_plan_id.name}</li>
+                    <li><strong>Expiry Date:</strong> {membership.effective_end_date}</li>
+                    <li><strong>Status:</strong> {state_labels[membership.state]}</li>
+                </ul>
+                <p>Please contact the member to discuss renewal options.</p>
+            '''
+            # One activity for each user in the follow-up group
+            for user in followup_group.users:
+                activity_vals_list.append({
+                    'activity_type_id': activity_type.id if activity_type else False,
+                    'summary': f'Membership Expiring in {days_before_expiry} days: {membership.display_name}',
+                    'note': note,
+                    'date_deadline': today,
+                    'res_model_id': res_model_id,
+                    'res_id': membership.id,
+                    'user_id': user.id,
+                })
+            marker_vals_list.append({
+                'membership_id': membership.id,
+                'interval_days': days_before_expiry,
+                'expiry_date': membership.effective_end_date,
+            })
+
+        self.env['popcorn.membership.followup'].create(marker_vals_list)
+        self.env['mail.activity'].create(activity_vals_list)
+        _logger.info('Cron: created %s follow-up activities for %s expiring memberships',
+                     len(activity_vals_list), len(marker_vals_list))
+
     def action_toggle_upgrade_discount(self):
         """Staff action to manually toggle upgrade discount ability"""
         self.ensure_one()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from odoo import fields, models
+
+
+class PopcornMembershipFollowup(models.Model):
+    """Marker of an expiry follow-up already scheduled for a membership.
+
+    One row per (membership, interval, expiry date), written by the expiry
+    follow-up cron. The expiry date is part of the key so that a membership
+    extended past its old end date gets followed up again on the new one.
+    """
+    _name = 'popcorn.membership.followup'
+    _description = 'Membership Expiry Follow-up Marker'
+    _order = 'create_date desc'
+
+    membership_id = fields.Many2one('popcorn.membership', string='Membership', required=True, ondelete='cascade', index=True)
+    interval_days = fields.Integer(string='Days Before Expiry', required=True)
+    expiry_date = fields.Date(string='Expiry Date', required=True)
+
+    _sql_constraints = [
+        ('unique_membership_interval', 'unique(membership_id, interval_days, expiry_date)',
+         'A follow-up is scheduled only once per membership, interval and expiry date')
+    ]
@@ -1,9 +1,22 @@
 # -*- coding: utf-8 -*-
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError, UserError
 from datetime import timedelta
 
+# Columns of the per-plan capability table. Social experience and
+# free-for-members clubs have no permission flag: every plan may attend them.
+CAPABILITY_CLUB_TYPES = ('regular_offline', 'regular_online', 'spclub', 'social_experience', 'free_for_members')
+_CAPABILITY_INDEX = {club_type: index for index, club_type in enumerate(CAPABILITY_CLUB_TYPES)}
+# Plan fields the table is built from; writing any of them rebuilds it.
+CAPABILITY_FIELDS = {
+    'allowed_regular_offline', 'allowed_regular_online', 'allowed_spclub',
+    'points_per_offline', 'points_per_online', 'points_per_sp', 'points_per_social_experience',
+}
+# One row per change to a plan or listed discount; the cached catalogue is
+# keyed on the row count.
+CATALOGUE_VERSION_TABLE = 'popcorn_plan_catalogue_bump'
+
 class PopcornMembershipPlan(models.Model):
     """Standalone membership plans for Popcorn Club"""
     _name = 'popcorn.membership.plan'
@@ -268,6 +281,174 @@ class PopcornMembershipPlan(models.Model):
             self.quota_online = 0
             self.quota_sp = 0
     
+    def init(self):
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CATALOGUE_VERSION_TABLE} (
+                id SERIAL PRIMARY KEY,
+                create_date TIMESTAMP DEFAULT (now() at time zone 'UTC')
+            )
+        """)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        plans = super().create(vals_list)
+        self._bump_catalogue_version()
+        return plans
+
+    def write(self, vals):
+        """Start a new catalogue version on any change.
+
+        The capability tables are keyed on write_date, which a second write
+        in the same transaction leaves as it was: only then are they dropped.
+        """
+        rewritten = CAPABILITY_FIELDS.intersection(vals) and any(
+            plan.write_date == self.env.cr.now() for plan in self)
+        res = super().write(vals)
+        if rewritten:
+            self.env.registry.clear_cache()
+        self._bump_catalogue_version()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self._bump_catalogue_version()
+        return res
+
+    def _build_capability_row(self):
+        """(allowed flags, points costs) of this plan, in CAPABILITY_CLUB_TYPES order"""
+        self.ensure_one()
+        allowed = (
+            bool(self.allowed_regular_offline),
+            bool(self.allowed_regular_online),
+            bool(self.allowed_spclub),
+            True,
+            True,
+        )
+        cost = (
+            self.points_per_offline or 0,
+            self.points_per_online or 0,
+            self.points_per_sp or 0,
+            self.points_per_social_experience or 0,
+            0,
+        )
+        return allowed, cost
+
+    @tools.ormcache('plan_id', 'write_date')
+    def _get_cached_capability_row(self, plan_id, write_date):
+        return self.sudo().browse(plan_id)._build_capability_row()
+
+    def _get_capability_row(self):
+        """Capability row from the process cache, built once per plan until the plan changes"""
+        self.ensure_one()
+        if not isinstance(self.id, int):
+            # Unsaved plan (onchange): nothing to cache yet
+            return self._build_capability_row()
+        return self._get_cached_capability_row(self.id, self.write_date)
+
+    def cost_for(self, club_types):
+        """Points one registration of each club type costs on this plan, in the same order.
+
+        Only meaningful for points plans; unknown club types cost 0.
+        """
+        cost = self._get_capability_row()[1]
+        return [cost[_CAPABILITY_INDEX[club_type]] if club_type in _CAPABILITY_INDEX else 0
+                for club_type in club_types]
+
+    def allowed_matrix(self, club_types=CAPABILITY_CLUB_TYPES):
+        """{plan_id: tuple of allowed flags, one per club type} for every plan in self.
+
+        Unknown or empty club types are not gated by any plan flag and come
+        out as allowed.
+        """
+        indexes = [_CAPABILITY_INDEX.get(club_type) for club_type in club_types]
+        matrix = {}
+        for plan in self:
+            allowed = plan._get_capability_row()[0]
+            matrix[plan.id] = tuple(True if index is None else allowed[index] for index in indexes)
+        return matrix
+
+    def _is_club_type_allowed(self, club_type):
+        """Whether members of this plan may attend clubs of this type"""
+        self.ensure_one()
+        return self.allowed_matrix([club_type])[self.id][0]
+
+    def _get_points_cost(self, club_type):
+        """Points one registration of club_type costs on this plan (0 for unpriced types)"""
+        return self.cost_for([club_type])[0]
+
+    @api.model
+    def _bump_catalogue_version(self):
+        """Start a new catalogue version; every worker rebuilds it on its next read.
+
+        An insert takes no lock another transaction waits on, and it only
+        shows once this transaction commits, so no worker caches the old
+        data under the new version.
+        """
+        self.env.cr.execute(f"INSERT INTO {CATALOGUE_VERSION_TABLE} DEFAULT VALUES")
+
+    @api.model
+    def _get_plan_catalogue(self):
+        """Static part of the membership pages, shared by every visitor.
+
+        Returns {'version', 'plan_ids', 'plans'}: plan_ids are the published
+        plans in display order, plans maps every active plan id to its
+        benefits, summary, prices, cover image URL and the ids of the
+        discounts it could get today before looking at the customer. The
+        value is cached per process: treat it as read-only.
+        """
+        # The row count, not max(id): ids are handed out before commit, so a
+        # slow transaction can commit a lower id than one already seen.
+        self.env.cr.execute(f"SELECT count(*) FROM {CATALOGUE_VERSION_TABLE}")
+        version = self.env.cr.fetchone()[0]
+        return self._get_cached_plan_catalogue(version, fields.Date.today())
+
+    @tools.ormcache('version', 'today')
+    def _get_cached_plan_catalogue(self, version, today):
+        plans = self.sudo().search([('active', '=', True)])
+        # Same candidates as get_available_discounts: no customer coupons, no codes
+        discounts = self.env['popcorn.discount'].sudo().search([
+            ('active', '=', True),
+            ('partner_id', '=', False),
+            ('code', '=', False),
+        ]).filtered(lambda d: d._is_currently_valid(today))
+        global_ids = [discount.id for discount in discounts if not discount.membership_plan_ids]
+        covers = {
+            attachment.res_id: attachment.checksum
+            for attachment in self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'cover_image'),
+                ('res_id', 'in', plans.ids),
+            ])
+        }
+        entries = {}
+        for plan in plans:
+            linked_ids = [discount.id for discount in plan.discount_ids & discounts]
+            entries[plan.id] = {
+                'id': plan.id,
+                'benefits': tuple(plan.get_membership_benefits()),
+                'summary': plan.plan_summary,
+                'price_normal': plan.price_normal,
+                'price_first_timer': plan.price_first_timer,
+                'cover_image_url': covers.get(plan.id) and '/web/image/%s/%s/cover_image?unique=%s' % (
+                    self._name, plan.id, covers[plan.id][:8]),
+                'discount_ids': tuple(dict.fromkeys(linked_ids + global_ids)),
+            }
+        return {
+            'version': version,
+            'plan_ids': tuple(plan.id for plan in plans if plan.website_published),
+            'plans': entries,
+        }
+
+    def _get_expiry_followup_intervals(self):
+        """Parse expiry_followup_days into a sorted list of day counts (default [7])"""
+        self.ensure_one()
+        try:
+            intervals = {int(day.strip()) for day in (self.expiry_followup_days or '7').split(',') if day.strip()}
+        except (ValueError, AttributeError):
+            # If parsing fails, use default of 7 days
+            intervals = {7}
+        return sorted(intervals)
+
     def get_membership_benefits(self):
         """Get a structured list of membership benefits"""
         self.ensure_one()
@@ -334,23 +515,28 @@ class PopcornMembershipPlan(models.Model):
         """
         self.ensure_one()
         
-        # Get discounts linked to this plan (exclude partner-specific and codes)
-        linked_discounts = self.discount_ids.filtered(
-            lambda d: d._is_currently_valid() and
-                     not d.partner_id and
-                     not d.code  # Exclude coupon codes
-        )
-        
-        # Get global discounts (not linked to specific plans)
-        # Exclude partner-specific and codes
-        global_discounts = self.env['popcorn.discount'].search([
-            ('active', '=', True),
-            ('membership_plan_ids', '=', False),
-            ('partner_id', '=', False),  # Exclude first-timer discounts
-            ('code', '=', False),  # Exclude coupon codes (require manual entry)
-        ]).filtered(lambda d: d._is_currently_valid())
-        
-        all_discounts = linked_discounts | global_discounts
+        entry = self._get_plan_catalogue()['plans'].get(self.id)
+        if entry is not None:
+            # Candidates of active plans come from the shared catalogue
+            all_discounts = self.env['popcorn.discount'].browse(entry['discount_ids'])
+        else:
+            # Get discounts linked to this plan (exclude partner-specific and codes)
+            linked_discounts = self.discount_ids.filtered(
+                lambda d: d._is_currently_valid() and
+                         not d.partner_id and
+                         not d.code  # Exclude coupon codes
+            )
+            
+            # Get global discounts (not linked to specific plans)
+            # Exclude partner-specific and codes
+            global_discounts = self.env['popcorn.discount'].search([
+                ('active', '=', True),
+                ('membership_plan_ids', '=', False),
+                ('partner_id', '=', False),  # Exclude first-timer discounts
+                ('code', '=', False),  # Exclude coupon codes (require manual entry)
+            ]).filtered(lambda d: d._is_currently_valid())
+            
+            all_discounts = linked_discounts | global_discounts
         
         # Filter by customer type if customer is provided
         if customer_partner:
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+# Registration flag and date each policy counts, as (flag, date field).
+POLICY_FLAGS = {
+    'incident': ('late_no_show_incident', 'late_no_show_incident_date'),
+    'quota': ('quota_penalty_violation', 'quota_penalty_violation_date'),
+}
+
+
+class PopcornMembershipViolationCounter(models.Model):
+    """Attendance policy violations of a membership in one calendar month.
+
+    One row per (membership, policy, month), bumped by the attendance
+    penalty policy as registrations are flagged, so a policy decision is a
+    keyed read instead of a count over registrations. A key seen for the
+    first time is seeded from the registration flags, which also covers a
+    month that started before the counter existed.
+    """
+    _name = 'popcorn.membership.violation.counter'
+    _description = 'Membership Attendance Violation Counter'
+    _order = 'month desc, membership_id'
+
+    membership_id = fields.Many2one('popcorn.membership', string='Membership', required=True, ondelete='cascade', index=True)
+    policy = fields.Selection([
+        ('incident', 'Late/No-show Incidents (Unlimited)'),
+        ('quota', 'Quota Penalty Violations (Bucket/Points)'),
+    ], string='Policy', required=True)
+    month = fields.Date(string='Month', required=True, help='First day of the calendar month counted')
+    count = fields.Integer(string='Violations', default=0)
+
+    _sql_constraints = [
+        ('unique_membership_policy_month', 'unique(membership_id, policy, month)',
+         'A membership has one violation counter per policy and month')
+    ]
+
+    @api.model
+    def _get_month_start(self):
+        """Start of the current calendar month, the window every policy counts over"""
+        return fields.Datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    @api.model
+    def _get_counts(self, membership_ids, policy):
+        """Return {membership_id: violations this month} for the given memberships"""
+        membership_ids = {membership_id for membership_id in membership_ids if membership_id}
+        if not membership_ids:
+            return {}
+        month_start = self._get_month_start()
+        counts = self._read_counts(membership_ids, policy, month_start)
+        missing = membership_ids - set(counts)
+        if missing:
+            seeded = self._seed(missing, policy, month_start)
+            # Keys seeded by a concurrent transaction in the meantime
+            raced = missing - set(seeded)
+            counts.update(seeded)
+            if raced:
+                counts.update(self._read_counts(raced, policy, month_start))
+        return counts
+
+    @api.model
+    def _increment(self, deltas, policy):
+        """Add {membership_id: new violations} to this month's counters.
+
+        Call once the registrations are flagged: a counter met for the first
+        time is seeded from the flags, which already include the new ones.
+        Returns {membership_id: violations this month}.
+        """
+        deltas = {membership_id: delta for membership_id, delta in deltas.items() if membership_id and delta}
+        if not deltas:
+            return {}
+        month_start = self._get_month_start()
+        counts = self._add(deltas, policy, month_start)
+        missing = set(deltas) - set(counts)
+        if missing:
+            seeded = self._seed(missing, policy, month_start)
+            # A concurrent transaction seeded these keys from flags that do
+            # not include ours: add our violations to its count.
+            raced = missing - set(seeded)
+            counts.update(seeded)
+            if raced:
+                counts.update(self._add({membership_id: deltas[membership_id] for membership_id in raced},
+                                        policy, month_start))
+        return counts
+
+    @api.model
+    def _read_counts(self, membership_ids, policy, month_start):
+        self.env.cr.execute("""
+            SELECT membership_id, count
+              FROM popcorn_membership_violation_counter
+             WHERE policy = %s AND month = %s AND membership_id IN %s
+        """, (policy, month_start.date(), tuple(membership_ids)))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _add(self, deltas, policy, month_start):
+        """Add deltas to the existing counters; returns {membership_id: count} of the ones found"""
+        self.env.cr.execute("""
+            UPDATE popcorn_membership_violation_counter c
+               SET count = c.count + v.delta,
+                   write_uid = %s,
+                   write_date = now() at time zone 'UTC'
+              FROM (SELECT unnest(%s::int[]) AS membership_id, unnest(%s::int[]) AS delta) v
+             WHERE c.membership_id = v.membership_id AND c.policy = %s AND c.month = %s
+         RETURNING c.membership_id, c.count
+        """, (self.env.uid, list(deltas), list(deltas.values()), policy, month_start.date()))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _seed(self, membership_ids, policy, month_start):
+        """Create this month's counters from the registration flags, in one grouped count.
+
+        Returns {membership_id: count} of the counters created; keys a
+        concurrent transaction seeded first are left out.
+        """
+        flag, date_field = POLICY_FLAGS[policy]
+        counts = dict.fromkeys(membership_ids, 0)
+        groups = self.env['event.registration'].sudo()._read_group(
+            [
+                ('membership_id', 'in', list(membership_ids)),
+                (flag, '=', True),
+                (date_field, '>=', month_start),
+            ],
+            ['membership_id'],
+            ['__count'],
+        )
+        for membership, count in groups:
+            counts[membership.id] = count
+        self.env.cr.execute("""
+            INSERT INTO popcorn_membership_violation_counter
+                   (membership_id, policy, month, count, create_uid, create_date, write_uid, write_date)
+            SELECT v.membership_id, %s, %s, v.count,
+                   %s, now() at time zone 'UTC', %s, now() at time zone 'UTC'
+              FROM (SELECT unnest(%s::int[]) AS membership_id, unnest(%s::int[]) AS count) v
+            ON CONFLICT (membership_id, policy, month) DO NOTHING
+         RETURNING membership_id, count
+        """, (policy, month_start.date(), self.env.uid, self.env.uid, list(counts), list(counts.values())))
+        return dict(self.env.cr.fetchall())
@@ -1,13 +1,66 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
+from markupsafe import Markup, escape
 from datetime import timedelta
 import re
 import logging
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
+PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')
+# Fields _get_compiled_templates reads; writing any of them drops the cache.
+TEMPLATE_FIELDS = {'title', 'message', 'wechat_data_mapping'}
+
+
+class NotificationTemplate:
+    """Notification content parsed once: literal text and {placeholder} names alternate in `parts`
+
+    `sources` maps each placeholder to where it is read from, in order of
+    preference: 'partner', 'membership', 'registration', or 'renewal' for
+    the computed last_renewal_date. `needs` tells which related records a
+    render has to fetch.
+    """
+    __slots__ = ('parts', 'sources', 'needs', 'markup')
+
+    def __init__(self, parts, sources, markup=False):
+        self.parts = parts
+        self.sources = sources
+        self.markup = markup
+        needs = set()
+        for placeholder_sources in sources.values():
+            if placeholder_sources[:1] != ('partner',):
+                needs.update('membership' if source == 'renewal' else source for source in placeholder_sources)
+        self.needs = frozenset(needs)
+
+    def resolve(self, placeholder, records):
+        """Raw value of a placeholder from {'partner': ..., 'membership': ..., 'registration': ...}"""
+        for source in self.sources[placeholder]:
+            if source == 'renewal':
+                membership = records['membership']
+                if membership and membership.effective_end_date:
+                    return membership.effective_end_date - timedelta(days=30)
+                return None
+            record = records[source]
+            if source == 'partner' or record:
+                return getattr(record, placeholder, '')
+        return None
+
+    def render(self, values):
+        """Join the parts with the texts of the placeholders from `values`"""
+        if self.markup:
+            return Markup('').join(
+                Markup(part) if index % 2 == 0 else escape(values[part]) for index, part in enumerate(self.parts))
+        return ''.join(part if index % 2 == 0 else values[part] for index, part in enumerate(self.parts))
+
+
+# Partners handled at once when a campaign streams its audience, which
+# bounds its memory whatever the size of the audience.
+CAMPAIGN_CHUNK_SIZE = 1000
+
 
 class PopcornNotification(models.Model):
     _name = 'popcorn.notification'
@@ -63,12 +116,23 @@ class PopcornNotification(models.Model):
     notification_rule_ids = fields.One2many('popcorn.notification.rule', 'notification_id', 
                                            string='Notification Rules')
     
+    # WeChat delivery through the notification outbox
+    wechat_template_code = fields.Char('WeChat Template ID',
+                                       help='Template message ID of the official account. When set, the '
+                                            'notification outbox sends this template itself; otherwise it '
+                                            'delivers through the installed WeChat integration.')
+    wechat_data_mapping = fields.Text('WeChat Template Data',
+                                      help='One template field per line as "key: text", e.g. '
+                                           '"thing1: {event_name}". Texts accept the same {field_name} '
+                                           'placeholders as the message.')
+
     # Display frequency
     show_once_per_session = fields.Boolean('Show Once Per Session', default=False,
                                           help='Show notification only once per user session')
     show_once_per_user = fields.Boolean('Show Once Per User', default=False,
                                        help='Show notification only once per user (stored in browser)')
 
+    @traced('notification.evaluate')
     def _evaluate_notification_for_partner(self, partner):
         """Evaluate if a partner should see this notification based on all rules"""
         self.ensure_one()
@@ -86,467 +150,368 @@ class PopcornNotification(models.Model):
                 return False
         return True
     
-    def _bulk_filter_partners_for_notification(self):
+    def _get_campaign_base_domains(self):
+        """Related models a campaign audience is drawn from, with the filter always applied to them.
+
+        A rule on res.partner alone never selects an audience: notifications
+        must not be broadcast to every contact.
         """
-        Bulk filter partners that match this notification's rules using Odoo ORM.
-        This is much more efficient than evaluating each partner individually.
-        
-        Returns: recordset of res.partner records that match all rules
+        return {
+            'popcorn.membership': [('state', 'in', ['active', 'frozen'])],
+            'popcorn.discount': [('active', '=', True)],
+            'event.registration': [
+                ('event_start_time', '>', fields.Datetime.now()),
+                ('state', 'in', ['open', 'done']),
+            ],
+        }
+
+    def _get_campaign_plan(self):
+        """Split the active rules into what SQL can filter and what Python must.
+
+        Returns None when the notification cannot target anyone, otherwise
+        a dict with:
+        - partner_domain: domain on res.partner, stored partner rules and
+          the WeChat OpenID requirement included
+        - partner_rules: partner rules SQL cannot check (non-stored fields,
+          operators without a domain leaf)
+        - subqueries: SQL conditions on res_partner.id, one per related model
+        - computed: [(model name, domain, rules)] for related models with
+          such rules, evaluated in Python per chunk
         """
         self.ensure_one()
-        
-        _logger.debug(f'[Bulk Filter] Starting bulk filter for notification "{self.name}" (ID: {self.id})')
-        
         if not self.active:
-            _logger.debug(f'[Bulk Filter] Notification {self.id} is not active, returning empty')
-            return self.env['res.partner'].browse()
-        
+            return None
         active_rules = self.notification_rule_ids.filtered('active')
-        _logger.debug(f'[Bulk Filter] Found {len(active_rules)} active rule(s)')
-        
         if not active_rules:
-            # No rules - but we still shouldn't search all partners
-            # Return empty - notifications should have rules
             _logger.warning('[Bulk Filter] No active rules, returning empty (notifications should have rules)')
-            return self.env['res.partner'].browse()
-        
-        # Group rules by model to build efficient domain queries
+            return None
+
+        base_domains = self._get_campaign_base_domains()
         rules_by_model = {}
         for rule in active_rules:
-            model_name = rule.model_id.model if rule.model_id else None
-            if model_name not in rules_by_model:
-                rules_by_model[model_name] = []
-            rules_by_model[model_name].append(rule)
-        
-        _logger.debug(f'[Bulk Filter] Rules grouped by model: {list(rules_by_model.keys())}')
-        
-        # Determine primary model to start from (most selective)
-        # Priority: membership > discount > event.registration > res.partner
-        # We MUST start from a related model, never from all partners
-        primary_model = None
-        if 'popcorn.membership' in rules_by_model:
-            primary_model = 'popcorn.membership'
-        elif 'popcorn.discount' in rules_by_model:
-            primary_model = 'popcorn.discount'
-        elif 'event.registration' in rules_by_model:
-            primary_model = 'event.registration'
-        elif 'res.partner' in rules_by_model:
-            # Only use partner as primary if it's the ONLY model
-            if len(rules_by_model) == 1:
-                primary_model = 'res.partner'
-            else:
-                # If there are other models, use them instead
-                primary_model = None
-        
-        _logger.debug(f'[Bulk Filter] Primary model: {primary_model}')
-        
-        # If no related model found, we can't optimize - return empty
-        if not primary_model or primary_model == 'res.partner':
+            if rule.model_id and rule.field_id:
+                rules_by_model.setdefault(rule.model_id.model, []).append(rule)
+        if not set(rules_by_model) & set(base_domains):
             _logger.warning(
                 f'[Bulk Filter] No related model rules found (membership/discount/event). '
                 f'Cannot optimize - returning empty. Rules are only on: {list(rules_by_model.keys())}'
             )
-            return self.env['res.partner'].browse()
-        
-        # Partner domain for partner-level filters (only for additional partner rules)
-        partner_domain = []
-        matching_partner_ids = set()
-        initial_partners = None
-        
-        # Process rules by model - start with primary model if it's a related model
-        for model_name, rules in sorted(rules_by_model.items(), 
-                                       key=lambda x: (x[0] != primary_model, x[0])):
+            return None
+
+        partner_model = self.env['res.partner']
+        rule_model = self.env['popcorn.notification.rule']
+        plan = {'partner_domain': [], 'partner_rules': rule_model, 'subqueries': [], 'computed': []}
+        if 'wechat_openid' in partner_model._fields:
+            plan['partner_domain'] += [('wechat_openid', '!=', False), ('wechat_openid', '!=', '')]
+
+        for model_name, rules in rules_by_model.items():
             if model_name == 'res.partner':
-                # Direct partner field rules - add to domain
                 for rule in rules:
-                    field_name = rule.field_id.name if rule.field_id else None
-                    if not field_name:
-                        continue
-                    
-                    # Convert value to appropriate type
-                    value = rule.value
-                    if rule.operator in ['=', '!=']:
-                        # Try to convert boolean
-                        if value.lower() == 'true':
-                            value = True
-                        elif value.lower() == 'false':
-                            value = False
-                        # Try to convert integer
-                        elif value.isdigit():
-                            value = int(value)
-                    
-                    # Build domain condition
-                    if rule.operator == '=':
-                        partner_domain.append((field_name, '=', value))
-                    elif rule.operator == '!=':
-                        partner_domain.append((field_name, '!=', value))
-                    elif rule.operator == '<=':
-                        partner_domain.append((field_name, '<=', int(value) if value.isdigit() else value))
-                    elif rule.operator == '>=':
-                        partner_domain.append((field_name, '>=', int(value) if value.isdigit() else value))
-            
-            elif model_name == 'popcorn.membership':
-                # Membership rules - START FROM ACTIVE MEMBERSHIPS (optimization)
-                membership_domain = []
-                has_computed_field = False
-                
-                # ALWAYS start with active/frozen memberships filter (most selective)
-                membership_domain.append(('state', 'in', ['active', 'frozen']))
-                
-                for rule in rules:
-                    field_name = rule.field_id.name if rule.field_id else None
-                    if not field_name:
-                        continue
-                    
-                    # Skip state field if already added
-                    if field_name == 'state':
-                        continue
-                    
-                    # Check if field is computed (not stored)
-                    field_info = self.env['popcorn.membership']._fields.get(field_name)
-                    if field_info and not field_info.store:
-                        # Computed field - will filter in Python later
-                        has_computed_field = True
-                        continue
-                    
-                    # Stored field - add to domain
-                    value = rule.value
-                    if value.lower() == 'true':
-                        value = True
-                    elif value.lower() == 'false':
-                        value = False
-                    elif value.isdigit():
-                        value = int(value)
-                    
-                    if rule.operator == '=':
-                        membership_domain.append((field_name, '=', value))
-                    elif rule.operator == '<=':
-                        membership_domain.append((field_name, '<=', int(value) if value.isdigit() else value))
-                    elif rule.operator == '>=':
-                        membership_domain.append((field_name, '>=', int(value) if value.isdigit() else value))
-                    elif rule.operator == '!=':
-                        membership_domain.append((field_name, '!=', value))
-                
-                # Find matching memberships (starting from active ones)
-                _logger.debug(f'[Bulk Filter] Searching memberships with domain: {membership_domain}')
-                memberships = self.env['popcorn.membership'].search(membership_domain)
-                _logger.debug(f'[Bulk Filter] Found {len(memberships)} matching membership(s)')
-                
-                if has_computed_field:
-                    # Filter by computed fields in Python
-                    for membership in memberships:
-                        # Evaluate computed field rules
-                        all_rules_pass = True
-                        for rule in rules:
-                            field_name = rule.field_id.name
-                            field_info = self.env['popcorn.membership']._fields.get(field_name)
-                            if field_info and not field_info.store:
-                                # Computed field - evaluate
-                                field_value = getattr(membership, field_name, None)
-                                # Convert value for comparison
-                                comparison_value = rule._convert_value_to_type(field_value, rule.value)
-                                if not rule._evaluate_condition(field_value, rule.operator, comparison_value):
-                                    all_rules_pass = False
-                                    break
-                        
-                        if all_rules_pass and membership.partner_id.id:
-                            matching_partner_ids.add(membership.partner_id.id)
-                else:
-                    # All fields are stored - use membership partner IDs directly
-                    membership_partner_ids = memberships.mapped('partner_id.id')
-                    if initial_partners is None:
-                        initial_partners = set(membership_partner_ids)
+                    leaf = partner_model._fields[rule.field_id.name].store and rule._get_domain_leaf()
+                    if leaf:
+                        plan['partner_domain'].append(leaf)
                     else:
-                        initial_partners &= set(membership_partner_ids)
-            
-            elif model_name == 'event.registration':
-                # Registration rules - START FROM UPCOMING EVENTS (optimization)
-                registration_domain = []
-                has_computed_field = False
-                
-                # ALWAYS start with upcoming events filter (most selective)
-                registration_domain.append(('event_start_time', '>', fields.Datetime.now()))
-                registration_domain.append(('state', 'in', ['open', 'done']))
-                
-                for rule in rules:
-                    field_name = rule.field_id.name if rule.field_id else None
-                    if not field_name:
-                        continue
-                    
-                    # Skip fields already added
-                    if field_name in ['event_start_time', 'state']:
-                        continue
-                    
-                    # Check if field is computed (not stored)
-                    field_info = self.env['event.registration']._fields.get(field_name)
-                    if field_info and not field_info.store:
-                        # Computed field - will filter in Python later
-                        has_computed_field = True
-                        continue
-                    
-                    # Stored field - add to domain
-                    value = rule.value
-                    if value.lower() == 'true':
-                        value = True
-                    elif value.lower() == 'false':
-                        value = False
-                    elif value.isdigit():
-                        value = int(value)
-                    
-                    if rule.operator == '=':
-                        registration_domain.append((field_name, '=', value))
-                    elif rule.operator == '!=':
-                        registration_domain.append((field_name, '!=', value))
-                    elif rule.operator == '<=':
-                        registration_domain.append((field_name, '<=', int(value) if value.isdigit() else value))
-                    elif rule.operator == '>=':
-                        registration_domain.append((field_name, '>=', int(value) if value.isdigit() else value))
-                    elif rule.operator == '>':
-                        registration_domain.append((field_name, '>', int(value) if value.isdigit() else value))
-                    elif rule.operator == '<':
-                        registration_domain.append((field_name, '<', int(value) if value.isdigit() else value))
-                
-                # Find matching registrations (starting from upcoming ones)
-                _logger.debug(f'[Bulk Filter] Searching registrations with domain: {registration_domain}')
-                registrations = self.env['event.registration'].search(registration_domain)
-                _logger.debug(f'[Bulk Filter] Found {len(registrations)} matching registration(s)')
-                
-                if has_computed_field:
-                    # Filter by computed fields in Python
-                    for registration in registrations:
-                        # Evaluate computed field rules
-                        all_rules_pass = True
-                        for rule in rules:
-                            field_name = rule.field_id.name
-                            field_info = self.env['event.registration']._fields.get(field_name)
-                            if field_info and not field_info.store:
-                                # Computed field - evaluate
-                                field_value = getattr(registration, field_name, None)
-                                # Convert value for comparison
-                                comparison_value = rule._convert_value_to_type(field_value, rule.value)
-                                if not rule._evaluate_condition(field_value, rule.operator, comparison_value):
-                                    all_rules_pass = False
-                                    break
-                        
-                        if all_rules_pass and registration.partner_id.id:
-                            matching_partner_ids.add(registration.partner_id.id)
+                        plan['partner_rules'] |= rule
+                continue
+            if model_name not in base_domains:
+                continue
+            model = self.env[model_name]
+            domain = list(base_domains[model_name])
+            base_fields = {leaf[0] for leaf in domain}
+            computed_rules = rule_model
+            for rule in rules:
+                field_name = rule.field_id.name
+                if field_name in base_fields:
+                    continue
+                leaf = model._fields[field_name].store and rule._get_domain_leaf()
+                if leaf:
+                    domain.append(leaf)
                 else:
-                    # All fields are stored - use registration partner IDs directly
-                    registration_partner_ids = registrations.mapped('partner_id.id')
-                    if initial_partners is None:
-                        initial_partners = set(registration_partner_ids)
-                    else:
-                        initial_partners &= set(registration_partner_ids)
-            
-            elif model_name == 'popcorn.discount':
-                # Discount/coupon rules - START FROM ACTIVE DISCOUNTS (optimization)
-                discount_domain = []
-                
-                # ALWAYS start with active discounts filter (most selective)
-                discount_domain.append(('active', '=', True))
-                
-                for rule in rules:
-                    field_name = rule.field_id.name if rule.field_id else None
-                    if not field_name:
-                        continue
-                    
-                    # Skip active field if already added
-                    if field_name == 'active':
-                        continue
-                    
-                    value = rule.value
-                    if value.lower() == 'true':
-                        value = True
-                    elif value.lower() == 'false':
-                        value = False
-                    elif value.isdigit():
-                        value = int(value)
-                    
-                    if rule.operator == '=':
-                        discount_domain.append((field_name, '=', value))
-                    elif rule.operator == '!=':
-                        discount_domain.append((field_name, '!=', value))
-                    elif rule.operator == '<=':
-                        discount_domain.append((field_name, '<=', int(value) if value.isdigit() else value))
-                    elif rule.operator == '>=':
-                        discount_domain.append((field_name, '>=', int(value) if value.isdigit() else value))
-                
-                # Find matching discounts (starting from active ones)
-                _logger.debug(f'[Bulk Filter] Searching discounts with domain: {discount_domain}')
-                discounts = self.env['popcorn.discount'].search(discount_domain)
-                _logger.debug(f'[Bulk Filter] Found {len(discounts)} matching discount(s)')
-                
-                # For discounts, we need to find partners who can use them
-                # This depends on discount configuration (customer_type, partner_id, etc.)
-                # Get partners from:
-                # - partner-specific discounts (discount.partner_id)
-                # - memberships that used these discounts (legacy behavior)
-                discount_partner_ids = set()
-                if discounts:
-                    # 1) Partner-specific discounts (e.g., first-timer coupons)
-                    partner_specific_ids = discounts.mapped('partner_id.id')
-                    if partner_specific_ids:
-                        discount_partner_ids |= set([pid for pid in partner_specific_ids if pid])
-
-                    # Find memberships that used these discounts
-                    memberships_with_discounts = self.env['popcorn.membership'].search([
-                        ('applied_discount_id', 'in', discounts.ids),
-                        ('state', 'in', ['active', 'frozen'])
-                    ])
-                    membership_partner_ids = memberships_with_discounts.mapped('partner_id.id')
-                    if membership_partner_ids:
-                        discount_partner_ids |= set([pid for pid in membership_partner_ids if pid])
-                
-                if initial_partners is None:
-                    initial_partners = discount_partner_ids
-                else:
-                    initial_partners &= discount_partner_ids
-        
-        # Combine results from different models (AND logic - all must match)
-        final_partner_ids = None
-        
-        if matching_partner_ids:
-            # Had computed fields - start with those IDs
-            final_partner_ids = matching_partner_ids
-            if initial_partners is not None:
-                final_partner_ids &= initial_partners
-        elif initial_partners is not None:
-            # Only stored fields from related models
-            final_partner_ids = initial_partners
-        
-        # Apply partner domain filters if any (AND with existing results)
-        # Only apply to already-filtered partners, never search all partners
-        if partner_domain and final_partner_ids:
-            # Apply partner filters only to the partners we already found from related models
-            partners = self.env['res.partner'].browse(list(final_partner_ids))
-            # Filter in Python for partner-level rules (safer than searching all partners)
-            filtered_partner_ids = set()
-            for partner in partners:
-                # Check if partner matches all partner domain rules
-                matches = True
-                for domain_item in partner_domain:
-                    field_name = domain_item[0]
-                    operator = domain_item[1]
-                    value = domain_item[2]
-                    
-                    field_value = getattr(partner, field_name, None)
-                    if operator == '=' and field_value != value:
-                        matches = False
-                        break
-                    elif operator == '!=' and field_value == value:
-                        matches = False
-                        break
-                    elif operator == '<=' and (field_value is None or field_value > value):
-                        matches = False
-                        break
-                    elif operator == '>=' and (field_value is None or field_value < value):
-                        matches = False
-                        break
-                
-                if matches:
-                    filtered_partner_ids.add(partner.id)
-            
-            final_partner_ids = filtered_partner_ids
-            _logger.debug(f'[Bulk Filter] After partner domain filters: {len(final_partner_ids)} partner(s)')
-        
-        # If no related model rules matched, return empty (should not happen)
-        if final_partner_ids is None:
-            _logger.warning(
-                f'[Bulk Filter] No partners found from related models. '
-                f'This should not happen if rules are correct.'
-            )
-            return self.env['res.partner'].browse()
-        
-        # FINAL STEP: Filter by WeChat OpenID (always required for WeChat notifications)
-        if final_partner_ids:
-            partners_with_wechat = self.env['res.partner'].search([
-                ('id', 'in', list(final_partner_ids)),
-                ('wechat_openid', '!=', False),
-                ('wechat_openid', '!=', ''),
-            ])
-            final_partner_ids = set(partners_with_wechat.ids)
-            _logger.debug(f'[Bulk Filter] After WeChat OpenID filter: {len(final_partner_ids)} partner(s)')
-        
-        # Return as recordset
-        result = self.env['res.partner'].browse(list(final_partner_ids)) if final_partner_ids else self.env['res.partner'].browse()
-        _logger.info(f'[Bulk Filter] Notification "{self.name}": Returning {len(result)} matching partner(s) (from {len(final_partner_ids) if final_partner_ids else 0} IDs)')
+                    computed_rules |= rule
+
+            if model_name == 'popcorn.discount':
+                # Few discounts exist: resolve them now, then reach partners
+                # through partner-specific coupons and the memberships they
+                # were applied to.
+                discounts = model.search(domain)
+                if computed_rules:
+                    discounts = discounts.filtered(lambda d: computed_rules._match_record(d))
+                membership_model = self.env['popcorn.membership']
+                memberships = membership_model._search([
+                    ('applied_discount_id', 'in', discounts.ids),
+                    ('state', 'in', ['active', 'frozen']),
+                ])
+                plan['subqueries'].append(SQL(
+                    '(%s IN %s OR %s IN (%s))',
+                    SQL.identifier(partner_model._table, 'id'),
+                    tuple(discounts.partner_id.ids) or (None,),
+                    SQL.identifier(partner_model._table, 'id'),
+                    memberships.subselect(SQL.identifier(membership_model._table, 'partner_id')),
+                ))
+                continue
+
+            plan['subqueries'].append(SQL(
+                '%s IN (%s)',
+                SQL.identifier(partner_model._table, 'id'),
+                model._search(domain).subselect(SQL.identifier(model._table, 'partner_id')),
+            ))
+            if computed_rules:
+                plan['computed'].append((model_name, domain, computed_rules))
+        return plan
+
+    def _iter_campaign_partner_ids(self, chunk_size=CAMPAIGN_CHUNK_SIZE):
+        """Yield the ids of the partners matching all rules, a chunk at a time.
+
+        Stored-field rules of every model are compiled into one query on
+        res.partner that is paged by id, so the database does the joins
+        and a chunk never holds more than `chunk_size` partners. Rules on
+        computed fields are then evaluated for the whole chunk at once.
+        The ORM cache is dropped between chunks to keep memory flat.
+        """
+        self.ensure_one()
+        plan = self._get_campaign_plan()
+        if not plan:
+            return
+        partner_model = self.env['res.partner']
+        last_id = 0
+        while True:
+            query = partner_model._search(plan['partner_domain'] + [('id', '>', last_id)], order='id', limit=chunk_size)
+            for condition in plan['subqueries']:
+                query.add_where(condition)
+            self.env.cr.execute(query.select())
+            partner_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not partner_ids:
+                return
+            last_id = partner_ids[-1]
+            matched = self._filter_campaign_chunk(plan, partner_ids)
+            if matched:
+                yield matched
+            if len(partner_ids) < chunk_size:
+                return
+            self.env.invalidate_all()
+
+    def _filter_campaign_chunk(self, plan, partner_ids):
+        """Apply the computed-field rules of `plan` to one chunk of partner ids.
+
+        Each related model is searched once for the whole chunk, so its
+        computed fields are computed in one batch rather than per partner.
+        A partner passes a model when one of its records passes all rules.
+        """
+        matched = set(partner_ids)
+        for model_name, domain, rules in plan['computed']:
+            records = self.env[model_name].search(domain + [('partner_id', 'in', list(matched))])
+            matched &= set(records.filtered(lambda r: rules._match_record(r)).partner_id.ids)
+            if not matched:
+                return []
+        if plan['partner_rules']:
+            partners = self.env['res.partner'].browse(sorted(matched))
+            matched = set(partners.filtered(lambda p: plan['partner_rules']._match_record(p)).ids)
+        return sorted(matched)
+
+    @traced('notification.bulk_filter')
+    def _bulk_filter_partners_for_notification(self):
+        """
+        Bulk filter partners that match this notification's rules.
+
+        Kept for callers that want the whole audience as one recordset;
+        large broadcasts should go through _iter_campaign_partner_ids or
+        action_send_campaign, which work in bounded memory.
+
+        Returns: recordset of res.partner records that match all rules
+        """
+        self.ensure_one()
+        partner_ids = [pid for chunk in self._iter_campaign_partner_ids() for pid in chunk]
+        _logger.info(f'[Bulk Filter] Notification "{self.name}": Returning {len(partner_ids)} matching partner(s)')
+        return self.env['res.partner'].browse(partner_ids)
+
+    @traced('notification.campaign')
+    def _send_campaign(self, chunk_size=CAMPAIGN_CHUNK_SIZE):
+        """Queue this notification for its whole audience in the notification outbox.
+
+        :return: number of messages queued
+        """
+        self.ensure_one()
+        outbox = self.env['popcorn.notification.outbox'].sudo()
+        queued = 0
+        for partner_ids in self._iter_campaign_partner_ids(chunk_size=chunk_size):
+            queued += len(outbox._enqueue_campaign(self, partner_ids))
+        _logger.info(f'Campaign "{self.name}": queued {queued} message(s)')
+        return queued
+
+    def action_send_campaign(self):
+        """Send this notification to everyone matching its rules, through the outbox."""
+        self.ensure_one()
+        queued = self._send_campaign()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Campaign queued'),
+                'message': _('%s message(s) queued in the notification outbox.', queued),
+                'type': 'success' if queued else 'warning',
+                'sticky': False,
+            },
+        }
+
+    @tools.ormcache('content', 'markup')
+    def _compile_template(self, content, markup=False):
+        """Parse content once into a NotificationTemplate
+
+        Which model each placeholder is read from only depends on the
+        installed fields, so it is resolved here rather than per render.
+        Cached per registry by content, so an edited title or message
+        simply compiles into a new entry. Html content (markup=True) gets
+        its placeholder values escaped, as Markup.replace used to do.
+        """
+        parts = PLACEHOLDER_PATTERN.split(content or '')
+        sources = {}
+        partner_model = self.env['res.partner']
+        membership_model = self.env['popcorn.membership']
+        registration_model = self.env['event.registration']
+        for placeholder in parts[1::2]:
+            if placeholder in sources:
+                continue
+            if placeholder == 'last_renewal_date':
+                sources[placeholder] = ('renewal',)
+            elif hasattr(partner_model, placeholder):
+                sources[placeholder] = ('partner',)
+            else:
+                sources[placeholder] = tuple(
+                    source for source, model in (('membership', membership_model), ('registration', registration_model))
+                    if hasattr(model, placeholder)
+                )
+        return NotificationTemplate(tuple(parts), sources, markup=markup)
+
+    @tools.ormcache('self.id', 'self.env.lang')
+    def _get_compiled_templates(self):
+        """Compiled title, message and WeChat data texts of this notification, cached until they are edited"""
+        self.ensure_one()
+        wechat_data = []
+        for line in (self.wechat_data_mapping or '').splitlines():
+            key, separator, text = line.partition(':')
+            if separator and key.strip():
+                wechat_data.append((key.strip(), self._compile_template(text.strip())))
+        return {
+            'title': self._compile_template(self.title, isinstance(self.title, Markup)),
+            'message': self._compile_template(self.message, isinstance(self.message, Markup)),
+            'wechat_data': tuple(wechat_data),
+        }
+
+    def write(self, vals):
+        result = super().write(vals)
+        if TEMPLATE_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
         return result
-    
-    def _get_dynamic_content(self, partner, content, registration=None):
+
+    def _render_templates(self, partner, templates, registration=None, membership=None):
+        """Render compiled templates for one partner from a single context
+
+        :param partner: res.partner record
+        :param templates: list of NotificationTemplate
+        :param registration: Optional event.registration record to use for event-specific fields
+        :param membership: Optional active popcorn.membership of the partner, e.g. from
+                           _prefetch_render_context
+        :return: list of rendered strings, in the order of templates
+        """
+        needs = set().union(*(template.needs for template in templates))
+        if (membership is None and 'membership' in needs) or (registration is None and 'registration' in needs):
+            prefetched_membership, prefetched_registration = self._prefetch_render_context(
+                partner, membership='membership' in needs and membership is None,
+                registration='registration' in needs and registration is None,
+            )[partner.id]
+            if membership is None:
+                membership = prefetched_membership
+            if registration is None:
+                registration = prefetched_registration
+        
+        # Pass partner's timezone in context so computed fields use correct timezone
+        if registration and partner.tz:
+            registration = registration.with_context(tz=partner.tz)
+        records = {'partner': partner, 'membership': membership, 'registration': registration}
+        values = {}
+        rendered = []
+        for template in templates:
+            for placeholder in template.sources:
+                if placeholder not in values:
+                    values[placeholder] = self._format_placeholder_value(template.resolve(placeholder, records))
+            rendered.append(template.render(values))
+        return rendered
+
+    @api.model
+    def _format_placeholder_value(self, value):
+        """Text for a placeholder value: display names for records, dates without time"""
+        if not value:
+            return ''
+        if isinstance(value, models.BaseModel):
+            return value.display_name if hasattr(value, 'display_name') else value.name
+        if isinstance(value, (int, float)):
+            return str(value)
+        if hasattr(value, 'strftime'):  # Date/datetime
+            return value.strftime('%Y-%m-%d')
+        return str(value)
+
+    def _get_dynamic_content(self, partner, content, registration=None, membership=None):
         """
         Replace dynamic placeholders in content with actual partner, membership, and event registration data
         
         :param partner: res.partner record
         :param content: String content with {placeholder} placeholders
         :param registration: Optional event.registration record to use for event-specific fields
+        :param membership: Optional active popcorn.membership of the partner, e.g. from
+                           _prefetch_render_context; searched when not given
         :return: Content with placeholders replaced
         """
         if not content:
             return content
-            
-        # Find all {field_name} placeholders
-        placeholders = re.findall(r'\{(\w+)\}', content)
-        
-        # Get active membership for this partner
-        active_membership = self.env['popcorn.membership'].search([
-            ('partner_id', '=', partner.id),
-            ('state', 'in', ['active', 'frozen'])
-        ], limit=1)
-        
-        # Use provided registration, or search for upcoming event registration
-        event_registration = registration
-        if not event_registration:
-            # Fall back to searching for upcoming registration (backward compatibility)
-            event_registration = self.env['event.registration'].search([
-                ('partner_id', '=', partner.id),
+        return self._render_templates(partner, [self._compile_template(content, isinstance(content, Markup))],
+                                      registration=registration, membership=membership)[0]
+    
+    def _prefetch_render_context(self, partners, membership=True, registration=True):
+        """Find the records the templates read for a whole batch of partners
+
+        At most two searches for the batch instead of two per rendered text.
+
+        :param partners: res.partner recordset
+        :param membership: whether to search active memberships
+        :param registration: whether to search upcoming registrations
+        :return: Dict {partner id: (active membership, next upcoming registration)},
+                 empty recordsets when the partner has none or it was not searched
+        """
+        memberships = self.env['popcorn.membership']
+        if membership:
+            memberships = memberships.search([
+                ('partner_id', 'in', partners.ids),
+                ('state', 'in', ['active', 'frozen'])
+            ])
+        registrations = self.env['event.registration']
+        if registration:
+            registrations = registrations.search([
+                ('partner_id', 'in', partners.ids),
                 ('state', 'in', ['open', 'done']),
                 ('event_start_time', '>', fields.Datetime.now())
-            ], order='event_start_time asc', limit=1)
-        
-        # Pass partner's timezone in context so computed fields use correct timezone
-        eval_context = self.env.context.copy() if self.env.context else {}
-        partner_tz = partner.tz or False
-        if partner_tz:
-            eval_context['tz'] = partner_tz
-        
-        for placeholder in placeholders:
-            value = None
+            ], order='event_start_time asc')
+        # Keep the first record per partner, as the per-partner searches do with limit=1
+        membership_by_partner = {}
+        for record in memberships:
+            membership_by_partner.setdefault(record.partner_id.id, record)
+        registration_by_partner = {}
+        for record in registrations:
+            registration_by_partner.setdefault(record.partner_id.id, record)
+        return {
+            partner.id: (
+                membership_by_partner.get(partner.id, memberships.browse()),
+                registration_by_partner.get(partner.id, registrations.browse()),
+            )
+            for partner in partners
+        }
 
-            # Computed placeholders
-            if placeholder == 'last_renewal_date':
-                if active_membership and active_membership.effective_end_date:
-                    value = active_membership.effective_end_date - timedelta(days=30)
-            # Try to get from partner first
-            elif hasattr(partner, placeholder):
-                value = getattr(partner, placeholder, '')
-            # Then try from active membership
-            elif active_membership and hasattr(active_membership, placeholder):
-                value = getattr(active_membership, placeholder, '')
-            # Then try from event registration (either provided or found)
-            elif event_registration and hasattr(event_registration, placeholder):
-                # Evaluate with correct timezone context
-                value = getattr(event_registration.with_context(eval_context), placeholder, '')
-            
-            # Handle different field types
-            if value:
-                if isinstance(value, models.BaseModel):
-                    value = value.display_name if hasattr(value, 'display_name') else value.name
-                elif isinstance(value, (int, float)):
-                    value = str(value)
-                elif hasattr(value, 'strftime'):  # Date/datetime
-                    value = value.strftime('%Y-%m-%d')
-                content = content.replace(f'{{{placeholder}}}', str(value))
-            else:
-                content = content.replace(f'{{{placeholder}}}', '')
-        
-        return content
-    
-    def get_notification_data_for_partner(self, partner, registration=None):
+    def get_notification_data_for_partner(self, partner, registration=None, membership=None):
         """
         Get formatted notification data for display
         
         :param partner: res.partner record
         :param registration: Optional event.registration record to use for event-specific placeholders
+        :param membership: Optional prefetched active membership, see _get_dynamic_content
         :return: Dict with notification data or None if rules don't match
         """
         self.ensure_one()
@@ -554,9 +519,10 @@ class PopcornNotification(models.Model):
         if not self._evaluate_notification_for_partner(partner):
             return None
         
-        # Process dynamic content (pass registration if provided)
-        dynamic_title = self._get_dynamic_content(partner, self.title, registration=registration)
-        dynamic_message = self._get_dynamic_content(partner, self.message, registration=registration)
+        # Title and message are rendered together from one context (pass registration if provided)
+        templates = self._get_compiled_templates()
+        dynamic_title, dynamic_message = self._render_templates(
+            partner, [templates['title'], templates['message']], registration=registration, membership=membership)
         
         return {
             'id': self.id,
@@ -578,6 +544,30 @@ class PopcornNotification(models.Model):
         }
 
 
+    def _get_wechat_message(self, partner, openid, registration=None, membership=None):
+        """Build the template message payload for the WeChat API
+
+        :param partner: res.partner record receiving the message
+        :param openid: the partner's OpenID on the official account
+        :param registration: Optional event.registration record to use for event-specific placeholders
+        :param membership: Optional prefetched active membership, see _get_dynamic_content
+        :return: Dict with touser, template_id, data and optionally url
+        """
+        self.ensure_one()
+        wechat_data = self._get_compiled_templates()['wechat_data']
+        values = self._render_templates(partner, [template for _key, template in wechat_data],
+                                        registration=registration, membership=membership)
+        data = {key: {'value': value} for (key, _template), value in zip(wechat_data, values)}
+        message = {
+            'touser': openid,
+            'template_id': self.wechat_template_code,
+            'data': data,
+        }
+        if self.show_action_button and self.action_button_url:
+            message['url'] = self.action_button_url
+        return message
+
+
 class PopcornNotificationRule(models.Model):
     _name = 'popcorn.notification.rule'
     _description = 'Popcorn Notification Rule'
@@ -722,6 +712,29 @@ class PopcornNotificationRule(models.Model):
         else:
             return string_value
     
+    def _get_domain_leaf(self):
+        """Domain leaf for this rule on a stored field, or None for operators only evaluated in Python"""
+        self.ensure_one()
+        if self.operator not in ('=', '!=', '<', '>', '<=', '>='):
+            return None
+        value = self.value
+        if value.lower() == 'true':
+            value = True
+        elif value.lower() == 'false':
+            value = False
+        elif value.isdigit():
+            value = int(value)
+        return (self.field_id.name, self.operator, value)
+
+    def _match_record(self, record):
+        """Check that a record of the rules' model satisfies all the rules in self (AND logic)"""
+        for rule in self:
+            field_value = record[rule.field_id.name]
+            comparison_value = rule._convert_value_to_type(field_value, rule.value)
+            if not rule._evaluate_condition(field_value, rule.operator, comparison_value):
+                return False
+        return True
+
     def _evaluate_condition(self, field_value, operator, comparison_value):
         """Evaluate the condition based on operator"""
         try:
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import timedelta
+
+from odoo import api, fields, models, _
+from .popcorn_tracing import traced
+from .popcorn_wechat_client import DEFAULT_RATE, WeChatClient, WeChatError, retry_delay
+
+_logger = logging.getLogger(__name__)
+
+# Rows claimed per batch, and batches per cron run before handing over to
+# a fresh run (the cron re-triggers itself while rows are due).
+BATCH_SIZE = 100
+MAX_BATCHES_PER_RUN = 20
+
+# A claimed row is hidden from other workers for this long. If the worker
+# dies mid-batch the rows simply become due again afterwards.
+CLAIM_LEASE_SECONDS = 300
+
+# Sent and skipped rows are kept this long for the throughput metrics.
+OUTBOX_RETENTION_DAYS = 30
+
+CONFIRMED_STATES = ('open', 'confirmed', 'done')
+
+# One client per process: it holds the access tokens and the rate limit
+# shared by every cron worker thread.
+_client = WeChatClient()
+
+
+class PopcornNotificationOutbox(models.Model):
+    """Notifications waiting to be delivered outside the member's request.
+
+    Callers such as the overbooking correction only record what has to be
+    sent; the outbox cron claims due rows in batches, builds the messages,
+    commits, and only then talks to WeChat, so no event or registration
+    lock is held while waiting on the network. Failures are retried with
+    exponential backoff until they end up in the dead letters.
+    """
+    _name = 'popcorn.notification.outbox'
+    _description = 'Popcorn Notification Outbox'
+    _order = 'id desc'
+    _rec_name = 'notification_id'
+
+    notification_id = fields.Many2one('popcorn.notification', string='Notification', required=True,
+                                      ondelete='cascade', index=True)
+    partner_id = fields.Many2one('res.partner', string='Recipient', required=True, ondelete='cascade', index=True)
+    registration_id = fields.Many2one('event.registration', string='Registration', ondelete='set null', index=True,
+                                      help='Registration the notification is about, used for event placeholders')
+    source = fields.Selection([
+        ('promotion', 'Waitlist Promotion'),
+        ('campaign', 'Campaign'),
+    ], string='Source', default='promotion', required=True,
+        help='Campaign recipients were matched against the rules in bulk when queued, '
+             'so the rules are not evaluated again for each of them')
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('skipped', 'Skipped'),
+        ('dead', 'Dead Letter'),
+    ], string='Status', default='pending', required=True, index=True)
+    attempts = fields.Integer(string='Failed Attempts', default=0)
+    next_attempt_at = fields.Datetime(string='Next Attempt', default=fields.Datetime.now, index=True,
+                                      help='Pending rows are not picked up before this time')
+    sent_at = fields.Datetime(string='Sent At')
+    msgid = fields.Char(string='WeChat Message ID')
+    last_error = fields.Text(string='Last Error')
+
+    # ------------------------------------------------------------------
+    # Enqueueing
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _enqueue(self, notification, registrations):
+        """Queue `notification` for the partners of `registrations`.
+
+        A registration already waiting for the same notification is not
+        queued twice, so callers may enqueue on every correction run.
+        """
+        registrations = registrations.filtered('partner_id')
+        if not notification or not registrations:
+            return self.browse()
+        queued = self.search([
+            ('notification_id', '=', notification.id),
+            ('registration_id', 'in', registrations.ids),
+            ('state', '=', 'pending'),
+        ])
+        already_queued = set(queued.registration_id.ids)
+        rows = self.create([{
+            'notification_id': notification.id,
+            'partner_id': registration.partner_id.id,
+            'registration_id': registration.id,
+        } for registration in registrations if registration.id not in already_queued])
+        if rows:
+            self._trigger_dispatch()
+        return rows
+
+    @api.model
+    def _enqueue_campaign(self, notification, partner_ids):
+        """Queue `notification` for a chunk of campaign recipients.
+
+        Partners with the same campaign message still pending are skipped,
+        so a campaign sent twice in a row does not reach anyone twice.
+        """
+        if not notification or not partner_ids:
+            return self.browse()
+        self.env.cr.execute("""
+            SELECT partner_id FROM popcorn_notification_outbox
+             WHERE notification_id = %s AND source = 'campaign' AND state = 'pending'
+               AND partner_id = ANY(%s)
+        """, (notification.id, list(partner_ids)))
+        already_queued = {row[0] for row in self.env.cr.fetchall()}
+        rows = self.create([{
+            'notification_id': notification.id,
+            'partner_id': partner_id,
+            'source': 'campaign',
+        } for partner_id in partner_ids if partner_id not in already_queued])
+        if rows:
+            self._trigger_dispatch()
+        return rows
+
+    @api.model
+    def _trigger_dispatch(self):
+        cron = self.env.ref('popcorn.ir_cron_popcorn_notification_outbox', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    # ------------------------------------------------------------------
+    # Dispatch
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_wechat_config(self):
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        try:
+            rate = float(get_param('popcorn.wechat_send_rate') or DEFAULT_RATE)
+        except ValueError:
+            rate = DEFAULT_RATE
+        return {
+            'app_id': get_param('popcorn.wechat_app_id') or '',
+            'app_secret': get_param('popcorn.wechat_app_secret') or '',
+            'api_base': get_param('popcorn.wechat_api_base') or '',
+            'rate': rate,
+        }
+
+    @api.model
+    @traced('cron.notification_outbox')
+    def _cron_dispatch(self):
+        """Drain the due rows of the outbox, a batch at a time.
+
+        Each batch is claimed and prepared in one short transaction, sent
+        with no transaction open on our side, then recorded in another.
+        """
+        config = self._get_wechat_config()
+        _client.limiter.configure(config['rate'])
+        for _batch in range(MAX_BATCHES_PER_RUN):
+            rows = self._claim_batch()
+            if not rows:
+                return
+            rows._dispatch(config)
+        if self.search_count([('state', '=', 'pending'), ('next_attempt_at', '<=', fields.Datetime.now())], limit=1):
+            self._trigger_dispatch()
+
+    @api.model
+    def _claim_batch(self):
+        """Lease the next due rows to this worker and commit the lease.
+
+        SKIP LOCKED lets concurrent workers claim disjoint batches instead
+        of queueing behind each other.
+        """
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            UPDATE popcorn_notification_outbox
+               SET next_attempt_at = %s
+             WHERE id IN (
+                SELECT id FROM popcorn_notification_outbox
+                 WHERE state = 'pending' AND next_attempt_at <= %s
+              ORDER BY next_attempt_at, id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+             )
+         RETURNING id
+        """, (now + timedelta(seconds=CLAIM_LEASE_SECONDS), now, BATCH_SIZE))
+        ids = sorted(row[0] for row in self.env.cr.fetchall())
+        self.env.cr.commit()
+        self.invalidate_model(['next_attempt_at'])
+        return self.browse(ids)
+
+    def _dispatch(self, config):
+        messages, outcomes = self._prepare_messages()
+        self._record_outcomes(outcomes)
+        self.env.cr.commit()
+
+        # Nothing of ours is locked while WeChat answers.
+        if messages and not (config['app_id'] and config['app_secret']):
+            error = WeChatError('WeChat app id and secret are not configured', retryable=True)
+            results = dict.fromkeys(messages, error)
+        else:
+            results = _client.send_many(config, messages) if messages else {}
+
+        outcomes = {}
+        for row_id, result in results.items():
+            outcomes[row_id] = result if isinstance(result, WeChatError) else ('sent', result)
+        self.browse(list(outcomes)).exists()._record_outcomes(outcomes)
+        self.env.cr.commit()
+
+    def _prepare_messages(self):
+        """Build the WeChat payloads of the claimed rows.
+
+        Returns ({row id: payload}, {row id: outcome}) where the outcomes
+        are the rows settled without a send: recipients who no longer
+        qualify, and notifications delivered through the legacy hook.
+        """
+        messages = {}
+        outcomes = {}
+        has_openid = 'wechat_openid' in self.env['res.partner']._fields
+        # Memberships and upcoming registrations for the placeholders are
+        # fetched for the whole batch, per notification.
+        render_context = {}
+        for notification in self.notification_id.filtered('wechat_template_code'):
+            rows = self.filtered(lambda r: r.notification_id == notification)
+            templates = [template for _key, template in notification._get_compiled_templates()['wechat_data']]
+            needs = set().union(*(template.needs for template in templates))
+            render_context[notification.id] = notification._prefetch_render_context(
+                rows.partner_id, membership='membership' in needs, registration='registration' in needs)
+        for row in self:
+            notification = row.notification_id
+            registration = row.registration_id
+            partner = row.partner_id
+            if not notification.active:
+                outcomes[row.id] = ('skipped', _('Notification is archived'))
+                continue
+            if registration and (registration.state not in CONFIRMED_STATES or registration.is_on_waitlist):
+                outcomes[row.id] = ('skipped', _('Registration is no longer confirmed'))
+                continue
+            if not notification.wechat_template_code:
+                outcomes[row.id] = row._send_legacy()
+                continue
+            openid = partner.wechat_openid if has_openid else False
+            if not openid:
+                outcomes[row.id] = ('skipped', _('Recipient has no WeChat OpenID'))
+                continue
+            try:
+                if row.source != 'campaign' and not notification._evaluate_notification_for_partner(partner):
+                    outcomes[row.id] = ('skipped', _('Notification rules no longer match'))
+                    continue
+                membership, upcoming_registration = render_context[notification.id][partner.id]
+                messages[row.id] = notification._get_wechat_message(
+                    partner, openid, registration=registration or upcoming_registration, membership=membership)
+            except Exception as error:
+                _logger.exception('Popcorn outbox: could not build message for row %s', row.id)
+                outcomes[row.id] = WeChatError(str(error))
+        return messages, outcomes
+
+    def _send_legacy(self):
+        """Deliver through get_notification_data_for_partner.
+
+        Notifications without a template of their own are still sent by
+        the external WeChat integration hooked on that method; it now runs
+        from the outbox instead of inside the overbooking transaction.
+        """
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                data = self.notification_id.get_notification_data_for_partner(
+                    self.partner_id, registration=self.registration_id or None)
+        except Exception as error:
+            _logger.exception('Popcorn outbox: legacy delivery failed for row %s', self.id)
+            return WeChatError(str(error), retryable=True)
+        if not data:
+            return ('skipped', _('Notification rules no longer match'))
+        return ('sent', False)
+
+    def _record_outcomes(self, outcomes):
+        """Store {row id: ('sent' | 'skipped', detail) or WeChatError} on the rows."""
+        now = fields.Datetime.now()
+        finished = self.browse()
+        for row in self.filtered(lambda r: r.id in outcomes):
+            outcome = outcomes[row.id]
+            if isinstance(outcome, WeChatError):
+                attempts = row.attempts + 1
+                delay = retry_delay(attempts) if outcome.retryable else None
+                values = {'attempts': attempts, 'last_error': str(outcome)}
+                if delay is None:
+                    values['state'] = 'dead'
+                    finished |= row
+                    _logger.warning('Popcorn outbox: row %s moved to dead letters after %s attempt(s): %s',
+                                    row.id, attempts, outcome)
+                else:
+                    values['next_attempt_at'] = now + timedelta(seconds=delay)
+                row.write(values)
+                continue
+            state, detail = outcome
+            if state == 'sent':
+                row.write({'state': 'sent', 'sent_at': now, 'msgid': detail or False, 'last_error': False})
+            else:
+                row.write({'state': 'skipped', 'last_error': detail})
+            finished |= row
+        # The flag is what the promotion rules match on, so it is only
+        # cleared once the outbox is done with the registration.
+        finished.registration_id.filtered('pending_wechat_notification').write({
+            'pending_wechat_notification': False,
+        })
+
+    # ------------------------------------------------------------------
+    # Dead letters, metrics and cleanup
+    # ------------------------------------------------------------------
+
+    def action_retry(self):
+        """Put dead letters back in the queue with a fresh set of attempts."""
+        dead = self.filtered(lambda r: r.state == 'dead')
+        dead.write({'state': 'pending', 'attempts': 0, 'next_attempt_at': fields.Datetime.now()})
+        if dead:
+            self._trigger_dispatch()
+
+    @api.model
+    def _get_throughput_metrics(self, hours=24):
+        """Per notification outcome counts, send rate and latency over the last `hours`.
+
+        Latency is the time from enqueueing to delivery of sent rows.
+        """
+        since = fields.Datetime.now() - timedelta(hours=hours)
+        self.env.cr.execute("""
+            SELECT notification_id,
+                   count(*) FILTER (WHERE state = 'pending'),
+                   count(*) FILTER (WHERE state = 'sent'),
+                   count(*) FILTER (WHERE state = 'skipped'),
+                   count(*) FILTER (WHERE state = 'dead'),
+                   coalesce(sum(attempts), 0),
+                   avg(extract(epoch FROM sent_at - create_date)) FILTER (WHERE state = 'sent'),
+                   max(extract(epoch FROM sent_at - create_date)) FILTER (WHERE state = 'sent')
+              FROM popcorn_notification_outbox
+             WHERE create_date >= %s
+          GROUP BY notification_id
+        """, (since,))
+        rows = self.env.cr.fetchall()
+        notifications = self.env['popcorn.notification'].browse([row[0] for row in rows])
+        names = {notification.id: notification.name for notification in notifications}
+        return {
+            notification_id: {
+                'name': names.get(notification_id, ''),
+                'pending': pending,
+                'sent': sent,
+                'skipped': skipped,
+                'dead': dead,
+                'failed_attempts': failed_attempts,
+                'sent_per_hour': round(sent / hours, 2),
+                'avg_latency_s': round(avg_latency, 1) if avg_latency is not None else None,
+                'max_latency_s': round(max_latency, 1) if max_latency is not None else None,
+            }
+            for notification_id, pending, sent, skipped, dead, failed_attempts, avg_latency, max_latency in rows
+        }
+
+    @api.autovacuum
+    def _gc_delivered(self):
+        """Drop sent and skipped rows once they are out of the metrics window."""
+        cutoff = fields.Datetime.now() - timedelta(days=OUTBOX_RETENTION_DAYS)
+        self.env.cr.execute("""
+            DELETE FROM popcorn_notification_outbox
+             WHERE state IN ('sent', 'skipped') AND write_date < %s
+        """, (cutoff,))
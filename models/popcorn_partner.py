@@ -1,14 +1,24 @@
 # -*- coding: utf-8 -*-
 
 from odoo import api, fields, models, _
+from odoo.tools.sql import create_index
 
 import pytz
 import logging
 from datetime import datetime, time, timedelta
 from collections import defaultdict
+from .popcorn_tracing import traced
 
 _logger = logging.getLogger(__name__)
 
+# A partner holding a membership in one of these states is a current
+# customer, whatever expired memberships they also have.
+OPEN_MEMBERSHIP_STATES = frozenset({'active', 'frozen', 'pending', 'pending_payment', 'pending_buy_together'})
+
+# Partners turned into PDB per transaction by the pending PDB cron; it
+# re-triggers itself while more are due.
+PDB_BATCH_SIZE = 1000
+
 
 class ResPartner(models.Model):
     """Extends res.partner with Popcorn Club specific fields"""
@@ -141,12 +151,26 @@ class ResPartner(models.Model):
         help='Whether the first-timer discount has been used'
     )
 
+    popcorn_membership_ids = fields.One2many(
+        'popcorn.membership',
+        'partner_id',
+        string='Memberships'
+    )
+
     has_expired_membership = fields.Boolean(
         string='Has Expired Membership',
         compute='_compute_has_expired_membership',
-        store=False,
+        store=True,
         help='True if this partner has expired membership(s) and NO active, frozen, or pending memberships (Old Customer)'
     )
+
+    popcorn_customer_segments = fields.Char(
+        string='Customer Segments',
+        compute='_compute_popcorn_customer_segments',
+        store=True,
+        help='Discount customer types this partner belongs to (first_timer, new, existing, old), '
+             'kept up to date as memberships change state and PDB is applied'
+    )
     
     pdb = fields.Boolean(
         string='PDB',
@@ -382,38 +406,49 @@ class ResPartner(models.Model):
                 partner.first_timer_discount_is_expired = True
                 partner.first_timer_discount_remaining_hours = 0
     
+    @api.depends('popcorn_membership_ids.state')
     def _compute_has_expired_membership(self):
         """Compute if partner is an Old Customer: has expired membership(s) and NO active/frozen/pending memberships"""
+        states = defaultdict(set)
+        partners = self.filtered('id')
+        if partners:
+            for partner, state in self.env['popcorn.membership'].sudo()._read_group(
+                [('partner_id', 'in', partners.ids)], ['partner_id', 'state'],
+            ):
+                states[partner.id].add(state)
         for partner in self:
-            has_expired = bool(
-                self.env['popcorn.membership'].search([
-                    ('partner_id', '=', partner.id),
-                    ('state', '=', 'expired')
-                ], limit=1)
-            )
-            has_active = bool(
-                self.env['popcorn.membership'].search([
-                    ('partner_id', '=', partner.id),
-                    ('state', 'in', ['active', 'frozen', 'pending', 'pending_payment', 'pending_buy_together'])
-                ], limit=1)
-            )
-            partner.has_expired_membership = has_expired and not has_active
+            partner_states = states[partner.id]
+            partner.has_expired_membership = 'expired' in partner_states and not partner_states & OPEN_MEMBERSHIP_STATES
+
+    @api.depends('is_first_timer', 'pdb', 'has_expired_membership')
+    def _compute_popcorn_customer_segments(self):
+        for partner in self:
+            segments = ['first_timer', 'new'] if partner.is_first_timer else ['existing']
+            if partner.has_expired_membership or partner.pdb:
+                segments.append('old')
+            partner.popcorn_customer_segments = ' '.join(segments)
 
+    def _get_customer_segments(self, event_type=None):
+        """Discount customer type codes this partner matches, as a frozenset
+
+        Old customer and PDB discounts do not apply to regular online clubs.
+        """
+        self.ensure_one()
+        segments = frozenset((self.popcorn_customer_segments or '').split())
+        if event_type == 'regular_online':
+            segments -= {'old'}
+        return segments
+
+    @api.depends('first_timer_discount_code')
     def _compute_first_timer_discount_status(self):
         """Compute if first-timer discount has been used"""
+        codes = {code for code in self.mapped('first_timer_discount_code') if code}
+        used = {}
+        if codes:
+            for discount in self.env['popcorn.discount'].sudo().search([('code', 'in', list(codes))]):
+                used.setdefault(discount.code, discount.usage_count > 0)
         for partner in self:
-            if partner.first_timer_discount_code:
-                # Check if the discount has been used
-                discount_record = self.env['popcorn.discount'].sudo().search([
-                    ('code', '=', partner.first_timer_discount_code)
-                ], limit=1)
-                
-                if discount_record:
-                    partner.first_timer_discount_is_used = discount_record.usage_count > 0
-                else:
-                    partner.first_timer_discount_is_used = False
-            else:
-                partner.first_timer_discount_is_used = False
+            partner.first_timer_discount_is_used = used.get(partner.first_timer_discount_code, False)
 
     @api.depends('pdb', 'pdb_date')
     def _compute_is_pdb_today(self):
@@ -421,17 +456,41 @@ class ResPartner(models.Model):
         for partner in self:
             partner.is_pdb_today = partner.pdb and partner.pdb_date == today
 
+    def init(self):
+        super().init()
+        # The pending PDB queue: only partners still in their grace period
+        # are indexed, so the cron never scans partners already converted.
+        create_index(
+            self.env.cr, 'res_partner_pdb_pending_queue_index', self._table, ['pdb_pending_date'],
+            where='pdb_pending_date IS NOT NULL AND pdb IS NOT TRUE',
+        )
+
     @api.model
+    @traced('cron.apply_pending_pdb')
     def _cron_apply_pending_pdb(self):
-        """Hourly cron: convert grace-period partners to PDB after midnight."""
+        """Convert grace-period partners to PDB after midnight.
+
+        Runs hourly, and is triggered for the midnight after each first
+        offline attendance. Pages never apply PDB themselves.
+        """
         today = fields.Date.today()
         pending = self.search([
+            ('pdb_pending_date', '!=', False),
             ('pdb_pending_date', '<', today),
             ('pdb', '=', False),
-            ('pdb_pending_date', '!=', False),
-        ])
-        for partner in pending:
-            partner.pdb = True
+        ], order='pdb_pending_date, id', limit=PDB_BATCH_SIZE)
+        pending.write({'pdb': True})
+        self.env.cr.commit()
+        if len(pending) == PDB_BATCH_SIZE:
+            self.env.ref('popcorn.ir_cron_apply_pending_pdb')._trigger()
+
+    def _start_pdb_grace_period(self):
+        """Start the PDB countdown: first-timers until midnight, PDB from the next day on"""
+        today = fields.Date.today()
+        self.write({'pdb_pending_date': today})
+        self.env.ref('popcorn.ir_cron_apply_pending_pdb').sudo()._trigger(
+            at=datetime.combine(today + timedelta(days=1), time.min)
+        )
 
     def _get_first_timer_discount_record(self):
         """Get the live discount record linked to this partner's first-timer code."""
@@ -468,9 +527,8 @@ class ResPartner(models.Model):
     def action_refresh_all_discount_status(self):
         """Refresh discount status for all partners with discount codes"""
         partners = self.search([('first_timer_discount_code', '!=', False)])
-        for partner in partners:
-            partner._compute_first_timer_discount_remaining_days()
-            partner._compute_first_timer_discount_status()
+        partners._compute_first_timer_discount_remaining_days()
+        partners._compute_first_timer_discount_status()
         return True
     
     @api.model
@@ -505,61 +563,68 @@ class ResPartner(models.Model):
     
     def action_generate_first_timer_discount(self):
         """Generate a first-timer discount code and set expiry date"""
-        for partner in self:
-            if partner.is_first_timer and not partner.first_timer_discount_code:
-                # Generate unique discount code
-                import random
-                import string
-                
-                # Create code like "FIRST123" or "NEW456"
-                prefix = random.choice(['FIRST', 'NEW', 'WELCOME'])
-                suffix = ''.join(random.choices(string.digits, k=3))
-                discount_code = f"{prefix}{suffix}"
-                
-                # Ensure code is unique
-                while self.env['popcorn.discount'].sudo().search([('code', '=', discount_code)]):
-                    suffix = ''.join(random.choices(string.digits, k=3))
-                    discount_code = f"{prefix}{suffix}"
-                
-                # Set expiry date to 21 days from now
-                from datetime import timedelta
-                expiry_date = fields.Date.today() + timedelta(days=21)
-                
-                partner.write({
-                    'first_timer_discount_code': discount_code,
-                    'first_timer_discount_expiry': expiry_date
-                })
-                
-                # Get the first-timer discount amount from system parameter
-                discount_amount = float(self.env['ir.config_parameter'].sudo().get_param(
-                    'popcorn.first_timer_discount_amount', '118.00'
-                ))
-                
-                # Create the actual discount record (restricted to regular offline clubs only)
-                self.env['popcorn.discount'].sudo().create({
-                    'name': f'First Timer Discount - {partner.name}',
-                    'code': discount_code,
-                    'description': f'First timer discount for {partner.name} - Valid for Regular Offline clubs only',
-                    'active': True,
-                    'discount_type': 'fixed_amount',
-                    'discount_value': discount_amount,
-                    'date_from': fields.Date.today(),
-                    'date_to': expiry_date,
-                    'usage_limit': 1,  # Can only be used once
-                    'usage_limit_per_customer': 1,
-                    'customer_type': 'first_timer',
-                    'partner_id': partner.id,  # Restrict to this specific partner
-                    'event_type': 'regular_offline',  # Only valid for regular offline clubs
-                    'is_public': True,
-                    'website_description': f'Welcome discount for {partner.name}! Get {discount_amount}RMB off your first regular offline club registration.'
-                })
-                
-                # Post message
-                partner.message_post(
-                    body=f"🎉 First-timer discount code generated: {discount_code}. Expires on {expiry_date.strftime('%Y-%m-%d')}",
-                    message_type='notification'
-                )
-    
+        partners = self.filtered(lambda partner: partner.is_first_timer and not partner.first_timer_discount_code)
+        if not partners:
+            return
+
+        codes = self._generate_first_timer_discount_codes(len(partners))
+        # Set expiry date to 21 days from now
+        expiry_date = fields.Date.today() + timedelta(days=21)
+        # Get the first-timer discount amount from system parameter
+        discount_amount = float(self.env['ir.config_parameter'].sudo().get_param(
+            'popcorn.first_timer_discount_amount', '118.00'
+        ))
+
+        discount_vals = []
+        messages = {}
+        for partner, discount_code in zip(partners, codes):
+            # Codes differ per partner, so each one is written on its own
+            partner.write({
+                'first_timer_discount_code': discount_code,
+                'first_timer_discount_expiry': expiry_date,
+            })
+            # The actual discount record (restricted to regular offline clubs only)
+            discount_vals.append({
+                'name': f'First Timer Discount - {partner.name}',
+                'code': discount_code,
+                'description': f'First timer discount for {partner.name} - Valid for Regular Offline clubs only',
+                'active': True,
+                'discount_type': 'fixed_amount',
+                'discount_value': discount_amount,
+                'date_from': fields.Date.today(),
+                'date_to': expiry_date,
+                'usage_limit': 1,  # Can only be used once
+                'usage_limit_per_customer': 1,
+                'customer_type': 'first_timer',
+                'partner_id': partner.id,  # Restrict to this specific partner
+                'event_type': 'regular_offline',  # Only valid for regular offline clubs
+                'is_public': True,
+                'website_description': f'Welcome discount for {partner.name}! Get {discount_amount}RMB off your first regular offline club registration.'
+            })
+            messages[partner.id] = (
+                f"🎉 First-timer discount code generated: {discount_code}. "
+                f"Expires on {expiry_date.strftime('%Y-%m-%d')}"
+            )
+
+        self.env['popcorn.discount'].sudo().create(discount_vals)
+        partners._message_log_batch(bodies=messages)
+
+    def _generate_first_timer_discount_codes(self, count):
+        """Return `count` distinct unused discount codes, like FIRST123 or NEW456"""
+        import random
+        import string
+
+        Discount = self.env['popcorn.discount'].sudo().with_context(active_test=False)
+        codes = set()
+        while len(codes) < count:
+            candidates = {
+                random.choice(['FIRST', 'NEW', 'WELCOME']) + ''.join(random.choices(string.digits, k=3))
+                for _index in range(count - len(codes))
+            }
+            taken = set(Discount.search([('code', 'in', list(candidates))]).mapped('code'))
+            codes |= candidates - taken
+        return list(codes)
+
     @api.model
     def _update_first_timer_status(self, partner_id):
         """Update first timer status for a partner (called from other models)"""
@@ -680,60 +745,41 @@ class ResPartner(models.Model):
         return result
     
     def write(self, vals):
-        """Override write to detect Popcorn money balance changes and auto-generate first-timer discounts"""
+        """Override write to log Popcorn money balance changes and auto-generate first-timer discounts
+
+        Side effects are collected per record before the write and applied
+        to all records at once afterwards, so mass updates stay cheap.
+        """
         # When PDB is switched on, clear First Timer and stamp today's date
         if vals.get('pdb'):
             vals['is_first_timer'] = False
             vals['pdb_date'] = fields.Date.today()
 
-        # Check if popcorn_money_balance is being changed
-        if 'popcorn_money_balance' in vals:
+        # Balance changes made outside add/deduct/set_popcorn_money
+        balance_messages = {}
+        if 'popcorn_money_balance' in vals and not self.env.context.get('skip_popcorn_money_logging'):
+            new_balance = vals['popcorn_money_balance']
             for record in self:
                 old_balance = record.popcorn_money_balance
-                new_balance = vals['popcorn_money_balance']
-                
-                # Only log if balance actually changed and it's not from our methods
-                if old_balance != new_balance and not self.env.context.get('skip_popcorn_money_logging'):
-                    # Post message in chatter after the write
-                    if new_balance > old_balance:
-                        message = f"💰 Popcorn money balance increased. Balance: {old_balance} → {new_balance}"
-                    elif new_balance < old_balance:
-                        message = f"💸 Popcorn money balance decreased. Balance: {old_balance} → {new_balance}"
-                    else:
-                        message = f"⚖️ Popcorn money balance changed. Balance: {old_balance} → {new_balance}"
-                    
-                    # Use a post-write hook to avoid recursion
-                    self.env.context = self.env.context.copy()
-                    self.env.context['popcorn_money_message'] = message
-                    self.env.context['popcorn_money_partner_id'] = record.id
-        
-        # Check if is_first_timer is being set to True and auto-generate discount
-        if 'is_first_timer' in vals and vals['is_first_timer']:
-            for record in self:
-                # Only generate if they don't already have a discount code
-                if not record.first_timer_discount_code:
-                    self.env.context = self.env.context.copy()
-                    self.env.context['auto_generate_discount'] = record.id
-        
+                if old_balance == new_balance:
+                    continue
+                if new_balance > old_balance:
+                    message = f"💰 Popcorn money balance increased. Balance: {old_balance} → {new_balance}"
+                else:
+                    message = f"💸 Popcorn money balance decreased. Balance: {old_balance} → {new_balance}"
+                balance_messages[record.id] = message
+
+        # Partners becoming first timers without a discount code yet
+        needs_discount = self.browse()
+        if vals.get('is_first_timer'):
+            needs_discount = self.filtered(lambda partner: not partner.first_timer_discount_code)
+
         result = super(ResPartner, self).write(vals)
-        
-        # Post the message after the write is complete
-        if self.env.context.get('popcorn_money_message'):
-            partner_id = self.env.context.get('popcorn_money_partner_id')
-            if partner_id:
-                partner = self.browse(partner_id)
-                partner.message_post(
-                    body=self.env.context['popcorn_money_message'],
-                    message_type='notification',
-                    subtype_xmlid='mail.mt_note'
-                )
-        
-        # Auto-generate discount code after the write is complete
-        if self.env.context.get('auto_generate_discount'):
-            partner_id = self.env.context.get('auto_generate_discount')
-            if partner_id:
-                partner = self.browse(partner_id)
-                partner.action_generate_first_timer_discount()
+
+        if balance_messages:
+            self.browse(balance_messages)._message_log_batch(bodies=balance_messages)
+        if needs_discount:
+            needs_discount.action_generate_first_timer_discount()
 
         return result
 
@@ -744,6 +790,7 @@ class ResPartner(models.Model):
     _PUNCTUALITY_DRY_RUN = False
 
     @api.model
+    @traced('cron.punctuality_badge')
     def _cron_evaluate_punctuality_badge(self):
         """Daily cron: award Punctuality Badge to members who have had
         zero attendance incidents and at least 5 clean attendances per
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Performance tracing for popcorn hot paths.
+
+A span measures one named piece of work (registration create, waitlist
+promotion, badge evaluation, a cron...): wall time, SQL statements sent and
+rows read/written by them. Finished spans go to a per-process ring buffer
+that administrators read from /popcorn/tracing/spans.
+
+Tracing is controlled by the popcorn.tracing_sample_rate system parameter:
+0 (the default) disables it, 1 traces every top-level span and anything in
+between samples that fraction. Spans nested in a traced span are always
+traced, so a sampled request is measured end to end.
+
+Like popcorn_forum_moderator, this module does not import Odoo: it only
+needs an environment with a cursor and ir.config_parameter, which keeps it
+testable with a stub (see tests/test_tracing.py).
+"""
+
+import functools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+SAMPLE_RATE_PARAM = 'popcorn.tracing_sample_rate'
+BUFFER_SIZE = 500
+
+# Row counters of the current transaction only, which is exactly what a span
+# runs in. Read before and after the span; the difference is what it touched.
+ROW_STATS_QUERY = """
+    SELECT COALESCE(SUM(seq_tup_read + COALESCE(idx_tup_fetch, 0)), 0),
+           COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)
+      FROM pg_stat_xact_user_tables
+"""
+
+
+class SpanBuffer:
+    """Thread-safe ring buffer holding the most recent finished spans."""
+
+    def __init__(self, size=BUFFER_SIZE):
+        self._spans = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self._spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def snapshot(self, name=None, limit=None):
+        """Recorded spans, most recent first, optionally only those called `name`."""
+        with self._lock:
+            spans = list(self._spans)
+        spans.reverse()
+        if name:
+            spans = [span for span in spans if span['name'] == name]
+        return spans[:limit] if limit else spans
+
+    def summary(self):
+        """Per span name: count, average/p95/max duration and average queries and rows."""
+        by_name = {}
+        for span in self.snapshot():
+            by_name.setdefault(span['name'], []).append(span)
+        summary = {}
+        for name, spans in by_name.items():
+            durations = sorted(span['duration_ms'] for span in spans)
+            count = len(spans)
+            summary[name] = {
+                'count': count,
+                'avg_ms': round(sum(durations) / count, 2),
+                'p95_ms': durations[min(count - 1, int(count * 0.95))],
+                'max_ms': durations[-1],
+                'avg_queries': round(sum(span['queries'] for span in spans) / count, 1),
+                'avg_rows_read': round(sum(span['rows_read'] or 0 for span in spans) / count, 1),
+                'avg_rows_written': round(sum(span['rows_written'] or 0 for span in spans) / count, 1),
+                'errors': sum(1 for span in spans if span['error']),
+            }
+        return summary
+
+
+buffer = SpanBuffer()
+_local = threading.local()
+
+
+def get_sample_rate(env):
+    """Configured sample rate in [0, 1]; anything unreadable disables tracing."""
+    try:
+        rate = float(env['ir.config_parameter'].sudo().get_param(SAMPLE_RATE_PARAM) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return min(max(rate, 0.0), 1.0)
+
+
+def _read_row_stats(cr):
+    # Probes are SQL statements too; they are counted so spans can leave
+    # them out of their own query count.
+    _local.probes = getattr(_local, 'probes', 0) + 1
+    cr.execute(ROW_STATS_QUERY)
+    return cr.fetchone()
+
+
+@contextmanager
+def trace_span(env, name, **tags):
+    """Measure the enclosed block as span `name` when tracing samples it.
+
+    Extra keyword arguments are stored on the span as tags. The block's
+    own exceptions propagate untouched; the span is then recorded as an
+    error without row counts, since a failed transaction cannot be probed.
+    """
+    stack = _local.__dict__.setdefault('stack', [])
+    if stack:
+        sampled = stack[-1]
+    else:
+        rate = get_sample_rate(env)
+        sampled = rate >= 1 or (rate > 0 and random.random() < rate)
+    stack.append(sampled)
+    if not sampled:
+        try:
+            yield
+        finally:
+            stack.pop()
+        return
+
+    cr = env.cr
+    error = True
+    reads_before, writes_before = _read_row_stats(cr)
+    probes_before = _local.probes
+    queries_before = getattr(cr, 'sql_log_count', 0)
+    started = time.perf_counter()
+    try:
+        yield
+        error = False
+    finally:
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        queries = getattr(cr, 'sql_log_count', 0) - queries_before - (_local.probes - probes_before)
+        stack.pop()
+        rows_read = rows_written = None
+        if not error:
+            reads_after, writes_after = _read_row_stats(cr)
+            rows_read = int(reads_after - reads_before)
+            rows_written = int(writes_after - writes_before)
+        span = dict(
+            tags,
+            name=name,
+            started_at=time.time() - duration_ms / 1000,
+            duration_ms=duration_ms,
+            queries=queries,
+            rows_read=rows_read,
+            rows_written=rows_written,
+            depth=len(stack),
+            error=error,
+            db=getattr(cr, 'dbname', None),
+            uid=getattr(env, 'uid', None),
+        )
+        buffer.add(span)
+        _logger.debug('Span %s: %.2f ms, %s queries, %s rows read, %s rows written',
+                      name, duration_ms, queries, rows_read, rows_written)
+
+
+def traced(name):
+    """Method decorator running the call inside trace_span(self.env, name)."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with trace_span(self.env, name, model=self._name, records=len(self)):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
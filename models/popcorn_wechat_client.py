@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""WeChat template message transport for the notification outbox.
+
+Like popcorn_forum_moderator, this module does not import Odoo: it turns
+prepared messages into calls to the WeChat official account API, with an
+access token cache, a shared rate limit and a classification of failures
+into "retry later" and "give up". Picking messages from the outbox and
+recording the outcome stays in popcorn.notification.outbox, which keeps
+this part testable against a local stub server (see
+tests/test_notification_outbox.py).
+"""
+
+import logging
+import threading
+import time
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+API_BASE = 'https://api.weixin.qq.com'
+TOKEN_PATH = '/cgi-bin/token'
+SEND_PATH = '/cgi-bin/message/template/send'
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+
+# Tokens live 7200 seconds; refresh a little early so a send never races
+# the expiry.
+TOKEN_EXPIRY_MARGIN = 300
+
+# Outbox retry schedule: the n-th failed attempt waits BACKOFF_BASE * 2**(n-1)
+# seconds, capped at BACKOFF_MAX. After MAX_ATTEMPTS the message is dead.
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+MAX_ATTEMPTS = 6
+
+# Messages per second sent by one Odoo process. WeChat throttles template
+# messages per account (errcode 45009), so staying under it beats retrying.
+DEFAULT_RATE = 10
+
+# errcodes meaning the access token is no longer valid: fetch a new one
+# and try once more straight away.
+TOKEN_ERRCODES = {40001, 40014, 42001}
+# errcodes worth trying again later: system busy and rate limits.
+RETRYABLE_ERRCODES = {-1, 45009, 45011, 45047}
+
+
+class WeChatError(Exception):
+    """A message could not be delivered.
+
+    `retryable` tells the outbox whether to try again later or to move
+    the message to the dead letters.
+    """
+
+    def __init__(self, message, errcode=None, retryable=False):
+        super().__init__(message)
+        self.errcode = errcode
+        self.retryable = retryable
+
+
+def retry_delay(attempts, base=BACKOFF_BASE, cap=BACKOFF_MAX, max_attempts=MAX_ATTEMPTS):
+    """Seconds to wait after `attempts` failed attempts, or None once they are used up."""
+    if attempts >= max_attempts:
+        return None
+    return min(cap, base * (2 ** max(0, attempts - 1)))
+
+
+class RateLimiter:
+    """Token bucket shared by every sender of a process.
+
+    Allows `rate` messages per second on average with bursts of up to
+    `burst`; acquire() sleeps until a message may go out.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def configure(self, rate, burst=None):
+        with self._lock:
+            self.rate = max(float(rate or DEFAULT_RATE), 0.1)
+            self.burst = max(1.0, float(burst or self.rate))
+
+    def acquire(self):
+        # Take the token right away, going into debt if the bucket is empty,
+        # and sleep off the debt outside the lock: callers are served in
+        # arrival order and never spin on rounding errors.
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+
+
+class WeChatClient:
+    """Thread-safe WeChat API client shared by every outbox run of a process."""
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), limiter=None, clock=time.monotonic):
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _call(self, method, url, **kwargs):
+        try:
+            response = self._session().request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException as error:
+            raise WeChatError(str(error), retryable=True) from error
+        if response.status_code == 429 or response.status_code >= 500:
+            raise WeChatError('WeChat answered HTTP %s' % response.status_code, retryable=True)
+        if response.status_code >= 400:
+            raise WeChatError('WeChat answered HTTP %s' % response.status_code)
+        try:
+            return response.json()
+        except ValueError as error:
+            raise WeChatError('Unreadable WeChat response: %s' % error, retryable=True) from error
+
+    def _access_token(self, config, refresh=False):
+        key = (config.get('api_base') or API_BASE, config['app_id'])
+        with self._lock:
+            cached = self._tokens.get(key)
+            if cached and not refresh and cached[1] > self._clock():
+                return cached[0]
+        body = self._call('GET', key[0] + TOKEN_PATH, params={
+            'grant_type': 'client_credential',
+            'appid': config['app_id'],
+            'secret': config['app_secret'],
+        })
+        token = body.get('access_token')
+        if not token:
+            errcode = body.get('errcode')
+            # Usually a wrong app id or secret: keep the messages until the
+            # settings are fixed rather than dead-lettering them.
+            raise WeChatError('No access token: %s %s' % (errcode, body.get('errmsg')), errcode=errcode,
+                              retryable=True)
+        expires_in = int(body.get('expires_in') or 7200)
+        with self._lock:
+            self._tokens[key] = (token, self._clock() + max(60, expires_in - TOKEN_EXPIRY_MARGIN))
+        return token
+
+    def send(self, config, message):
+        """Send one template message and return WeChat's msgid.
+
+        `message` is the API payload: touser, template_id, data and
+        optionally url. Raises WeChatError when it was not delivered.
+        """
+        refreshed = False
+        while True:
+            token = self._access_token(config, refresh=refreshed)
+            self.limiter.acquire()
+            body = self._call('POST', (config.get('api_base') or API_BASE) + SEND_PATH,
+                              params={'access_token': token}, json=message)
+            errcode = body.get('errcode', 0)
+            if not errcode:
+                return body.get('msgid')
+            if errcode in TOKEN_ERRCODES and not refreshed:
+                refreshed = True
+                continue
+            raise WeChatError('WeChat error %s: %s' % (errcode, body.get('errmsg')), errcode=errcode,
+                              retryable=errcode in RETRYABLE_ERRCODES)
+
+    def send_many(self, config, messages):
+        """Send several messages in turn under the shared rate limit.
+
+        `messages` maps a key to a payload. Returns a dict with the same
+        keys holding either the msgid or the WeChatError that stopped it.
+        A transport failure (WeChat unreachable, HTTP 5xx) ends the batch:
+        the remaining messages get the same error instead of each waiting
+        for its own timeout.
+        """
+        results = {}
+        outage = None
+        for key, message in messages.items():
+            if outage:
+                results[key] = outage
+                continue
+            try:
+                results[key] = self.send(config, message)
+            except WeChatError as error:
+                results[key] = error
+                if error.retryable and error.errcode is None:
+                    outage = error
+        return results
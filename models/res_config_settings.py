@@ -2,6 +2,8 @@
 
 from odoo import models, fields, api
 
+from .popcorn_forum_moderator import rules_fingerprint
+
 
 class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
@@ -27,6 +29,35 @@ class ResConfigSettings(models.TransientModel):
         help='Notification to send when a user is promoted from waitlist to confirmed registration. Configure WeChat template and field mappings in the notification record. Note: Enable "Send WeChat Notification" on the notification record if WeChat integration is installed.'
     )
 
+    wechat_app_id = fields.Char(
+        string='WeChat App ID',
+        config_parameter='popcorn.wechat_app_id',
+        help='AppID of the WeChat official account used by the notification outbox for template messages.'
+    )
+
+    wechat_app_secret = fields.Char(
+        string='WeChat App Secret',
+        config_parameter='popcorn.wechat_app_secret',
+        help='AppSecret of the WeChat official account, used to fetch access tokens.'
+    )
+
+    wechat_send_rate = fields.Float(
+        string='WeChat Messages per Second',
+        config_parameter='popcorn.wechat_send_rate',
+        default=10.0,
+        help='Upper bound on template messages sent per second by each server process. '
+             'Keep it under the account quota so WeChat does not throttle the outbox.'
+    )
+
+    popcorn_tracing_sample_rate = fields.Float(
+        string='Performance Tracing Sample Rate',
+        config_parameter='popcorn.tracing_sample_rate',
+        default=0.0,
+        help='Share of bookings, waitlist promotions, notification and badge evaluations and crons that are '
+             'timed with their SQL query and row counts. 0 disables tracing, 1 traces everything. '
+             'Administrators read the results from /popcorn/tracing/spans.'
+    )
+
     badges_evaluation_enabled = fields.Boolean(
         string='Enable Badge Evaluation',
         config_parameter='popcorn.badges_evaluation_enabled',
@@ -86,9 +117,14 @@ class ResConfigSettings(models.TransientModel):
 
     def set_values(self):
         super().set_values()
-        self.env['ir.config_parameter'].sudo().set_param(
-            'popcorn.forum_content_regulations', self.forum_content_regulations or ''
-        )
+        ICP = self.env['ir.config_parameter'].sudo()
+        previous = ICP.get_param('popcorn.forum_content_regulations', '')
+        ICP.set_param('popcorn.forum_content_regulations', self.forum_content_regulations or '')
+        if (previous or '').strip() != (self.forum_content_regulations or '').strip():
+            # Verdicts given under the old rules can never match again.
+            self.env['popcorn.forum.moderation.cache'].sudo()._invalidate_other_rules(
+                rules_fingerprint(self.forum_content_regulations)
+            )
 
 
 
@@ -24,12 +24,10 @@ class SaleOrderLine(models.Model):
         if not partner:
             return 0.0
 
-        membership = self.env['popcorn.membership'].sudo().search([
-            ('partner_id', '=', partner.id),
-            ('state', 'in', ['active', 'frozen'])
-        ], limit=1)
+        # Memoized per partner, so a cart with many lines costs one lookup
+        has_membership = self.env['popcorn.membership']._partner_has_live_membership(partner)
 
-        return template.membership_discount if membership else 0.0
+        return template.membership_discount if has_membership else 0.0
 
     # -------------------------------------------------------------------------
     # Pricing overrides
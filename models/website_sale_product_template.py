@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from odoo import api, fields, models
+from odoo import models
 
 
 class ProductTemplate(models.Model):
@@ -27,37 +27,32 @@ class ProductTemplate(models.Model):
             if user and user != public_user and hasattr(user, 'partner_id'):
                 partner = user.partner_id
         
-        # Check for active membership before calling super
-        has_active_membership = False
-        if partner:
-            active_memberships = self.env['popcorn.membership'].sudo().search([
-                ('partner_id', '=', partner.id),
-                ('state', 'in', ['active', 'frozen'])
-            ], limit=1)
-            has_active_membership = bool(active_memberships)
+        # Check for active membership before calling super (memoized per
+        # request and briefly per process, so a shop grid costs one lookup)
+        has_active_membership = self.env['popcorn.membership']._partner_has_live_membership(partner)
         
         # Call super to get base prices
         prices = super()._get_sales_prices(website)
         
         # Apply membership discount if customer has active membership
         if has_active_membership:
+            discounted_templates = self.filtered(
+                lambda t: t.membership_discount and t.membership_discount > 0 and t.id in prices
+            )
+            if not discounted_templates:
+                return prices
+
             pricelist = website.pricelist_id
             currency = website.currency_id
             fiscal_position = website.fiscal_position_id.sudo()
-            date = fields.Date.context_today(self)
-            
-            for template in self:
-                if not template.membership_discount or template.membership_discount <= 0:
-                    continue
-                
-                if template.id not in prices:
-                    continue
-                
+
+            # Get the pricelist prices (before taxes) for the whole grid at once
+            pricelist_prices = pricelist._compute_price_rule(discounted_templates, 1.0)
+
+            for template in discounted_templates:
                 price_vals = prices[template.id]
                 original_price_with_tax = price_vals.get('price_reduce')
 
-                # Get the pricelist price (before taxes)
-                pricelist_prices = pricelist._compute_price_rule(template, 1.0)
                 pricelist_price, _ = pricelist_prices.get(template.id, (0.0, False))
                 
                 if pricelist_price <= 0:
@@ -87,4 +82,3 @@ class ProductTemplate(models.Model):
                 price_vals['popcorn_membership_discount_percent'] = template.membership_discount
         
         return prices
-
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+# Only the Odoo test suites are imported here; the other files in this
+# directory are standalone scripts run with python directly.
+from . import test_notification_campaign
+from . import test_payment_method_race
+from . import test_payment_processing
+from . import test_performance_budgets
+from . import test_violation_counter
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Data Generator - Realistic popcorn data for benchmarks
+
+Builds a database that looks like production at a configurable scale:
+- membership plans of every quota mode (bucket_counts, points, unlimited)
+- events tagged with every club type, past and upcoming, some of them full
+  with a waitlist
+- members with memberships, a share of them frozen
+- registrations, consumed against the memberships for past events, with
+  late and no-show attendance sprinkled in
+- discounts, referrals and badges (rules and already shown badges)
+- portal users `load_user_<n>` (password = login) with an unlimited
+  membership, for tests/load_profile.py to log in as
+
+Everything is drawn from random.Random(seed), so the same scale and seed
+build the same data set. Volumes are VOLUMES multiplied by `scale`.
+
+From an odoo shell:
+
+    >>> from odoo.addons.popcorn.tests.data_generator import generate
+    >>> result = generate(env, scale=0.1, seed=42)
+    >>> env.cr.commit()
+    >>> result['launch_event'].id    # event for tests/load_profile.py
+
+tests/test_performance_budgets.py seeds its database with it as well.
+"""
+
+import random
+from datetime import timedelta
+
+from odoo import fields
+
+# Volumes at scale 1
+VOLUMES = {
+    'partners': 10000,
+    'events': 5000,
+    'registrations': 200000,
+    'discounts': 50,
+    'referrals': 2000,
+    'badges': 12,
+    'load_users': 200,
+}
+
+MEMBERSHIP_RATIO = 0.4      # share of partners holding a membership
+FROZEN_RATIO = 0.05         # share of memberships currently frozen
+FULL_EVENT_RATIO = 0.1      # share of events booked past capacity
+LATE_RATIO = 0.03           # share of past registrations marked late
+NO_SHOW_RATIO = 0.02        # share of past registrations marked no-show
+LAUNCH_EVENT_SEATS = 30     # seats of the event the load profile books
+
+CLUB_TYPE_TAGS = {
+    'regular_offline': 'Offline',
+    'regular_online': 'Online',
+    'spclub': 'SP Club',
+    'social_experience': 'Social Experience',
+    'free_for_members': 'Free for Members',
+}
+
+# Relative frequency of each club type among generated events
+CLUB_TYPE_WEIGHTS = {
+    'regular_offline': 50,
+    'regular_online': 25,
+    'spclub': 10,
+    'social_experience': 10,
+    'free_for_members': 5,
+}
+
+PLANS = [
+    {'name': 'Synthetic Unlimited', 'quota_mode': 'unlimited', 'duration_days': 365, 'price_normal': 1000,
+     'allowed_spclub': True},
+    {'name': 'Synthetic Points', 'quota_mode': 'points', 'points_start': 60, 'duration_days': 365,
+     'price_normal': 800, 'allowed_spclub': True},
+    {'name': 'Synthetic Bucket', 'quota_mode': 'bucket_counts', 'quota_offline': 10, 'quota_online': 10,
+     'duration_days': 180, 'price_normal': 500},
+]
+
+DISCOUNT_TYPES = ['percentage', 'fixed_amount', 'first_timer', 'upgrade', 'extra_days']
+REFERRAL_STATUSES = ['pending', 'registered', 'attended', 'completed', 'cancelled', 'expired']
+
+# Quiet creation: no tracking messages, followers or creation logs
+QUIET_CONTEXT = {
+    'tracking_disable': True,
+    'mail_create_nolog': True,
+    'mail_create_nosubscribe': True,
+    'mail_notrack': True,
+}
+
+
+def scaled_volumes(scale=1.0):
+    """VOLUMES multiplied by `scale`, never below one record of each kind"""
+    return {key: max(1, int(count * scale)) for key, count in VOLUMES.items()}
+
+
+def generate(env, scale=1.0, seed=42):
+    """Create the synthetic data set and return what was created.
+
+    The result maps 'plans', 'type_tags', 'partners', 'memberships', 'events',
+    'launch_event', 'discounts', 'referrals', 'badges' and 'load_users' to
+    records, plus 'registration_count' and 'volumes'. Nothing is committed.
+    """
+    rng = random.Random(seed)
+    volumes = scaled_volumes(scale)
+    env = env(context=dict(env.context, **QUIET_CONTEXT))
+    now = fields.Datetime.now()
+    result = {'volumes': volumes}
+
+    result['type_tags'] = _create_type_tags(env)
+    result['plans'] = plans = env['popcorn.membership.plan'].create(PLANS)
+
+    partners = env['res.partner'].create([
+        {'name': 'Synthetic Member %s' % index, 'email': 'synthetic%s@example.com' % index}
+        for index in range(volumes['partners'])
+    ])
+    result['partners'] = partners
+    result['memberships'] = memberships = _create_memberships(
+        env, rng, rng.sample(partners.ids, int(len(partners) * MEMBERSHIP_RATIO)), plans)
+
+    result['events'] = events = _create_events(env, rng, volumes['events'], result['type_tags'], now)
+    result['launch_event'] = launch_event = env['event.event'].create({
+        'name': 'Synthetic Booking Launch',
+        'date_begin': now + timedelta(days=7),
+        'date_end': now + timedelta(days=7, hours=2),
+        'seats_limited': True,
+        'seats_max': LAUNCH_EVENT_SEATS,
+        'website_published': True,
+        'tag_ids': [(6, 0, [result['type_tags']['regular_offline'].id])],
+    })
+
+    result['registration_count'] = _insert_registrations(
+        env, rng, volumes['registrations'], events, partners, memberships, now)
+    result['discounts'] = _create_discounts(env, rng, volumes['discounts'], plans)
+    result['referrals'] = _create_referrals(env, rng, volumes['referrals'], events, partners)
+    result['badges'] = _create_badges(env, rng, volumes['badges'], partners)
+    result['load_users'] = _create_load_users(env, volumes['load_users'], plans.filtered(
+        lambda plan: plan.quota_mode == 'unlimited'), launch_event)
+    env.flush_all()
+    return result
+
+
+def _create_type_tags(env):
+    category = env['event.tag.category'].search([('name', '=', 'Type')], limit=1) \
+        or env['event.tag.category'].create({'name': 'Type'})
+    tags = {}
+    for club_type, name in CLUB_TYPE_TAGS.items():
+        tags[club_type] = category.tag_ids.filtered(lambda tag: tag.name == name)[:1] \
+            or env['event.tag'].create({'name': name, 'category_id': category.id})
+    return tags
+
+
+def _create_memberships(env, rng, partner_ids, plans):
+    today = fields.Date.today()
+    # Membership create takes a single vals dict
+    memberships = env['popcorn.membership']
+    for partner_id in partner_ids:
+        memberships |= memberships.create({
+            'partner_id': partner_id,
+            'membership_plan_id': rng.choice(plans).id,
+            'state': 'active',
+            'purchase_channel': rng.choice(['online', 'pitch_day']),
+            'activation_date': today - timedelta(days=rng.randint(0, 150)),
+        })
+    frozen = memberships.browse(rng.sample(memberships.ids, int(len(memberships) * FROZEN_RATIO)))
+    if frozen:
+        frozen.write({
+            'state': 'frozen',
+            'freeze_active': True,
+            'freeze_start': today - timedelta(days=3),
+            'freeze_end': today + timedelta(days=11),
+            'freeze_total_days_used': 14,
+        })
+    return memberships
+
+
+def _create_events(env, rng, count, type_tags, now):
+    """Half in the past, half upcoming, each club type in CLUB_TYPE_WEIGHTS proportions"""
+    club_types = list(CLUB_TYPE_WEIGHTS)
+    weights = list(CLUB_TYPE_WEIGHTS.values())
+    # Event create takes a single vals dict
+    events = env['event.event']
+    for index in range(count):
+        club_type = club_types[index] if index < len(club_types) else rng.choices(club_types, weights)[0]
+        begin = now + timedelta(hours=3 * (index - count // 2), minutes=rng.choice([0, 30]))
+        events |= env['event.event'].create({
+            'name': 'Synthetic Club %s' % index,
+            'date_begin': begin,
+            'date_end': begin + timedelta(hours=2),
+            'seats_limited': True,
+            'seats_max': rng.randint(20, 60),
+            'website_published': True,
+            'tag_ids': [(6, 0, [type_tags[club_type].id])],
+        })
+    return events
+
+
+def _insert_registrations(env, rng, count, events, partners, memberships, now):
+    """Insert registrations in one statement and return how many were created.
+
+    Going through the create override would take hours at full scale, so
+    rows are built here: past events are attended and consumed against the
+    attendee's membership, upcoming ones are booked, and full events get a
+    waitlist in draft beyond their capacity. Stored fields the override
+    would compute (points consumed, related event dates) are filled in
+    directly, and the memberships' remaining quota recomputed afterwards.
+    """
+    membership_by_partner = {membership.partner_id.id: membership for membership in memberships}
+    # Only points-mode plans consume points, as in _compute_points_consumed
+    cost_by_plan = {
+        plan.id: dict(zip(CLUB_TYPE_TAGS, plan.cost_for(list(CLUB_TYPE_TAGS))))
+        for plan in memberships.membership_plan_id
+        if plan.quota_mode == 'points'
+    }
+    event_rows = [(event.id, event.club_type, event.seats_max, event.date_begin, event.date_end) for event in events]
+    full_events = set(rng.sample(range(len(event_rows)), int(len(event_rows) * FULL_EVENT_RATIO)))
+    partner_ids = partners.ids
+
+    columns = {name: [] for name in (
+        'event_id', 'partner_id', 'membership_id', 'name', 'email', 'state', 'club_type',
+        'consumption_state', 'points_consumed', 'is_on_waitlist', 'waitlist_position',
+        'is_late_attendance', 'is_no_show_attendance', 'event_start_time', 'event_date_end',
+    )}
+    # Full events take capacity plus a waitlist; the rest share what is left
+    per_event = max(1, count // len(event_rows))
+    serial = 0
+    for index, (event_id, club_type, seats_max, begin, end) in enumerate(event_rows):
+        past = begin < now
+        size = seats_max + rng.randint(3, 15) if index in full_events and not past \
+            else min(seats_max, rng.randint(per_event // 2, per_event * 3 // 2 + 1))
+        for position, partner_id in enumerate(rng.sample(partner_ids, min(size, len(partner_ids)))):
+            if serial >= count:
+                break
+            serial += 1
+            waitlisted = position >= seats_max
+            membership = membership_by_partner.get(partner_id)
+            consumed = past and membership and not waitlisted
+            late = consumed and rng.random() < LATE_RATIO
+            columns['event_id'].append(event_id)
+            columns['partner_id'].append(partner_id)
+            columns['membership_id'].append(membership.id if membership else None)
+            columns['name'].append('Synthetic attendee %s' % serial)
+            columns['email'].append('attendee%s@example.com' % serial)
+            columns['state'].append('draft' if waitlisted else ('done' if past else 'open'))
+            columns['club_type'].append(club_type)
+            columns['consumption_state'].append('consumed' if consumed else 'pending')
+            columns['points_consumed'].append(
+                cost_by_plan.get(membership.membership_plan_id.id, {}).get(club_type, 0) if membership else 0)
+            columns['is_on_waitlist'].append(waitlisted)
+            columns['waitlist_position'].append(position - seats_max + 1 if waitlisted else 0)
+            columns['is_late_attendance'].append(bool(late))
+            columns['is_no_show_attendance'].append(bool(consumed and not late and rng.random() < NO_SHOW_RATIO))
+            columns['event_start_time'].append(begin)
+            columns['event_date_end'].append(end)
+
+    env.flush_all()
+    env.cr.execute("""
+        INSERT INTO event_registration
+               (event_id, partner_id, membership_id, name, email, state, club_type,
+                consumption_state, points_consumed, is_on_waitlist, waitlist_position,
+                is_late_attendance, is_no_show_attendance, event_start_time, event_date_end,
+                create_uid, create_date, write_uid, write_date)
+        SELECT *, %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+          FROM unnest(%(event_id)s::int[], %(partner_id)s::int[], %(membership_id)s::int[],
+                      %(name)s::varchar[], %(email)s::varchar[], %(state)s::varchar[],
+                      %(club_type)s::varchar[], %(consumption_state)s::varchar[],
+                      %(points_consumed)s::int[], %(is_on_waitlist)s::bool[],
+                      %(waitlist_position)s::int[], %(is_late_attendance)s::bool[],
+                      %(is_no_show_attendance)s::bool[], %(event_start_time)s::timestamp[],
+                      %(event_date_end)s::timestamp[])
+    """, dict(columns, uid=env.uid))
+    inserted = env.cr.rowcount
+    env.invalidate_all()
+
+    # The inserted rows bypassed the ORM: recompute what depends on them
+    env.add_to_compute(memberships._fields['points_exhausted'], memberships)
+    env.flush_all()
+    return inserted
+
+
+def _create_discounts(env, rng, count, plans):
+    vals_list = []
+    for index in range(count):
+        discount_type = DISCOUNT_TYPES[index % len(DISCOUNT_TYPES)]
+        vals = {
+            'name': 'Synthetic Discount %s' % index,
+            'code': 'SYN%04d' % index,
+            'discount_type': discount_type,
+            'discount_value': rng.choice([5, 10, 15, 20]) if discount_type == 'percentage' else rng.choice([20, 50, 100]),
+            'customer_type': rng.choice(['all', 'new', 'existing']),
+            'usage_limit': rng.choice([0, 10, 100]),
+        }
+        if rng.random() < 0.3:
+            vals['membership_plan_ids'] = [(6, 0, [rng.choice(plans).id])]
+        vals_list.append(vals)
+    return env['popcorn.discount'].create(vals_list)
+
+
+def _create_referrals(env, rng, count, events, partners):
+    return env['popcorn.referral'].create([
+        {
+            'name': 'SYNREF%05d' % index,
+            'event_id': rng.choice(events).id,
+            'referrer_id': referrer.id,
+            'referee_id': rng.choice(partners).id,
+            'status': rng.choice(REFERRAL_STATUSES),
+            'referral_prize': rng.choice([0, 20, 50]),
+        }
+        for index, referrer in enumerate(rng.choices(partners, k=count))
+    ])
+
+
+def _create_badges(env, rng, count, partners):
+    """Attendance milestones ("attend N clubs"), a share of them already shown"""
+    model = env['ir.model']._get('event.registration')
+    field = env['ir.model.fields']._get('event.registration', 'event_id')
+    badges = env['popcorn.badge'].create([
+        {
+            'name': 'Synthetic %s Clubs' % threshold,
+            'badge_rule_ids': [(0, 0, {
+                'name': 'Attend %s clubs' % threshold,
+                'model_id': model.id,
+                'field_id': field.id,
+                'operator': '>=',
+                'value': str(threshold),
+            })],
+        }
+        for threshold in (5 * (index + 1) for index in range(count))
+    ])
+    env.flush_all()
+    env.cr.executemany(
+        "INSERT INTO partner_notified_badge_rel (partner_id, badge_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        [(partner_id, badge_id)
+         for partner_id in rng.sample(partners.ids, len(partners) // 10)
+         for badge_id in badges.ids[:rng.randint(1, len(badges))]],
+    )
+    return badges
+
+
+def _create_load_users(env, count, plan, launch_event):
+    """Portal users with an unlimited membership, login = password = load_user_<n>"""
+    portal = env.ref('base.group_portal')
+    users = env['res.users'].with_context(no_reset_password=True).create([
+        {
+            'name': 'Load User %s' % index,
+            'login': 'load_user_%s' % index,
+            'password': 'load_user_%s' % index,
+            'email': 'load_user_%s@example.com' % index,
+            'groups_id': [(6, 0, [portal.id])],
+        }
+        for index in range(count)
+    ])
+    for user in users:
+        env['popcorn.membership'].create({
+            'partner_id': user.partner_id.id,
+            'membership_plan_id': plan[:1].id,
+            'state': 'active',
+            'purchase_channel': 'online',
+            'activation_date': launch_event.date_begin.date() - timedelta(days=30),
+        })
+    return users
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Booking Launch Load Profile - Replays a club launch against a local server
+
+A locust-style profile using the standard library only: virtual users log
+in, browse, and book through /popcorn/event/<id>/registration/confirm over
+plain HTTP, the way browsers do when a popular club opens for booking:
+1. Warm-up: a few members browse the event list and the club page
+2. Launch: everyone arrives within seconds, opens the club page and books
+3. Tail: members who booked check /my/clubs while late arrivals still try
+
+Each stage is (seconds, users, spawn rate per second), like a locust
+LoadTestShape. Users log in as load_user_<n> (password = login), which
+tests/data_generator.py creates together with the 'Synthetic Booking Launch'
+event, so seed a database with it first:
+
+    >>> from odoo.addons.popcorn.tests.data_generator import generate
+    >>> generate(env, scale=0.1)['launch_event'].id
+    >>> env.cr.commit()
+
+Usage:
+    python tests/load_profile.py --event <launch event id>
+    python tests/load_profile.py --event 42 --url http://localhost:8069 --users 200 --db popcorn
+
+Only talks to the given local server. Prints latency percentiles per
+request name and how the booking attempts ended (booked, rejected with an
+error, sent to log in, failed).
+"""
+
+import argparse
+import http.cookiejar
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ODOO_URL = 'http://localhost:8069'
+DB_NAME = 'popcorn'
+LOGIN_PREFIX = 'load_user_'
+
+# (duration in seconds, target users, users spawned per second)
+STAGES = [
+    (30, 10, 2),       # warm-up browsing
+    (20, 200, 100),    # booking opens: everyone arrives at once
+    (40, 200, 100),    # tail: checking bookings, late arrivals
+]
+
+# Seconds a user waits between tasks, like locust's between(min, max)
+WAIT_TIME = (1.0, 3.0)
+LAUNCH_WAIT_TIME = (0.0, 0.5)
+
+CSRF_PATTERNS = [
+    re.compile(r'name="csrf_token"\s+value="([^"]+)"'),
+    re.compile(r'csrf_token["\']?\s*[:=]\s*["\']([^"\']+)["\']'),
+]
+
+
+class Stats:
+    """Thread-safe latency samples per request name and booking outcomes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.failures = {}
+        self.outcomes = {}
+
+    def record(self, name, elapsed_ms, ok):
+        with self.lock:
+            self.samples.setdefault(name, []).append(elapsed_ms)
+            if not ok:
+                self.failures[name] = self.failures.get(name, 0) + 1
+
+    def outcome(self, outcome):
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def report(self):
+        print(f"{'Request':<32}{'count':>8}{'fail':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for name, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            count = len(samples)
+            p50 = samples[count // 2]
+            p95 = samples[min(count - 1, int(count * 0.95))]
+            print(f"{name:<32}{count:>8}{self.failures.get(name, 0):>6}{p50:>10.1f}{p95:>10.1f}{samples[-1]:>10.1f}")
+        outcomes = ', '.join(f"{outcome}={count}" for outcome, count in sorted(self.outcomes.items()))
+        print(f"\nBooking outcomes: {outcomes or 'none'}")
+
+
+class BookingUser:
+    """One member with its own cookie session, booking the launch event once."""
+
+    def __init__(self, index, options, stats, launch_started):
+        self.login = f'{options.login_prefix}{index}'
+        self.options = options
+        self.stats = stats
+        self.launch_started = launch_started
+        self.booked = False
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, name, path, data=None):
+        """Send one request and time it; returns (status, final url, body)."""
+        url = self.options.url + path
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(url, data=body, timeout=self.options.timeout) as response:
+                status, final_url, payload = response.status, response.geturl(), response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            status, final_url, payload = e.code, url, ''
+        except (urllib.error.URLError, OSError):
+            status, final_url, payload = None, url, ''
+        self.stats.record(name, (time.perf_counter() - started) * 1000, status is not None and status < 400)
+        return status, final_url, payload
+
+    @staticmethod
+    def csrf_token(html):
+        for pattern in CSRF_PATTERNS:
+            match = pattern.search(html)
+            if match:
+                return match.group(1)
+        return ''
+
+    def log_in(self):
+        status, _url, html = self.request('GET /web/login', f'/web/login?db={self.options.db}')
+        if status != 200:
+            return False
+        status, final_url, _html = self.request('POST /web/login', '/web/login', {
+            'login': self.login,
+            'password': self.login,
+            'csrf_token': self.csrf_token(html),
+            'db': self.options.db,
+            'redirect': '/my',
+        })
+        return status == 200 and '/web/login' not in final_url
+
+    # Tasks, picked by weight like locust's @task(weight)
+
+    def browse_events(self):
+        self.request('GET /event', '/event')
+
+    def view_event(self):
+        self.request('GET /event/<id>', f'/event/{self.options.event}')
+
+    def book(self):
+        _status, _url, html = self.request('GET /event/<id>', f'/event/{self.options.event}')
+        status, final_url, _html = self.request(
+            'POST registration/confirm', f'/popcorn/event/{self.options.event}/registration/confirm',
+            {'csrf_token': self.csrf_token(html)})
+        if status is None or status >= 400:
+            outcome = 'failed'
+        elif '/web/login' in final_url:
+            outcome = 'login'
+        elif 'error=' in final_url:
+            outcome = 'rejected'
+        else:
+            outcome = 'booked'
+        self.booked = True
+        self.stats.outcome(outcome)
+
+    def my_clubs(self):
+        self.request('GET /my/clubs', '/my/clubs')
+
+    def tasks(self):
+        """Weighted tasks for the current phase of the launch"""
+        if not self.launch_started.is_set():
+            return [(self.browse_events, 3), (self.view_event, 1)]
+        if not self.booked:
+            return [(self.book, 1)]
+        return [(self.my_clubs, 3), (self.view_event, 1)]
+
+    def run(self, stop):
+        if not self.log_in():
+            self.stats.outcome('login failed')
+            return
+        while not stop.is_set():
+            tasks = self.tasks()
+            task = random.choices([task for task, _weight in tasks], [weight for _task, weight in tasks])[0]
+            task()
+            wait = LAUNCH_WAIT_TIME if self.launch_started.is_set() and not self.booked else WAIT_TIME
+            stop.wait(random.uniform(*wait))
+
+
+def run(options):
+    """Run the stages, spawning users up to each stage's target, then report"""
+    stats = Stats()
+    stop = threading.Event()
+    launch_started = threading.Event()
+    threads = []
+    stages = [(duration, min(users, options.users), rate) for duration, users, rate in STAGES]
+    for number, (duration, users, rate) in enumerate(stages):
+        if number == 1:
+            launch_started.set()
+        print(f"Stage {number + 1}: {users} users for {duration}s")
+        stage_end = time.monotonic() + duration
+        while time.monotonic() < stage_end:
+            for _ in range(min(rate, users - len(threads))):
+                user = BookingUser(len(threads), options, stats, launch_started)
+                thread = threading.Thread(target=user.run, args=(stop,), daemon=True)
+                thread.start()
+                threads.append(thread)
+            time.sleep(1)
+    stop.set()
+    for thread in threads:
+        thread.join(options.timeout)
+    print("\n" + "=" * 80)
+    stats.report()
+    print("=" * 80)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--event', type=int, required=True, help='id of the launch event to book')
+    parser.add_argument('--url', default=ODOO_URL, help='local Odoo server (default %(default)s)')
+    parser.add_argument('--db', default=DB_NAME, help='database (default %(default)s)')
+    parser.add_argument('--users', type=int, default=200, help='peak virtual users (default %(default)s)')
+    parser.add_argument('--login-prefix', default=LOGIN_PREFIX, help='user logins (default %(default)s<n>)')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    options = parser.parse_args()
+    options.url = options.url.rstrip('/')
+    if urllib.parse.urlparse(options.url).hostname not in ('localhost', '127.0.0.1', '::1'):
+        parser.error('the load profile only runs against a local server')
+    stats = run(options)
+    raise SystemExit(1 if stats.outcomes.get('failed') else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Forum Moderation Worker Test - Retries, timeouts and circuit breaker
+
+This test runs the DeepSeek client used by the forum against a local stub
+HTTP server, so no API key, network access or Odoo server is needed:
+1. A normal verdict is parsed
+2. Server errors are retried with backoff, then succeed
+3. Client errors (bad API key) are not retried
+4. Slow responses hit the per-request timeout
+5. Repeated failures open the circuit breaker, which then fails fast
+6. Several posts are moderated concurrently on the bounded pool
+7. Reposts with trivial whitespace/case edits share a fingerprint
+
+Usage:
+    python tests/test_forum_moderation_worker.py
+"""
+
+import importlib.util
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Load the client straight from its file: importing the addon package would
+# pull in Odoo, which this test does not need.
+MODULE_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'popcorn_forum_moderator.py')
+spec = importlib.util.spec_from_file_location('popcorn_forum_moderator', MODULE_PATH)
+moderator_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(moderator_module)
+
+
+class StubDeepSeek(BaseHTTPRequestHandler):
+    """Answers like DeepSeek, driven by the `script` list on the server.
+
+    Each entry is consumed by one request: an int is returned as an HTTP
+    error status, a float sleeps that long first, a dict is the verdict.
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        # Only "slow" posts count towards concurrency, so handlers still
+        # sleeping from the timeout test do not skew the pool check.
+        slow = body.get('messages', [{}])[-1].get('content', '').startswith('Title: slow')
+        with self.server.lock:
+            self.server.calls += 1
+            if slow:
+                self.server.active += 1
+                self.server.max_active = max(self.server.max_active, self.server.active)
+            step = self.server.script.pop(0) if self.server.script else {'allowed': True}
+        try:
+            if isinstance(step, float):
+                time.sleep(step)
+                step = {'allowed': True}
+            if isinstance(step, int):
+                self.send_response(step)
+                self.end_headers()
+                return
+            if slow:
+                time.sleep(0.2)
+            verdict = dict({'rule_broken': '', 'reason': 'stub'}, **step)
+            payload = json.dumps({
+                'choices': [{'message': {'content': json.dumps(verdict)}, 'finish_reason': 'stop'}],
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            if slow:
+                with self.server.lock:
+                    self.server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubDeepSeek)
+    server.lock = threading.Lock()
+    server.script = []
+    server.calls = 0
+    server.active = 0
+    server.max_active = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_stub = None
+
+
+def get_stub():
+    """Start the stub server on first use and share it between tests."""
+    global _stub
+    if _stub is None:
+        _stub = start_stub()
+    return _stub
+
+
+def make_moderator(server, **kwargs):
+    kwargs.setdefault('backoff_base', 0.01)
+    kwargs.setdefault('backoff_max', 0.05)
+    kwargs.setdefault('timeout', (1, 1))
+    return moderator_module.DeepSeekModerator(
+        endpoint='http://127.0.0.1:%s/chat/completions' % server.server_address[1],
+        **kwargs
+    )
+
+
+CONFIG = {'model': 'stub-model', 'api_key': 'test', 'rules': '1. Be nice.'}
+
+
+def reset(server, script=()):
+    server.script = list(script)
+    server.calls = 0
+    server.max_active = 0
+
+
+def test_verdict_parsed():
+    server = get_stub()
+    reset(server, [{'allowed': False, 'rule_broken': 'Rule 1', 'reason': 'Rude'}])
+    verdict = make_moderator(server).moderate(CONFIG, 'Hello', 'You are all idiots')
+    assert verdict['allowed'] is False, verdict
+    assert verdict['rule_broken'] == 'Rule 1', verdict
+    assert server.calls == 1, server.calls
+
+
+def test_retry_then_success():
+    server = get_stub()
+    reset(server, [500, 503, {'allowed': True}])
+    verdict = make_moderator(server).moderate(CONFIG, 'Hello', 'Nice club')
+    assert verdict['allowed'] is True, verdict
+    assert server.calls == 3, server.calls
+
+
+def test_client_error_not_retried():
+    server = get_stub()
+    reset(server, [401])
+    try:
+        make_moderator(server).moderate(CONFIG, 'Hello', 'Nice club')
+    except moderator_module.ModerationError:
+        pass
+    else:
+        raise AssertionError('HTTP 401 should raise')
+    assert server.calls == 1, server.calls
+
+
+def test_timeout():
+    server = get_stub()
+    reset(server, [2.0, 2.0])
+    moderator = make_moderator(server, max_attempts=2, timeout=(1, 0.3))
+    started = time.monotonic()
+    try:
+        moderator.moderate(CONFIG, 'Hello', 'Nice club')
+    except moderator_module.ModerationError:
+        pass
+    else:
+        raise AssertionError('Slow responses should time out')
+    assert time.monotonic() - started < 1.5, 'timeout not applied per attempt'
+
+
+def test_circuit_breaker():
+    server = get_stub()
+    reset(server, [500] * 10)
+    breaker = moderator_module.CircuitBreaker(threshold=3, reset_after=0.3)
+    moderator = make_moderator(server, breaker=breaker, max_attempts=3)
+    try:
+        moderator.moderate(CONFIG, 'Hello', 'Nice club')
+    except moderator_module.ModerationError:
+        pass
+    assert breaker.is_open, 'breaker should open after 3 failures'
+    calls = server.calls
+    try:
+        moderator.moderate(CONFIG, 'Hello', 'Nice club')
+    except moderator_module.CircuitOpenError:
+        pass
+    else:
+        raise AssertionError('open breaker should fail fast')
+    assert server.calls == calls, 'open breaker must not call the API'
+
+    # After the reset delay a trial call goes through and closes it again.
+    reset(server, [{'allowed': True}])
+    time.sleep(0.35)
+    verdict = moderator.moderate(CONFIG, 'Hello', 'Nice club')
+    assert verdict['allowed'] is True, verdict
+    assert not breaker.is_open, 'successful trial should close the breaker'
+
+
+def test_concurrent_pool():
+    server = get_stub()
+    reset(server)
+    moderator = make_moderator(server, pool_size=3)
+    items = {'post-%s' % i: ('slow %s' % i, 'content %s' % i) for i in range(6)}
+    started = time.monotonic()
+    results = moderator.moderate_many(CONFIG, items)
+    elapsed = time.monotonic() - started
+    assert set(results) == set(items), results
+    assert all(isinstance(v, dict) for v in results.values()), results
+    assert server.max_active <= 3, 'pool bound exceeded: %s' % server.max_active
+    assert elapsed < 6 * 0.2, 'posts were not moderated concurrently (%.2fs)' % elapsed
+
+
+def test_fingerprints():
+    server = get_stub()
+    fingerprint = moderator_module.content_fingerprint
+    assert fingerprint('Hello', 'Nice  club\n') == fingerprint(' hello', 'nice club')
+    assert fingerprint('Hello', 'Nice club') != fingerprint('Hello', 'Bad club')
+    rules = moderator_module.rules_fingerprint
+    assert rules('1. Be nice.') != rules('1. Be nice.\n2. No ads.')
+
+
+def run_all():
+    server = get_stub()
+    tests = [
+        test_verdict_parsed,
+        test_retry_then_success,
+        test_client_error_not_retried,
+        test_timeout,
+        test_circuit_breaker,
+        test_concurrent_pool,
+        test_fingerprints,
+    ]
+    failures = 0
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"[OK] {test.__name__}")
+            except AssertionError as e:
+                failures += 1
+                print(f"[FAIL] {test.__name__}: {e}")
+    finally:
+        server.shutdown()
+
+    print("\n" + "=" * 80)
+    if failures:
+        print(f"[ERROR] {failures} of {len(tests)} tests failed")
+    else:
+        print(f"[SUCCESS] All {len(tests)} moderation worker tests passed!")
+    print("=" * 80)
+    return failures
+
+
+if __name__ == '__main__':
+    raise SystemExit(1 if run_all() else 0)
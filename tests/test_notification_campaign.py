@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Notification Campaign - Audience selection of popcorn.notification
+
+Odoo test suite for the campaign audience: rules compiled into SQL and
+rules that can only be evaluated in Python must both narrow the partners
+a campaign is queued for.
+
+    odoo-bin -d <db> -i popcorn --test-tags /popcorn:TestNotificationCampaign --stop-after-init
+"""
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestNotificationCampaign(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.plan = cls.env['popcorn.membership.plan'].create({'name': 'Campaign Plan', 'price_normal': 100.0})
+        cls.alice, cls.bob = cls.env['res.partner'].create([
+            {'name': 'Campaign Alice', 'email': 'campaign.alice@example.com'},
+            {'name': 'Campaign Bob', 'email': 'campaign.bob@example.com'},
+        ])
+        if 'wechat_openid' in cls.env['res.partner']._fields:
+            cls.alice.wechat_openid = 'openid-campaign-alice'
+            cls.bob.wechat_openid = 'openid-campaign-bob'
+        cls.env['popcorn.membership'].create([{
+            'partner_id': partner.id,
+            'membership_plan_id': cls.plan.id,
+            'state': 'active',
+            'purchase_price_paid': 100.0,
+            'payment_reference': reference,
+        } for partner, reference in ((cls.alice, 'VIP-0001'), (cls.bob, 'STD-0002'))])
+        cls.notification = cls.env['popcorn.notification'].create({
+            'name': 'Campaign',
+            'title': 'Hello',
+            'message': '<p>Hello</p>',
+        })
+        cls._add_rule('popcorn.membership', 'membership_plan_id', '=', str(cls.plan.id))
+
+    @classmethod
+    def _add_rule(cls, model, field, operator, value):
+        return cls.env['popcorn.notification.rule'].create({
+            'name': '%s %s %s' % (field, operator, value),
+            'notification_id': cls.notification.id,
+            'model_id': cls.env['ir.model']._get(model).id,
+            'field_id': cls.env['ir.model.fields']._get(model, field).id,
+            'operator': operator,
+            'value': value,
+        })
+
+    def test_plan_rule_selects_both(self):
+        audience = self.notification._bulk_filter_partners_for_notification()
+        self.assertEqual(audience, self.alice | self.bob)
+
+    def test_partner_like_rule_narrows_audience(self):
+        self._add_rule('res.partner', 'name', 'like', 'Alice')
+        audience = self.notification._bulk_filter_partners_for_notification()
+        self.assertEqual(audience, self.alice)
+
+    def test_related_ilike_rule_narrows_audience(self):
+        self._add_rule('popcorn.membership', 'payment_reference', 'ilike', 'vip')
+        audience = self.notification._bulk_filter_partners_for_notification()
+        self.assertEqual(audience, self.alice)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Notification Outbox Test - WeChat sends, token refresh, rate limit and backoff
+
+This test runs the WeChat client used by the notification outbox against a
+local stub of the WeChat API, so no official account, network access or
+Odoo server is needed:
+1. The access token is fetched once and reused for later sends
+2. An expired token (errcode 40001) is refreshed and the send retried once
+3. Throttling (errcode 45009) and server errors are reported as retryable
+4. Invalid recipients (errcode 43004) are reported as permanent failures
+5. An outage ends a batch instead of waiting on every message
+6. The rate limiter spaces sends out to the configured rate
+7. The backoff schedule doubles, is capped, and ends in the dead letters
+
+Usage:
+    python tests/test_notification_outbox.py
+"""
+
+import importlib.util
+import json
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Load the client straight from its file: importing the addon package would
+# pull in Odoo, which this test does not need.
+MODULE_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'popcorn_wechat_client.py')
+spec = importlib.util.spec_from_file_location('popcorn_wechat_client', MODULE_PATH)
+wechat = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(wechat)
+
+
+class StubWeChat(BaseHTTPRequestHandler):
+    """Answers like the WeChat API, driven by the `script` list on the server.
+
+    Token requests always succeed with a new token. Each send consumes one
+    script entry: an int is returned as an HTTP error status, a dict is the
+    JSON answer. An empty script accepts the message.
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        with self.server.lock:
+            self.server.token_calls += 1
+            token = 'token-%s' % self.server.token_calls
+        self._answer(200, {'access_token': token, 'expires_in': 7200} if url.path == wechat.TOKEN_PATH else {})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        message = json.loads(self.rfile.read(length) or b'{}')
+        token = urllib.parse.parse_qs(url.query).get('access_token', [''])[0]
+        with self.server.lock:
+            self.server.sends.append((token, message))
+            step = self.server.script.pop(0) if self.server.script else {'errcode': 0, 'msgid': len(self.server.sends)}
+        if isinstance(step, int):
+            self._answer(step, {})
+        else:
+            self._answer(200, step)
+
+    def _answer(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWeChat)
+    server.lock = threading.Lock()
+    reset(server)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_stub = None
+
+
+def get_stub():
+    """Start the stub server on first use and share it between tests."""
+    global _stub
+    if _stub is None:
+        _stub = start_stub()
+    return _stub
+
+
+def reset(server, script=()):
+    server.script = list(script)
+    server.token_calls = 0
+    server.sends = []
+
+
+def make_client():
+    return wechat.WeChatClient(timeout=(1, 1), limiter=wechat.RateLimiter(rate=1000))
+
+
+def make_config(server):
+    return {'app_id': 'wx-test', 'app_secret': 'secret',
+            'api_base': 'http://127.0.0.1:%s' % server.server_address[1]}
+
+
+def make_message(openid='openid-1'):
+    return {'touser': openid, 'template_id': 'tmpl-promotion', 'data': {'thing1': {'value': 'Board games'}}}
+
+
+def expect_error(call):
+    try:
+        call()
+    except wechat.WeChatError as error:
+        return error
+    raise AssertionError('a WeChatError was expected')
+
+
+def test_token_cached():
+    server = get_stub()
+    reset(server)
+    client, config = make_client(), make_config(server)
+    first = client.send(config, make_message())
+    second = client.send(config, make_message('openid-2'))
+    assert (first, second) == (1, 2), (first, second)
+    assert server.token_calls == 1, 'token fetched %s times' % server.token_calls
+    assert server.sends[1][1]['touser'] == 'openid-2', server.sends
+
+
+def test_token_refreshed():
+    server = get_stub()
+    reset(server, [{'errcode': 40001, 'errmsg': 'invalid credential'}])
+    client, config = make_client(), make_config(server)
+    msgid = client.send(config, make_message())
+    assert msgid == 2, msgid
+    assert server.token_calls == 2, server.token_calls
+    assert [token for token, _message in server.sends] == ['token-1', 'token-2'], server.sends
+
+
+def test_retryable_errors():
+    server = get_stub()
+    reset(server, [{'errcode': 45009, 'errmsg': 'reach max api daily quota limit'}, 503])
+    client, config = make_client(), make_config(server)
+    throttled = expect_error(lambda: client.send(config, make_message()))
+    assert throttled.retryable and throttled.errcode == 45009, throttled
+    unavailable = expect_error(lambda: client.send(config, make_message()))
+    assert unavailable.retryable and unavailable.errcode is None, unavailable
+
+
+def test_permanent_error():
+    server = get_stub()
+    reset(server, [{'errcode': 43004, 'errmsg': 'require subscribe'}])
+    client, config = make_client(), make_config(server)
+    error = expect_error(lambda: client.send(config, make_message()))
+    assert not error.retryable and error.errcode == 43004, error
+    assert len(server.sends) == 1, 'permanent errors must not be retried'
+
+
+def test_batch_outage():
+    server = get_stub()
+    reset(server, [{'errcode': 43004}, 502])
+    client, config = make_client(), make_config(server)
+    messages = {row_id: make_message('openid-%s' % row_id) for row_id in range(1, 6)}
+    results = client.send_many(config, messages)
+    assert set(results) == set(messages), results
+    assert not results[1].retryable, results
+    assert all(results[row_id].retryable for row_id in (2, 3, 4, 5)), results
+    assert len(server.sends) == 2, 'the batch should stop at the outage, sent %s' % len(server.sends)
+
+
+def test_rate_limiter():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    limiter = wechat.RateLimiter(rate=5, burst=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(12):
+        limiter.acquire()
+    # The burst goes out at once, the other ten at 5 per second.
+    assert abs(now[0] - 2.0) < 1e-6, now[0]
+    assert all(abs(wait - 0.2) < 1e-6 for wait in waits), waits
+    limiter.configure(10)
+    assert limiter.rate == 10 and limiter.burst == 10, (limiter.rate, limiter.burst)
+
+
+def test_backoff_schedule():
+    delays = [wechat.retry_delay(attempts, base=30, cap=300, max_attempts=6) for attempts in range(1, 7)]
+    assert delays == [30, 60, 120, 240, 300, None], delays
+    assert wechat.retry_delay(wechat.MAX_ATTEMPTS) is None, 'exhausted messages go to the dead letters'
+
+
+def run_all():
+    server = get_stub()
+    tests = [
+        test_token_cached,
+        test_token_refreshed,
+        test_retryable_errors,
+        test_permanent_error,
+        test_batch_outage,
+        test_rate_limiter,
+        test_backoff_schedule,
+    ]
+    failures = 0
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"[OK] {test.__name__}")
+            except AssertionError as e:
+                failures += 1
+                print(f"[FAIL] {test.__name__}: {e}")
+    finally:
+        server.shutdown()
+
+    print("\n" + "=" * 80)
+    if failures:
+        print(f"[ERROR] {failures} of {len(tests)} tests failed")
+    else:
+        print(f"[SUCCESS] All {len(tests)} notification outbox tests passed!")
+    print("=" * 80)
+    return failures
+
+
+if __name__ == '__main__':
+    raise SystemExit(1 if run_all() else 0)
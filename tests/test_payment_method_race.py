@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Payment Method Race - Create-on-demand of the checkout payment method
+
+Odoo test suite for payment.provider._popcorn_create_payment_method: two
+checkouts that both miss the provider's payment method must not create two.
+It runs two real database cursors (the test cursor cannot overlap itself),
+so the provider it races on is committed and removed again afterwards.
+
+    odoo-bin -d <db> -i popcorn --test-tags /popcorn:TestPaymentMethodRace --stop-after-init
+"""
+
+from psycopg2 import errors
+
+from odoo import SUPERUSER_ID, api
+from odoo.sql_db import db_connect
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestPaymentMethodRace(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.connection = db_connect(self.env.cr.dbname)
+        with self.connection.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            self.provider_id = env['payment.provider'].create({'name': 'Popcorn Race', 'code': 'none'}).id
+            cr.commit()
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        with self.connection.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            provider = env['payment.provider'].browse(self.provider_id)
+            env['payment.method'].with_context(active_test=False).search(
+                [('provider_ids', 'in', provider.id)]).unlink()
+            provider.unlink()
+            cr.commit()
+
+    def _method_count(self, cr):
+        cr.execute("SELECT count(*) FROM payment_method_payment_provider_rel WHERE payment_provider_id = %s",
+                   (self.provider_id,))
+        return cr.fetchone()[0]
+
+    def test_second_checkout_fails_to_serialize(self):
+        with self.connection.cursor() as first, self.connection.cursor() as second:
+            # The second checkout's snapshot predates the first one's method
+            self.assertEqual(self._method_count(second), 0)
+
+            first_env = api.Environment(first, SUPERUSER_ID, {})
+            first_env['payment.provider'].browse(self.provider_id)._popcorn_create_payment_method()
+            first.commit()
+
+            second_env = api.Environment(second, SUPERUSER_ID, {})
+            with self.assertRaises(errors.SerializationFailure):
+                second_env['payment.provider'].browse(self.provider_id)._popcorn_create_payment_method()
+            second.rollback()
+
+            # The retried request starts on a fresh snapshot and reuses the method
+            method_id = second_env['payment.provider'].browse(self.provider_id)._popcorn_create_payment_method()
+            second.commit()
+            self.assertEqual(self._method_count(second), 1)
+            self.assertIn(self.provider_id, second_env['payment.method'].browse(method_id).provider_ids.ids)
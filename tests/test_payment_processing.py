@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Payment Processing - Claim and retry of queued popcorn transactions
+
+Odoo test suite for the fulfilment queue of payment.transaction: a done
+transaction is claimed exactly once, and a failing fulfilment gives the
+claim back and is scheduled for a retry.
+
+    odoo-bin -d <db> -i popcorn --test-tags /popcorn:TestPaymentProcessing --stop-after-init
+"""
+
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.popcorn.models.payment_transaction import PaymentTransaction
+
+
+@tagged('post_install', '-at_install')
+class TestPaymentProcessing(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': 'Paying Member'})
+        cls.provider = cls.env.ref('payment.payment_provider_demo')
+        cls.payment_method = cls.env.ref('payment.payment_method_unknown')
+
+    def _create_transaction(self, reference, **vals):
+        return self.env['payment.transaction'].create({
+            'provider_id': self.provider.id,
+            'payment_method_id': self.payment_method.id,
+            'amount': 100.0,
+            'currency_id': self.env.company.currency_id.id,
+            'partner_id': self.partner.id,
+            'reference': reference,
+            'popcorn_transaction_type': 'membership',
+            **vals,
+        })
+
+    def test_claim_only_once(self):
+        transaction = self._create_transaction('POPCORN-TEST-CLAIM')
+        transaction.write({'state': 'done'})
+        self.assertTrue(transaction._claim_popcorn_processing())
+        self.assertFalse(transaction._claim_popcorn_processing(), 'a processed transaction must not be claimed again')
+        self.assertTrue(transaction.popcorn_processed)
+        self.assertFalse(transaction.popcorn_next_attempt_at)
+
+    def test_failed_fulfilment_releases_claim(self):
+        # No membership plan: _process_membership_transaction raises after the claim
+        transaction = self._create_transaction('POPCORN-TEST-RETRY')
+        transaction.write({'state': 'done'})
+        self.assertTrue(transaction.popcorn_next_attempt_at, 'done transactions are queued')
+
+        schedule_retry = PaymentTransaction._schedule_popcorn_retry
+        with patch.object(PaymentTransaction, '_schedule_popcorn_retry', autospec=True,
+                          side_effect=schedule_retry) as retry, \
+                patch.object(type(self.env.cr), 'commit', lambda cr: None):
+            self.env['payment.transaction']._cron_process_popcorn_transactions()
+
+        self.assertIn(transaction, [call.args[0] for call in retry.call_args_list])
+        transaction.invalidate_recordset()
+        self.assertFalse(transaction.popcorn_processed, 'the claim is rolled back with the failed fulfilment')
+        self.assertEqual(transaction.popcorn_processing_attempts, 1)
+        self.assertTrue(transaction.popcorn_processing_error)
+        self.assertGreater(transaction.popcorn_next_attempt_at, fields.Datetime.now())
+        self.assertTrue(transaction._claim_popcorn_processing(), 'the transaction can be claimed again')
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Performance Budgets - Query count and wall time of the hot website routes
+
+Unlike the XML-RPC scripts next to it, this is an Odoo test suite. It seeds
+a realistic database with tests/data_generator.py (10k partners, 5k events,
+200k registrations by default), then measures every route below against the budgets recorded in
+tests/perf_baseline.json. A route that sends more queries or takes longer
+than its budget, or has no budget recorded, fails the run.
+
+It is tagged out of the standard test run because seeding takes a while:
+
+    odoo-bin -d <db> -i popcorn --test-tags popcorn_perf --stop-after-init
+
+Environment variables:
+    POPCORN_PERF_SCALE=0.1    seed a tenth of the default volumes
+    POPCORN_PERF_UPDATE=1     record the measured values as the new budgets
+                              (query counts as measured, wall time with
+                              PERF_WALL_HEADROOM) instead of asserting
+"""
+
+import json
+import os
+import time
+
+from odoo import fields
+from odoo.tests import HttpCase, tagged
+
+from .data_generator import generate
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'perf_baseline.json')
+
+# Budgets are only comparable on the same data set
+PERF_SEED = 42
+
+# Wall time varies between runs far more than query counts, so recorded
+# wall budgets get this much headroom.
+PERF_WALL_HEADROOM = 1.5
+
+
+def load_baseline():
+    with open(BASELINE_PATH) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(baseline):
+    with open(BASELINE_PATH, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+        baseline_file.write('\n')
+
+
+@tagged('post_install', '-at_install', '-standard', 'popcorn_perf')
+class TestPerformanceBudgets(HttpCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.scale = float(os.environ.get('POPCORN_PERF_SCALE') or 1)
+        cls.update_baseline = os.environ.get('POPCORN_PERF_UPDATE') == '1'
+        cls.baseline = load_baseline()
+        cls.measured = {}
+        cls._seed()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.update_baseline and cls.measured:
+            for name, (queries, wall_ms) in cls.measured.items():
+                cls.baseline['routes'][name] = {
+                    'queries': queries,
+                    'wall_ms': round(wall_ms * PERF_WALL_HEADROOM, 1),
+                }
+            cls.baseline['volumes'] = cls.volumes
+            save_baseline(cls.baseline)
+        super().tearDownClass()
+
+    @classmethod
+    def _seed(cls):
+        env = cls.env
+        now = fields.Datetime.now()
+        data = generate(env, scale=cls.scale, seed=PERF_SEED)
+        cls.volumes = data['volumes']
+        cls.plans = data['plans']
+        events = data['events']
+
+        # The logged-in member is seeded through the ORM so the routes see
+        # real memberships and consumed registrations.
+        cls.member = cls._create_member(env, 'perf_member')
+        membership_model = env['popcorn.membership']
+        for plan in cls.plans:
+            membership_model.create({
+                'partner_id': cls.member.partner_id.id,
+                'membership_plan_id': plan.id,
+                'state': 'active',
+                'purchase_channel': 'online',
+                'activation_date': fields.Date.today(),
+            })
+        # A long-time member: hand them a long past history
+        env.cr.execute("""
+            UPDATE event_registration SET partner_id = %s
+             WHERE id IN (SELECT id FROM event_registration
+                           WHERE event_date_end <= now() at time zone 'UTC' AND state = 'done'
+                        ORDER BY id LIMIT %s)
+        """, (cls.member.partner_id.id, max(50, cls.volumes['registrations'] // 400)))
+        env.invalidate_all()
+        cls.upcoming_event = data['launch_event']
+        for event in events.filtered(lambda e: e.date_begin > now)[:20]:
+            env['event.registration'].create({
+                'event_id': event.id,
+                'partner_id': cls.member.partner_id.id,
+                'name': cls.member.name,
+                'email': 'perf_member@example.com',
+            })
+
+    @classmethod
+    def _create_member(cls, env, login):
+        return env['res.users'].with_context(no_reset_password=True).create({
+            'name': 'Perf Member',
+            'login': login,
+            'password': login,
+            'email': '%s@example.com' % login,
+            'groups_id': [(6, 0, [env.ref('base.group_portal').id])],
+        })
+
+    def _measure(self, name, call):
+        """Run `call` twice (cold, then warm) and check the warm run against its budget"""
+        call()
+        # HTTP requests run on a test cursor wrapping self.cr, so its
+        # statement counter covers both the routes and direct ORM calls.
+        cr = self.cr
+        queries_before = cr.sql_log_count
+        started = time.perf_counter()
+        call()
+        wall_ms = (time.perf_counter() - started) * 1000
+        queries = cr.sql_log_count - queries_before
+        self.measured[name] = (queries, wall_ms)
+
+        if self.update_baseline:
+            return
+        budget = self.baseline['routes'].get(name) or {}
+        if budget.get('queries') is None or budget.get('wall_ms') is None:
+            self.fail('No budget recorded for %s (%s queries, %.1f ms); run with POPCORN_PERF_UPDATE=1'
+                      % (name, queries, wall_ms))
+        self.assertLessEqual(
+            queries, budget['queries'],
+            '%s sent %s queries, budget is %s' % (name, queries, budget['queries']))
+        self.assertLessEqual(
+            wall_ms, budget['wall_ms'],
+            '%s took %.1f ms, budget is %s ms' % (name, wall_ms, budget['wall_ms']))
+
+    def _url_call(self, url, login=None):
+        def call():
+            response = self.url_open(url)
+            self.assertEqual(response.status_code, 200, url)
+        if login:
+            self.authenticate(login, login)
+        return call
+
+    def _json_call(self, url, login=None):
+        def call():
+            response = self.url_open(url, data=json.dumps({'jsonrpc': '2.0', 'method': 'call', 'params': {}}),
+                                     headers={'Content-Type': 'application/json'})
+            self.assertEqual(response.status_code, 200, url)
+        if login:
+            self.authenticate(login, login)
+        return call
+
+    def test_events_page(self):
+        self._measure('/event', self._url_call('/event'))
+
+    def test_memberships_page(self):
+        self._measure('/memberships', self._url_call('/memberships'))
+
+    def test_my_clubs(self):
+        self._measure('/my/clubs', self._url_call('/my/clubs', login='perf_member'))
+
+    def test_my_clubs_history_page(self):
+        self._measure('/my/clubs/page/2', self._url_call('/my/clubs/page/2', login='perf_member'))
+
+    def test_my_cards(self):
+        self._measure('/my/cards', self._url_call('/my/cards', login='perf_member'))
+
+    def test_notifications(self):
+        self._measure('/popcorn/notifications/get',
+                      self._json_call('/popcorn/notifications/get', login='perf_member'))
+
+    def test_badges_check_new(self):
+        self.env['ir.config_parameter'].sudo().set_param('popcorn.badges_evaluation_enabled', 'True')
+        self._measure('/popcorn/badges/check-new',
+                      self._url_call('/popcorn/badges/check-new', login='perf_member'))
+
+    def test_registration_create(self):
+        partners = self.env['res.partner'].create([
+            {'name': 'Perf Booker %s' % index, 'email': 'booker%s@example.com' % index} for index in range(2)
+        ])
+        iterator = iter(partners)
+
+        def call():
+            partner = next(iterator)
+            self.env['event.registration'].create({
+                'event_id': self.upcoming_event.id,
+                'partner_id': partner.id,
+                'name': partner.name,
+                'email': partner.email,
+            })
+            self.env.flush_all()
+        self._measure('registration create', call)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Tracing Test - Spans, sampling and the ring buffer
+
+This test runs the popcorn tracing helpers against a stub environment and
+cursor, so no Odoo server or database is needed:
+1. A traced call records duration, query count and row counts
+2. A sample rate of 0 records nothing
+3. Nested spans are traced with their parent and skip the row probes
+4. A failing span is recorded as an error and the exception propagates
+5. The buffer keeps only the most recent spans and aggregates them
+
+Usage:
+    python tests/test_tracing.py
+"""
+
+import importlib.util
+import os
+
+# Load the helpers straight from their file: importing the addon package
+# would pull in Odoo, which this test does not need.
+MODULE_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'popcorn_tracing.py')
+spec = importlib.util.spec_from_file_location('popcorn_tracing', MODULE_PATH)
+tracing = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tracing)
+
+
+class StubCursor:
+    """Counts statements like Odoo's cursor; the row probe returns growing totals."""
+
+    dbname = 'stub'
+
+    def __init__(self):
+        self.sql_log_count = 0
+        self.reads = 0
+        self.writes = 0
+
+    def execute(self, query, params=None):
+        self.sql_log_count += 1
+
+    def fetchone(self):
+        return self.reads, self.writes
+
+    def work(self, queries, reads=0, writes=0):
+        for _ in range(queries):
+            self.execute('SELECT 1')
+        self.reads += reads
+        self.writes += writes
+
+
+class StubParams:
+    def __init__(self, env):
+        self.env = env
+
+    def sudo(self):
+        return self
+
+    def get_param(self, key):
+        return self.env.params.get(key)
+
+
+class StubEnv:
+    uid = 2
+
+    def __init__(self, rate):
+        self.cr = StubCursor()
+        self.params = {tracing.SAMPLE_RATE_PARAM: str(rate)}
+
+    def __getitem__(self, model):
+        return StubParams(self)
+
+
+class StubModel:
+    _name = 'stub.model'
+
+    def __init__(self, env):
+        self.env = env
+
+    def __len__(self):
+        return 1
+
+    @tracing.traced('stub.outer')
+    def outer(self):
+        self.env.cr.work(3, reads=10, writes=2)
+        self.inner()
+
+    @tracing.traced('stub.inner')
+    def inner(self):
+        self.env.cr.work(2, reads=5, writes=1)
+
+    @tracing.traced('stub.fail')
+    def fail(self):
+        self.env.cr.work(1)
+        raise ValueError('boom')
+
+
+def test_span_recorded():
+    tracing.buffer.clear()
+    model = StubModel(StubEnv(1))
+    model.inner()
+    [span] = tracing.buffer.snapshot()
+    assert span['name'] == 'stub.inner', span
+    assert span['queries'] == 2, span
+    assert span['rows_read'] == 5 and span['rows_written'] == 1, span
+    assert span['model'] == 'stub.model' and span['depth'] == 0, span
+    assert not span['error'], span
+
+
+def test_disabled():
+    tracing.buffer.clear()
+    env = StubEnv(0)
+    StubModel(env).outer()
+    assert tracing.buffer.snapshot() == [], 'rate 0 must not record spans'
+    assert env.cr.sql_log_count == 5, 'disabled tracing must not probe the database'
+
+
+def test_nested_spans():
+    tracing.buffer.clear()
+    StubModel(StubEnv(1)).outer()
+    inner, outer = tracing.buffer.snapshot(name='stub.inner')[0], tracing.buffer.snapshot(name='stub.outer')[0]
+    assert inner['depth'] == 1 and outer['depth'] == 0, (inner, outer)
+    # The inner span's own probes are not counted as the outer span's queries
+    assert outer['queries'] == 5, outer
+    assert outer['rows_read'] == 15 and outer['rows_written'] == 3, outer
+
+
+def test_error_span():
+    tracing.buffer.clear()
+    try:
+        StubModel(StubEnv(1)).fail()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('the exception should propagate')
+    [span] = tracing.buffer.snapshot()
+    assert span['error'] and span['rows_read'] is None, span
+
+
+def test_ring_buffer_and_summary():
+    buffer = tracing.SpanBuffer(size=3)
+    for duration in (10, 20, 30, 40):
+        buffer.add({'name': 'x', 'duration_ms': duration, 'queries': 2,
+                    'rows_read': 1, 'rows_written': 0, 'error': False})
+    spans = buffer.snapshot()
+    assert [s['duration_ms'] for s in spans] == [40, 30, 20], spans
+    summary = buffer.summary()['x']
+    assert summary['count'] == 3 and summary['max_ms'] == 40 and summary['avg_ms'] == 30, summary
+
+
+def run_all():
+    tests = [
+        test_span_recorded,
+        test_disabled,
+        test_nested_spans,
+        test_error_span,
+        test_ring_buffer_and_summary,
+    ]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"[OK] {test.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"[FAIL] {test.__name__}: {e}")
+
+    print("\n" + "=" * 80)
+    if failures:
+        print(f"[ERROR] {failures} of {len(tests)} tests failed")
+    else:
+        print(f"[SUCCESS] All {len(tests)} tracing tests passed!")
+    print("=" * 80)
+    return failures
+
+
+if __name__ == '__main__':
+    raise SystemExit(1 if run_all() else 0)
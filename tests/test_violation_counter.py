@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Violation Counter - Monthly attendance violation counters of memberships
+
+Odoo test suite for popcorn.membership.violation.counter: a counter met for
+the first time is seeded from the registration flags, later violations are
+added to it, and a key seeded by a concurrent transaction still gets the
+violations of the transaction that lost the race.
+
+    odoo-bin -d <db> -i popcorn --test-tags /popcorn:TestViolationCounter --stop-after-init
+"""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.popcorn.models.popcorn_membership_violation_counter import PopcornMembershipViolationCounter
+
+
+@tagged('post_install', '-at_install')
+class TestViolationCounter(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Counter = cls.env['popcorn.membership.violation.counter']
+        cls.partner = cls.env['res.partner'].create({'name': 'Late Member', 'email': 'late.member@example.com'})
+        plan = cls.env['popcorn.membership.plan'].create({'name': 'Counter Plan', 'price_normal': 100.0})
+        cls.membership = cls.env['popcorn.membership'].create({
+            'partner_id': cls.partner.id,
+            'membership_plan_id': plan.id,
+            'state': 'active',
+            'purchase_price_paid': 100.0,
+        })
+        begin = fields.Datetime.now() - timedelta(days=1)
+        event = cls.env['event.event'].create({
+            'name': 'Counter Club',
+            'date_begin': begin,
+            'date_end': begin + timedelta(hours=2),
+        })
+        cls.registrations = cls.env['event.registration'].create([{
+            'event_id': event.id,
+            'partner_id': cls.partner.id,
+            'name': 'Late Member %s' % index,
+            'email': 'late.member@example.com',
+        } for index in range(2)])
+        # Flag the registrations directly: the seed only reads the flags
+        cls.env.flush_all()
+        cls.env.cr.execute("""
+            UPDATE event_registration
+               SET membership_id = %s, late_no_show_incident = TRUE, late_no_show_incident_date = %s
+             WHERE id IN %s
+        """, (cls.membership.id, fields.Datetime.now(), tuple(cls.registrations.ids)))
+        cls.env.invalidate_all()
+
+    def test_first_increment_seeds_from_flags(self):
+        counts = self.Counter._increment({self.membership.id: 2}, 'incident')
+        self.assertEqual(counts, {self.membership.id: 2}, 'the seed counts the flags, new ones included')
+        counter = self.Counter.search([('membership_id', '=', self.membership.id), ('policy', '=', 'incident')])
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(counter.month, self.Counter._get_month_start().date())
+
+    def test_increment_adds_to_counter(self):
+        self.Counter._increment({self.membership.id: 2}, 'incident')
+        counts = self.Counter._increment({self.membership.id: 1}, 'incident')
+        self.assertEqual(counts, {self.membership.id: 3})
+        self.assertEqual(self.Counter._get_counts([self.membership.id], 'incident'), {self.membership.id: 3})
+
+    def test_get_counts_seeds_once(self):
+        self.assertEqual(self.Counter._get_counts([self.membership.id], 'incident'), {self.membership.id: 2})
+        self.assertEqual(self.Counter._get_counts([self.membership.id], 'quota'), {self.membership.id: 0})
+        self.assertEqual(
+            self.Counter.search_count([('membership_id', '=', self.membership.id)]), 2,
+            'one counter per policy')
+
+    def test_concurrent_seed_keeps_violation(self):
+        # Another transaction seeded the key from flags that miss the third
+        # violation, after this one's update found no counter.
+        self.Counter._seed({self.membership.id}, 'incident', self.Counter._get_month_start())
+        add = PopcornMembershipViolationCounter._add
+        calls = []
+
+        def add_after_race(counter, deltas, policy, month_start):
+            calls.append(dict(deltas))
+            return {} if len(calls) == 1 else add(counter, deltas, policy, month_start)
+
+        with patch.object(PopcornMembershipViolationCounter, '_add', autospec=True, side_effect=add_after_race):
+            counts = self.Counter._increment({self.membership.id: 1}, 'incident')
+        self.assertEqual(len(calls), 2, 'the update is run again for the key seeded concurrently')
+        self.assertEqual(counts, {self.membership.id: 3})
+        self.assertEqual(self.Counter._get_counts([self.membership.id], 'incident'), {self.membership.id: 3})